@@ -0,0 +1,848 @@
+"""
+Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+
+Permission is hereby granted, free of charge, to any person obtaining a copy of this
+software and associated documentation files (the "Software"), to deal in the Software
+without restriction, including without limitation the rights to use, copy, modify,
+merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+permit persons to whom the Software is furnished to do so.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+
+
+"""Local benchmark of the metric queries, on a generated stream of game events.
+
+Runs the job's metric SQL on a local mini-cluster, reading stream records from an
+NDJSON file (written with the publisher's event generator, or given with --input)
+and writing metrics to a blackhole sink, and reports for each plan:
+
+- events/sec: events read divided by the job's net runtime
+- checkpoint size: the largest checkpoint taken while the job ran, i.e. the
+  operator state the plan keeps
+- window emit latency, with --source datagen, whose events are timestamped as
+  they are generated: how long after its end each query emits each window
+
+--source datagen reads --events random events at up to --rate events per second
+from the job's datagen source, rather than from a file, so that events/sec is
+the plan's sustained throughput when --rate is above it. --per-query also runs
+each query of the shared plan alone, for its own throughput, checkpoint size and
+latency, and --sink filesystem writes the metrics rather than discarding them,
+and counts them. --output-mode wide writes one record per window, application
+and app version. --profiles runs the shared plan with each of the given
+performance profiles.
+
+The "legacy" plan is the job as it was before the metrics shared one windowing
+and deduplication stage: every metric windows the input on its own, and
+TotalEvents and TotalLogins deduplicate it on their own. The "shared" plan is the
+job as it is in main.py, with the default metrics or those declared in --metrics,
+and is run once for each deduplication mode given with --dedup.
+
+--distinct compares the HyperLogLog distinct count of an event_data field, at
+each of --precisions, with an exact COUNT(DISTINCT), for their throughput,
+checkpoint size and errors in 1 minute and 1 hour windows. --players generates
+events from a simulated player population, whose events carry a user_id.
+
+Usage (JAVA_HOME must point at a Java 11 or 17 runtime):
+
+    python benchmark.py --events 200000 --duplicate-rate 0.05
+    python benchmark.py --plans shared --dedup exact bloom window none
+    python benchmark.py --plans --players 100000 --distinct '$.user_id' --precisions 10 12 14
+    python benchmark.py --plans shared --source datagen --rate 5000 --events 1000000 --per-query
+    python benchmark.py --plans shared --profiles default low-latency high-throughput large-state
+"""
+
+import argparse
+import datetime
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+
+from pyflink.table import EnvironmentSettings, TableEnvironment
+
+import main
+from metrics.dedup import DEDUP_MODES, DEFAULT_DEDUP_MODE, DedupConfig
+from metrics.profiles import DEFAULT_PROFILE, PROFILES, ProfileConfig
+from metrics.registry import (
+    DEFAULT_OUTPUT_MODE,
+    JSON_PATH,
+    OUTPUT_MODES,
+    SPEC_FILE_KEY,
+    Metric,
+    compile_insert,
+    compile_metrics,
+    load_metrics,
+    resolution_minutes,
+)
+from metrics.sketches import DEFAULT_PRECISION, hll_relative_error
+
+CURRENT_DIR = os.path.dirname(os.path.realpath(__file__))
+PUBLISHER_DIR = os.path.join(CURRENT_DIR, "..", "..", "resources", "publish-data")
+
+PLANS = ("legacy", "shared")
+SOURCES = ("ndjson", "datagen")
+SINKS = ("blackhole", "filesystem")
+DEFAULT_EVENTS = 200000
+DEFAULT_EVENTS_PER_SECOND = 1000
+DEFAULT_APPLICATIONS = 4
+DEFAULT_SEED = 1
+# 2025-01-01T00:00:00Z, as for the publisher's corpora
+DEFAULT_START_TIME = 1735689600
+GENERATOR_BATCH_SIZE = 100
+CHECKPOINT_INTERVAL = "1 s"
+POLL_INTERVAL = 0.1
+
+
+# Input columns and queries of the legacy plan, as they were before the shared windowing stage
+
+LEGACY_INPUT_TABLE_COLUMNS = """
+    event ROW(
+        `event_version` VARCHAR(8),
+        `event_id` VARCHAR(64),
+        `event_type` VARCHAR(64),
+        `event_name` VARCHAR,
+        `event_timestamp` BIGINT,
+        `app_version` VARCHAR(8),
+        `event_data` STRING
+    ),
+    application_id STRING,
+    rowtime AS TO_TIMESTAMP_LTZ(event.event_timestamp, 0),
+    WATERMARK FOR rowtime AS rowtime - INTERVAL '5' SECOND
+"""
+
+# Total Events
+# Count of Total Events within period
+LEGACY_TOTAL_EVENTS_QUERY = """
+INSERT INTO {0} (
+    METRIC_NAME, 
+    METRIC_TIMESTAMP, 
+    METRIC_UNIT_VALUE_INT, 
+    METRIC_UNIT, 
+    DIMENSION_APPLICATION_ID, 
+    DIMENSION_APP_VERSION, 
+    OUTPUT_TYPE
+) SELECT 
+    'TotalEvents' AS METRIC_NAME,
+    window_start AS METRIC_TIMESTAMP, 
+    COUNT(event_id) AS METRIC_UNIT_VALUE_INT, 
+    'Count' AS METRIC_UNIT,
+    application_id AS DIMENSION_APPLICATION_ID, 
+    app_version AS DIMENSION_APP_VERSION,
+    'metrics' AS OUTPUT_TYPE
+FROM (
+    SELECT
+        window_start,
+        window_end,
+        event.event_id AS event_id,
+        application_id AS application_id,
+        event.app_version AS app_version,
+        ROW_NUMBER() OVER (PARTITION BY window_start, window_end, event.event_id ORDER BY rowtime asc) AS rownum
+    FROM TABLE(TUMBLE(TABLE {1}, DESCRIPTOR(rowtime), INTERVAL '1' MINUTE))
+) AS distinct_stream
+WHERE rownum = 1
+GROUP BY
+    window_start,
+    window_end,
+    application_id,
+    app_version;
+"""
+
+# Total Logins
+# Count of logins within period
+LEGACY_TOTAL_LOGINS_QUERY = """
+INSERT INTO {0} (
+    METRIC_NAME, 
+    METRIC_TIMESTAMP, 
+    METRIC_UNIT_VALUE_INT, 
+    METRIC_UNIT, 
+    DIMENSION_APPLICATION_ID, 
+    DIMENSION_APP_VERSION, 
+    OUTPUT_TYPE
+) SELECT 
+    'TotalLogins' AS METRIC_NAME,
+    window_start AS METRIC_TIMESTAMP, 
+    COUNT(event_id) AS METRIC_UNIT_VALUE_INT, 
+    'Count' AS METRIC_UNIT,
+    application_id AS DIMENSION_APPLICATION_ID, 
+    app_version AS DIMENSION_APP_VERSION,
+    'metrics' AS OUTPUT_TYPE
+FROM (
+    SELECT
+        window_start,
+        window_end,
+        event.event_id AS event_id,
+        application_id AS application_id,
+        event.app_version AS app_version,
+        ROW_NUMBER() OVER (PARTITION BY window_start, window_end, event.event_id ORDER BY rowtime asc) AS rownum
+    FROM TABLE(TUMBLE(TABLE {1}, DESCRIPTOR(rowtime), INTERVAL '1' MINUTE))
+    WHERE event.event_type = 'login'
+) AS distinct_stream
+WHERE rownum = 1
+GROUP BY
+    window_start,
+    window_end,
+    application_id,
+    app_version;
+"""
+
+# Knockouts By Spells
+# Get the number of knockouts by each spell used in a knockout in the period
+LEGACY_KNOCKOUTS_BY_SPELL_QUERY = """
+INSERT INTO {0} (
+    METRIC_NAME, 
+    METRIC_TIMESTAMP, 
+    METRIC_UNIT_VALUE_INT, 
+    METRIC_UNIT, 
+    DIMENSION_SPELL_ID,
+    DIMENSION_APPLICATION_ID, 
+    DIMENSION_APP_VERSION, 
+    OUTPUT_TYPE
+) SELECT 
+    'KnockoutsBySpell' AS METRIC_NAME,
+    window_start AS METRIC_TIMESTAMP,
+    COUNT(*) AS METRIC_UNIT_VALUE_INT,
+    'Count' AS METRIC_UNIT,
+    SPELL_ID AS DIMENSION_SPELL_ID,
+    application_id AS DIMENSION_APPLICATION_ID, 
+    app_version AS DIMENSION_APP_VERSION,
+    'metrics' AS OUTPUT_TYPE
+FROM
+(SELECT
+    window_start,
+    window_end,
+    JSON_VALUE(event.event_data, '$.spell_id' RETURNING STRING NULL ON EMPTY) AS SPELL_ID,
+    application_id AS application_id,
+    event.app_version AS app_version
+FROM TABLE(TUMBLE(TABLE {1}, DESCRIPTOR(rowtime), INTERVAL '1' MINUTE))
+WHERE 
+    event.event_type = 'user_knockout') AS knockout_events
+WHERE SPELL_ID IS NOT NULL
+GROUP BY
+    window_start,
+    window_end,
+    SPELL_ID,
+    application_id,
+    app_version
+HAVING COUNT(*) > 1;
+"""
+
+# Purchases
+# Get all purchases grouped by country over the period
+LEGACY_PURCHASES_PER_CURRENCY_QUERY = """
+INSERT INTO {0} (
+    METRIC_NAME, 
+    METRIC_TIMESTAMP, 
+    METRIC_UNIT_VALUE_INT, 
+    METRIC_UNIT, 
+    DIMENSION_CURRENCY_TYPE,
+    DIMENSION_APPLICATION_ID, 
+    DIMENSION_APP_VERSION, 
+    OUTPUT_TYPE
+) SELECT 
+    'Purchases' AS METRIC_NAME,
+    window_start AS METRIC_TIMESTAMP,
+    COUNT(*) AS METRIC_UNIT_VALUE_INT,
+    'Count' AS METRIC_UNIT,
+    CURRENCY_TYPE AS DIMENSION_CURRENCY_TYPE,
+    application_id AS DIMENSION_APPLICATION_ID, 
+    app_version AS DIMENSION_APP_VERSION,
+    'metrics' AS OUTPUT_TYPE
+FROM
+(SELECT
+    window_start,
+    window_end,
+    JSON_VALUE(event.event_data, '$.currency_type' RETURNING STRING NULL ON EMPTY) AS CURRENCY_TYPE,
+    application_id AS application_id,
+    event.app_version AS app_version
+FROM TABLE(TUMBLE(TABLE {1}, DESCRIPTOR(rowtime), INTERVAL '1' MINUTE))
+WHERE 
+    event.event_type = 'iap_transaction') AS transaction_events
+WHERE CURRENCY_TYPE IS NOT NULL
+GROUP BY
+    window_start,
+    window_end,
+    CURRENCY_TYPE,
+    application_id,
+    app_version
+HAVING COUNT(*) > 1;
+"""
+
+
+LEGACY_QUERIES = [
+    LEGACY_TOTAL_EVENTS_QUERY,
+    LEGACY_TOTAL_LOGINS_QUERY,
+    LEGACY_KNOCKOUTS_BY_SPELL_QUERY,
+    LEGACY_PURCHASES_PER_CURRENCY_QUERY,
+]
+
+
+# Exact distinct count of an event_data field, per application and app version, to check HyperLogLog estimates against
+EXACT_DISTINCT_QUERY = """
+INSERT INTO {0} (
+    METRIC_NAME,
+    METRIC_TIMESTAMP,
+    METRIC_UNIT_VALUE_INT,
+    METRIC_UNIT,
+    METRIC_RESOLUTION,
+    DIMENSION_APPLICATION_ID,
+    DIMENSION_APP_VERSION,
+    OUTPUT_TYPE
+)
+SELECT
+    CAST('{3}' AS STRING) AS METRIC_NAME,
+    window_start AS METRIC_TIMESTAMP,
+    COUNT(DISTINCT event.event_data.{2}) AS METRIC_UNIT_VALUE_INT,
+    CAST('Count' AS STRING) AS METRIC_UNIT,
+    CAST('{4}' AS STRING) AS METRIC_RESOLUTION,
+    application_id AS DIMENSION_APPLICATION_ID,
+    event.app_version AS DIMENSION_APP_VERSION,
+    CAST('metrics' AS STRING) AS OUTPUT_TYPE
+FROM TABLE(TUMBLE(TABLE {1}, DESCRIPTOR(rowtime), INTERVAL '{5}' MINUTE))
+WHERE event.event_data.{2} IS NOT NULL
+GROUP BY window_start, window_end, application_id, event.app_version
+"""
+DISTINCT_METRIC_NAME = "DistinctValues"
+DISTINCT_RESOLUTIONS = ("1m", "1h")
+
+
+# When each window of each query was emitted, to measure how long after the window's end its metrics are written
+WINDOW_EMITS_TABLE_NAME = "window_emits"
+WINDOW_EMITS_TABLE_DEF = """
+CREATE TABLE {0} (
+    QUERY STRING,
+    METRIC_RESOLUTION STRING,
+    METRIC_TIMESTAMP TIMESTAMP_LTZ(3),
+    EMITTED_AT TIMESTAMP_LTZ(3)
+) WITH (
+    'connector' = 'filesystem',
+    'path' = '{1}',
+    'format' = 'json',
+    'json.timestamp-format.standard' = 'ISO-8601'
+);"""
+WINDOW_EMITS_QUERY = """
+INSERT INTO {0}
+SELECT CAST('{1}' AS STRING), METRIC_RESOLUTION, METRIC_TIMESTAMP, CURRENT_TIMESTAMP
+FROM ({2})
+"""
+
+
+def generate_input(path, events, events_per_second, applications, duplicate_rate, seed, players=None):
+    """Write `events` stream records, as the events API puts them on the stream, to `path`.
+
+    With `players`, events come from the publisher's simulated population of that
+    many players, whose events carry their user_id and session_id.
+    """
+
+    sys.path.insert(0, PUBLISHER_DIR)
+    from disorder import DisorderInjector
+    from event_generator import EventGenerator
+    from simulator import PopulationSimulator
+
+    application_ids = [f"benchmark-application-{index}" for index in range(0, applications)]
+    if players:
+        source = PopulationSimulator(application_ids, players=players, seed=seed)
+    else:
+        source = EventGenerator(seed=seed)
+    injector = DisorderInjector(source, duplicate_rate=duplicate_rate, seed=seed)
+    with open(path, "w") as file:
+        for start in range(0, events, GENERATOR_BATCH_SIZE):
+            count = min(GENERATOR_BATCH_SIZE, events - start)
+            now = DEFAULT_START_TIME + start // events_per_second
+            if players:
+                batch = injector.generate_batch(count, now)
+                application_id = batch.application_id
+            else:
+                application_id = application_ids[(start // GENERATOR_BATCH_SIZE) % applications]
+                batch = injector.inject(source.generate_batch(count, now), application_id)
+            for event in batch:
+                file.write(json.dumps({"event": event, "application_id": application_id}) + "\n")
+    return injector.summary()
+
+
+def directory_size(path):
+    size = 0
+    for root, directories, files in os.walk(path):
+        for name in files:
+            try:
+                size += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                # The checkpoint was subsumed while it was being measured
+                pass
+    return size
+
+
+class CheckpointMonitor(threading.Thread):
+    """Records the size of the largest completed checkpoint under a checkpoint directory."""
+
+    def __init__(self, directory):
+        super().__init__(name="checkpoint-monitor", daemon=True)
+        self.directory = directory
+        self.stopped = threading.Event()
+        self.max_size = 0
+        self.checkpoints = set()
+
+    def run(self):
+        while not self.stopped.wait(POLL_INTERVAL):
+            self.measure()
+
+    def measure(self):
+        for root, directories, files in os.walk(self.directory):
+            # A checkpoint is complete once its _metadata file is written
+            if os.path.basename(root).startswith("chk-") and "_metadata" in files:
+                self.checkpoints.add(root)
+                # Incremental checkpoints keep the state files they share with earlier checkpoints apart
+                shared = os.path.join(os.path.dirname(root), "shared")
+                self.max_size = max(self.max_size, directory_size(root) + directory_size(shared))
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+        self.measure()
+
+
+def distinct_metric(path, precision):
+    """Return the HyperLogLog metric of the distinct values of `path` that the exact-distinct plan counts exactly."""
+
+    return Metric(
+        {
+            "name": DISTINCT_METRIC_NAME,
+            "aggregation": "distinct",
+            "field": path,
+            "precision": precision,
+            "resolutions": list(DISTINCT_RESOLUTIONS),
+        }
+    )
+
+
+def read_metrics(path):
+    """Return the values of the metric records written by a filesystem sink under `path`, by resolution and key."""
+
+    values = {}
+    for root, directories, files in os.walk(path):
+        for name in files:
+            if name.startswith("."):
+                continue
+            with open(os.path.join(root, name)) as file:
+                for line in file:
+                    record = json.loads(line)
+                    key = (record["METRIC_TIMESTAMP"], record["DIMENSION_APPLICATION_ID"], record["DIMENSION_APP_VERSION"])
+                    values.setdefault(record["METRIC_RESOLUTION"], {})[key] = record["METRIC_UNIT_VALUE_INT"]
+    return values
+
+
+def count_records(path):
+    """Return the number and bytes of the records written by a filesystem sink under `path`."""
+
+    records = size = 0
+    for root, directories, files in os.walk(path):
+        for name in files:
+            if not name.startswith("."):
+                with open(os.path.join(root, name), "rb") as file:
+                    for line in file:
+                        records += 1
+                        size += len(line)
+    return records, size
+
+
+def parse_timestamp(value):
+    return datetime.datetime.fromisoformat(value.replace("Z", "+00:00"))
+
+
+def read_emit_latencies(path):
+    """Return the seconds from the end of each window to its first emitted record, by query and resolution.
+
+    Windows emitted before their end, when the end of a bounded input flushes
+    every open window, are left out.
+    """
+
+    emitted = {}
+    for root, directories, files in os.walk(path):
+        for name in files:
+            if name.startswith("."):
+                continue
+            with open(os.path.join(root, name)) as file:
+                for line in file:
+                    record = json.loads(line)
+                    key = (record["QUERY"], record["METRIC_RESOLUTION"], record["METRIC_TIMESTAMP"])
+                    emitted_at = parse_timestamp(record["EMITTED_AT"])
+                    emitted[key] = min(emitted_at, emitted.get(key, emitted_at))
+    latencies = {}
+    for (query, resolution, timestamp), emitted_at in emitted.items():
+        window_end = parse_timestamp(timestamp) + datetime.timedelta(minutes=resolution_minutes(resolution, query))
+        latency = (emitted_at - window_end).total_seconds()
+        if latency >= 0:
+            latencies.setdefault((query, resolution), []).append(latency)
+    return latencies
+
+
+def latency_summary(latencies):
+    """Return the median, 99th percentile and largest of a list of latencies."""
+
+    latencies = sorted(latencies)
+    return (
+        latencies[len(latencies) // 2],
+        latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))],
+        latencies[-1],
+    )
+
+
+def distinct_errors(estimates, exact):
+    """Return the mean and largest relative error of the estimates of each resolution, and the windows compared."""
+
+    errors = {}
+    for resolution, counts in exact.items():
+        relative = [abs(estimates.get(resolution, {}).get(key, 0) - count) / count for key, count in counts.items()]
+        errors[resolution] = (sum(relative) / len(relative), max(relative), len(relative))
+    return errors
+
+
+def run_plan(
+    plan,
+    source,
+    work_dir,
+    metrics=None,
+    dedup=None,
+    name=None,
+    distinct_path=None,
+    sink="blackhole",
+    query=None,
+    emit_latency=False,
+    profile=None,
+    output_mode=DEFAULT_OUTPUT_MODE,
+):
+    """Run a plan and return its runtime and checkpoint size.
+
+    `source` is the sourceConfig property group of the input table, see
+    main.create_source_table(). With `distinct_path`, the plan writes its metrics
+    to files, whose values are returned too, rather than discarding them. `query`
+    is the index of the only query of the shared plan to run, rather than all of
+    them, and with `emit_latency` the shared plan's queries also record when they
+    emit each window, whose latencies are returned. `profile` is a ProfileConfig
+    whose options replace the benchmark's checkpointing and state backend, and
+    `output_mode` the shape of the metric records, see main.create_sink_table().
+    """
+
+    table_env = TableEnvironment.create(EnvironmentSettings.in_streaming_mode())
+    config = table_env.get_config()
+    name = name or (plan if dedup is None else f"{plan}/{dedup.mode}")
+    checkpoint_dir = os.path.join(work_dir, "checkpoints-" + name.replace("/", "-"))
+    config.set("parallelism.default", "1")
+    # Fail instead of restarting forever, as jobs with checkpointing do by default
+    config.set("restart-strategy.type", "none")
+    config.set("execution.checkpointing.interval", CHECKPOINT_INTERVAL)
+    config.set("state.backend.type", "hashmap")
+    config.set("state.checkpoints.dir", "file://" + checkpoint_dir)
+    if profile:
+        profile.configure(table_env)
+
+    if plan == "legacy":
+        table_env.execute_sql(
+            "CREATE TABLE {0} ({1}) WITH ('connector' = 'filesystem', 'path' = '{2}', 'format' = 'json')".format(
+                main.INPUT_TABLE_NAME, LEGACY_INPUT_TABLE_COLUMNS, source[main.source_path_key]
+            )
+        )
+    else:
+        main.create_source_table(table_env, source, metrics or load_metrics())
+    output_path = os.path.join(work_dir, "output-" + name.replace("/", "-"))
+    sink_properties = {main.output_mode_key: output_mode}
+    if distinct_path or sink == "filesystem":
+        sink_properties.update({main.sink_connector_key: "filesystem", main.sink_path_key: output_path})
+    else:
+        sink_properties[main.sink_connector_key] = "blackhole"
+    main.create_sink_table(table_env, sink_properties)
+    emits_path = os.path.join(work_dir, "emits-" + name.replace("/", "-")) if emit_latency else None
+    if emits_path:
+        table_env.execute_sql(WINDOW_EMITS_TABLE_DEF.format(WINDOW_EMITS_TABLE_NAME, emits_path))
+    if plan == "exact-distinct":
+        statement_set = table_env.create_statement_set()
+        field = JSON_PATH.match(distinct_path).group("field")
+        for resolution in DISTINCT_RESOLUTIONS:
+            statement_set.add_insert_sql(
+                EXACT_DISTINCT_QUERY.format(
+                    main.OUTPUT_TABLE_NAME,
+                    main.INPUT_TABLE_NAME,
+                    field,
+                    DISTINCT_METRIC_NAME,
+                    resolution,
+                    resolution_minutes(resolution, DISTINCT_METRIC_NAME),
+                )
+            )
+    elif plan == "legacy":
+        statement_set = table_env.create_statement_set()
+        for query in LEGACY_QUERIES:
+            statement_set.add_insert_sql(query.format(main.OUTPUT_TABLE_NAME, main.INPUT_TABLE_NAME))
+    else:
+        dedup = dedup or DedupConfig()
+        metric_plan = compile_metrics(
+            metrics or load_metrics(),
+            main.INPUT_TABLE_NAME,
+            main.OUTPUT_TABLE_NAME,
+            main.EVENTS_VIEW_NAME,
+            dedup,
+            output_mode,
+        )
+        main.create_metric_views(table_env, metric_plan, dedup)
+        statement_set = table_env.create_statement_set()
+        # Wide records gather every query's records, so their INSERTs always run together
+        if output_mode == "wide":
+            for insert in metric_plan.inserts:
+                statement_set.add_insert_sql(insert)
+        for label, columns, select in metric_plan.queries if query is None else [metric_plan.queries[query]]:
+            if output_mode != "wide":
+                statement_set.add_insert_sql(compile_insert(main.OUTPUT_TABLE_NAME, columns, select))
+            if emits_path:
+                statement_set.add_insert_sql(WINDOW_EMITS_QUERY.format(WINDOW_EMITS_TABLE_NAME, label, select))
+
+    monitor = CheckpointMonitor(checkpoint_dir)
+    monitor.start()
+    table_result = statement_set.execute()
+    job_result = table_result.get_job_client().get_job_execution_result().result()
+    monitor.stop()
+    return {
+        "plan": name,
+        "seconds": job_result.get_net_runtime() / 1000,
+        "checkpoints": len(monitor.checkpoints),
+        "checkpoint_bytes": monitor.max_size,
+        "values": read_metrics(output_path) if distinct_path else None,
+        "records": count_records(output_path) if sink == "filesystem" else None,
+        "latencies": read_emit_latencies(emits_path) if emits_path else {},
+    }
+
+
+def plan_queries(metrics, dedup):
+    """Return the labels of the queries of the shared plan, in the order run_plan() indexes them."""
+
+    plan = compile_metrics(
+        metrics or load_metrics(), main.INPUT_TABLE_NAME, main.OUTPUT_TABLE_NAME, main.EVENTS_VIEW_NAME, dedup
+    )
+    return [label for label, columns, select in plan.queries]
+
+
+def parse_cmd_line():
+    parser = argparse.ArgumentParser(description="Benchmark the Flink metric queries on a local mini-cluster")
+    parser.add_argument(
+        "--source",
+        choices=SOURCES,
+        default="ndjson",
+        help="Read generated or --input stream records from an NDJSON file, or random events from the datagen "
+        "connector, timestamped as they are generated, which also measures how long windows take to be emitted",
+    )
+    parser.add_argument("--input", help="NDJSON file of stream records to read instead of generated events")
+    parser.add_argument("--events", type=int, default=DEFAULT_EVENTS, help="Number of events to generate")
+    parser.add_argument(
+        "--rate",
+        type=int,
+        default=main.DEFAULT_DATAGEN_ROWS_PER_SECOND,
+        help="Events per second the datagen source generates, at most",
+    )
+    parser.add_argument(
+        "--sink", choices=SINKS, default="blackhole", help="Discard the metrics, or write them to files"
+    )
+    parser.add_argument(
+        "--output-mode",
+        choices=OUTPUT_MODES,
+        default=DEFAULT_OUTPUT_MODE,
+        help="Write one record per metric and dimensions, or one per window, application and app version",
+    )
+    parser.add_argument(
+        "--events-per-second",
+        type=int,
+        default=DEFAULT_EVENTS_PER_SECOND,
+        help="Event time rate of the generated events, which sets how many events each 1 minute window holds",
+    )
+    parser.add_argument(
+        "--applications", type=int, default=DEFAULT_APPLICATIONS, help="Number of applications to spread events over"
+    )
+    parser.add_argument(
+        "--duplicate-rate", type=float, default=0.0, help="Fraction of generated records that are duplicates"
+    )
+    parser.add_argument("--seed", type=int, default=DEFAULT_SEED, help="Seed of the generated events")
+    parser.add_argument(
+        "--players",
+        type=int,
+        help="Generate events from a simulated population of this many players, whose events carry a user_id",
+    )
+    parser.add_argument(
+        "--distinct",
+        metavar="PATH",
+        help="Also compare HyperLogLog distinct counts of this event_data path, such as $.user_id, with exact counts",
+    )
+    parser.add_argument(
+        "--precisions",
+        nargs="+",
+        type=int,
+        default=[DEFAULT_PRECISION],
+        help="HyperLogLog precisions to compare with --distinct",
+    )
+    parser.add_argument("--metrics", help="JSON file of metric definitions for the shared plan, instead of the defaults")
+    parser.add_argument("--plans", nargs="*", choices=PLANS, default=list(PLANS), help="Plans to run")
+    parser.add_argument(
+        "--dedup",
+        nargs="+",
+        choices=DEDUP_MODES,
+        default=[DEFAULT_DEDUP_MODE],
+        help="Deduplication modes to run the shared plan with",
+    )
+    parser.add_argument(
+        "--profiles",
+        nargs="+",
+        choices=PROFILES,
+        default=[DEFAULT_PROFILE],
+        help="Performance profiles to run the shared plan with",
+    )
+    parser.add_argument(
+        "--per-query",
+        action="store_true",
+        help="Also run each query of the shared plan alone, for its throughput, checkpoint size and latency",
+    )
+    parser.add_argument("--keep", action="store_true", help="Keep the generated input and checkpoints")
+    args = parser.parse_args()
+    if args.source == "datagen" and ("legacy" in args.plans or args.distinct or args.input):
+        parser.error("--source datagen only runs the shared plan: leave out the legacy plan, --distinct and --input")
+    if args.output_mode == "wide" and ("legacy" in args.plans or args.distinct or args.per_query):
+        parser.error(
+            "--output-mode wide only runs the shared plan: leave out the legacy plan, --distinct and --per-query"
+        )
+    return args
+
+
+if __name__ == "__main__":
+    args = parse_cmd_line()
+    work_dir = tempfile.mkdtemp(prefix="flink-benchmark-")
+    try:
+        if args.source == "datagen":
+            input_path = None
+            events = args.events
+            source = {
+                main.source_connector_key: "datagen",
+                main.datagen_rows_per_second_key: args.rate,
+                main.datagen_number_of_rows_key: args.events,
+                main.datagen_applications_key: args.applications,
+            }
+        elif args.input:
+            input_path = os.path.abspath(args.input)
+            with open(input_path) as file:
+                events = sum(1 for line in file)
+        else:
+            input_path = os.path.join(work_dir, "input", "events.ndjson")
+            os.makedirs(os.path.dirname(input_path))
+            summary = generate_input(
+                input_path,
+                args.events,
+                args.events_per_second,
+                args.applications,
+                args.duplicate_rate,
+                args.seed,
+                args.players,
+            )
+            events = args.events
+            print(f"Generated {events:,} records, {summary['duplicates']:,} of them duplicates")
+        if input_path:
+            source = {main.source_connector_key: "filesystem", main.source_path_key: input_path}
+        emit_latency = args.source == "datagen"
+
+        metrics = load_metrics({SPEC_FILE_KEY: args.metrics}) if args.metrics else None
+        results = []
+        for plan in args.plans:
+            runs = [(None, None)]
+            if plan == "shared":
+                runs = [(mode, profile_name) for mode in args.dedup for profile_name in args.profiles]
+            for mode, profile_name in runs:
+                dedup = DedupConfig(mode) if mode else None
+                profile = ProfileConfig(profile_name) if profile_name else None
+                # The profile is only named when several are compared
+                run_name = plan if mode is None else f"{plan}/{mode}"
+                if profile_name and len(args.profiles) > 1:
+                    run_name += f"/{profile_name}"
+                print(
+                    f"Running the {plan} plan"
+                    + (f" with {mode} deduplication" if mode else "")
+                    + (f" and the {profile_name} profile" if profile_name else "")
+                )
+                results.append(
+                    run_plan(
+                        plan,
+                        source,
+                        work_dir,
+                        metrics,
+                        dedup,
+                        name=run_name,
+                        sink=args.sink,
+                        emit_latency=emit_latency,
+                        profile=profile,
+                        output_mode=args.output_mode,
+                    )
+                )
+                if plan != "shared" or not args.per_query:
+                    continue
+                for index, label in enumerate(plan_queries(metrics, dedup)):
+                    print(f"Running the {plan} plan's {label} query alone")
+                    result = run_plan(
+                        plan,
+                        source,
+                        work_dir,
+                        metrics,
+                        dedup,
+                        name=f"{run_name}-query-{index}",
+                        sink=args.sink,
+                        query=index,
+                        emit_latency=emit_latency,
+                        profile=profile,
+                    )
+                    result["query"] = label
+                    results.append(result)
+        if args.distinct:
+            print(f"Counting the distinct values of {args.distinct} exactly")
+            exact = run_plan("exact-distinct", source, work_dir, distinct_path=args.distinct)
+            results.append(exact)
+            for precision in args.precisions:
+                print(f"Estimating the distinct values of {args.distinct} with precision {precision}")
+                result = run_plan(
+                    "shared",
+                    source,
+                    work_dir,
+                    [distinct_metric(args.distinct, precision)],
+                    DedupConfig("none"),
+                    name=f"hll-p{precision}",
+                    distinct_path=args.distinct,
+                )
+                result["errors"] = distinct_errors(result["values"], exact["values"])
+                result["expected_error"] = hll_relative_error(precision)
+                results.append(result)
+
+        print("===========================================")
+        print(f"BENCHMARK ({events:,} records):")
+        for result in results:
+            print(
+                f"- {result['plan'].upper()}"
+                + (f" ({result['query']} alone)" if "query" in result else "")
+                + f": {result['seconds']:.1f}s, {events / result['seconds']:,.0f} events/sec, "
+                f"largest of {result['checkpoints']} checkpoints {result['checkpoint_bytes']:,} bytes"
+            )
+            if result["records"]:
+                print(f"  {result['records'][0]:,} metric records written, {result['records'][1]:,} bytes")
+            for resolution, (mean, largest, windows) in sorted(result.get("errors", {}).items()):
+                print(
+                    f"  {resolution}: mean error {mean:.2%}, largest {largest:.2%} over {windows:,} windows "
+                    f"(standard error {result['expected_error']:.2%})"
+                )
+            for (query, resolution), latencies in sorted(result["latencies"].items()):
+                median, p99, largest = latency_summary(latencies)
+                print(
+                    f"  {query}: {resolution} windows emitted {median:.1f}s after their end, "
+                    f"p99 {p99:.1f}s, largest {largest:.1f}s over {len(latencies):,} windows"
+                )
+        print("===========================================")
+    finally:
+        if args.keep:
+            print(f"Input and checkpoints kept in {work_dir}")
+        else:
+            shutil.rmtree(work_dir, ignore_errors=True)
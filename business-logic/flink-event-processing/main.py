@@ -19,6 +19,33 @@ from pyflink.table import EnvironmentSettings, TableEnvironment
 import os
 import json
 
+from metrics.dedup import DedupConfig
+from metrics.profiles import ProfileConfig
+from metrics.registry import (
+    DEFAULT_OUTPUT_MODE,
+    DEFAULT_WIDE_MAX_METRICS,
+    EVENT_DATA_FIELDS,
+    OUTPUT_MODES,
+    compile_metrics,
+    event_data_row,
+    load_metrics,
+    wide_metrics_type,
+)
+from metrics.sketches import QUANTILES_TYPE, SUMMARY_TYPE, register_functions
+
+APPLICATION_PROPERTIES_FILE_PATH = "/etc/flink/application_properties.json"  # on kda
+
+# set this env var in your local environment
+is_local = True if os.environ.get("IS_LOCAL") else False
+
+if is_local:
+    # only for local, overwrite variable to properties and pass in your jars delimited by a semicolon (;)
+    APPLICATION_PROPERTIES_FILE_PATH = "application_properties.json"  # local
+
+CURRENT_DIR = os.path.dirname(os.path.realpath(__file__))
+LOCAL_JARS = "file:///" + CURRENT_DIR + "/lib/flink-sql-connector-kinesis-5.0.0-1.20.jar"
+
+
 # Utility Functions
 def get_application_properties():
     if os.path.isfile(APPLICATION_PROPERTIES_FILE_PATH):
@@ -36,29 +63,20 @@ def property_map(props, property_group_id):
             return prop["PropertyMap"]
 
 
-# Create a Table Environment
-env_settings = EnvironmentSettings.in_streaming_mode()
-table_env = TableEnvironment.create(env_settings)
-
-APPLICATION_PROPERTIES_FILE_PATH = "/etc/flink/application_properties.json"  # on kda
-
-# set this env var in your local environment
-is_local = True if os.environ.get("IS_LOCAL") else False
-
-if is_local:
-    # only for local, overwrite variable to properties and pass in your jars delimited by a semicolon (;)
-    APPLICATION_PROPERTIES_FILE_PATH = "application_properties.json"  # local
-
-    CURRENT_DIR = os.path.dirname(os.path.realpath(__file__))
-    table_env.get_config().get_configuration().set_string(
-        "pipeline.jars",
-        "file:///" + CURRENT_DIR + "/lib/flink-sql-connector-kinesis-5.0.0-1.20.jar",
-    )
+def create_table_environment():
+    env_settings = EnvironmentSettings.in_streaming_mode()
+    table_env = TableEnvironment.create(env_settings)
+    if is_local:
+        table_env.get_config().get_configuration().set_string("pipeline.jars", LOCAL_JARS)
+    return table_env
 
 
 # Application Property Keys
 input_property_group_key = "sourceConfig"
 producer_property_group_key = "sinkConfig"
+metrics_property_group_key = "metricsConfig"
+dedup_property_group_key = "dedupConfig"
+profile_property_group_key = "profileConfig"
 
 input_stream_key = "kinesis.stream.arn"
 input_region_key = "aws.region"
@@ -73,47 +91,64 @@ input_stream_interval_key = "kinesis.stream.interval"
 output_stream_key = "kinesis.stream.arn"
 output_region_key = "aws.region"
 
+# Shape of the metric records, see OUTPUT_MODES, the most metrics a wide record holds, and Kinesis
+# batching: records per PutRecords call, and milliseconds a record waits for its batch to fill
+output_mode_key = "sink.output.mode"
+output_wide_max_metrics_key = "sink.wide.max-metrics"
+output_batch_size_key = "sink.batch.max-size"
+output_linger_key = "sink.flush-buffer.timeout"
+DEFAULT_OUTPUT_BATCH_SIZE = 100
+DEFAULT_OUTPUT_LINGER_MILLIS = 5000
+# PutRecords takes up to 500 records
+MAX_OUTPUT_BATCH_SIZE = 500
+
+# Connectors other than Kinesis, for running the job offline
+source_connector_key = "source.connector"
+source_path_key = "path"
+datagen_rows_per_second_key = "datagen.rows-per-second"
+datagen_number_of_rows_key = "datagen.number-of-rows"
+datagen_applications_key = "datagen.applications"
+datagen_values_key = "datagen.values"
+sink_connector_key = "sink.connector"
+sink_path_key = "path"
+SOURCE_CONNECTORS = ("kinesis", "filesystem", "datagen")
+SINK_CONNECTORS = ("kinesis", "filesystem", "blackhole")
+DEFAULT_DATAGEN_ROWS_PER_SECOND = 1000
+DEFAULT_DATAGEN_APPLICATIONS = 4
+# Distinct values of each event_data field
+DEFAULT_DATAGEN_VALUES = 100
+
 # tables
 INPUT_TABLE_NAME = "input_table"
 OUTPUT_TABLE_NAME = "output_table"
-
-# get application properties
-props = get_application_properties()
-
-input_property_map = property_map(props, input_property_group_key)
-output_property_map = property_map(props, producer_property_group_key)
-
-input_stream = input_property_map[input_stream_key]
-input_region = input_property_map[input_region_key]
-stream_initpos = input_property_map[input_starting_position_key]
-source_record_count = input_property_map[source_record_count_key]
-
-# legacy options
-input_stream_name = input_property_map[input_stream_name_key]
-input_stream_interval = input_property_map[input_stream_interval_key]
-
-
-output_stream = output_property_map[output_stream_key]
-output_region = output_property_map[output_region_key]
+# Deduplicated events that every metric aggregates, see metrics/registry.py
+EVENTS_VIEW_NAME = "deduplicated_events"
 
 # DDL
 
-# Flink Kinesis adapter 5.0.0-1.20 settings
-_SOURCE_TABLE_DEF = """
-CREATE TABLE {0} (
-    event ROW(
+# Type of the events on the stream.
+# event_data is parsed by the JSON format into the fields metrics read, see EVENT_DATA_FIELDS
+EVENT_ROW = """ROW(
         `event_version` VARCHAR(8),
         `event_id` VARCHAR(64),
         `event_type` VARCHAR(64),
         `event_name` VARCHAR,
         `event_timestamp` BIGINT,
         `app_version` VARCHAR(8),
-        `event_data` STRING
-    ),
+        `event_data` """ + event_data_row() + """
+    )"""
+
+# Columns of the input stream records, shared by every source connector
+INPUT_TABLE_COLUMNS = """
+    event """ + EVENT_ROW + """,
     application_id STRING,
     rowtime AS TO_TIMESTAMP_LTZ(event.event_timestamp, 0),
     WATERMARK FOR rowtime AS rowtime - INTERVAL '5' SECOND
-) WITH (
+"""
+
+# Flink Kinesis adapter 5.0.0-1.20 settings
+_SOURCE_TABLE_DEF = """
+CREATE TABLE {0} (""" + INPUT_TABLE_COLUMNS + """) WITH (
     'connector' = 'kinesis',
     'stream.arn' = '{1}',
     'aws.region' = '{2}',
@@ -121,24 +156,11 @@ CREATE TABLE {0} (
     'format' = 'json',
     'json.timestamp-format.standard' = 'ISO-8601',
     'source.shard.get-records.max-record-count' = '{4}'
-);""".format(INPUT_TABLE_NAME, input_stream, input_region, stream_initpos, source_record_count)
+);"""
 
 # Flink Kinesis legacy adapter settings (currently used for read throttling controls)
 SOURCE_TABLE_DEF = """
-CREATE TABLE {0} (
-    event ROW(
-        `event_version` VARCHAR(8),
-        `event_id` VARCHAR(64),
-        `event_type` VARCHAR(64),
-        `event_name` VARCHAR,
-        `event_timestamp` BIGINT,
-        `app_version` VARCHAR(8),
-        `event_data` STRING
-    ),
-    application_id STRING,
-    rowtime AS TO_TIMESTAMP_LTZ(event.event_timestamp, 0),
-    WATERMARK FOR rowtime AS rowtime - INTERVAL '5' SECOND
-) WITH (
+CREATE TABLE {0} (""" + INPUT_TABLE_COLUMNS + """) WITH (
     'connector' = 'kinesis-legacy',
     'stream' = '{1}',
     'aws.region' = '{2}',
@@ -147,15 +169,60 @@ CREATE TABLE {0} (
     'json.timestamp-format.standard' = 'ISO-8601',
     'scan.shard.adaptivereads' = 'true',
     'scan.shard.getrecords.intervalmillis' = '{4}'
-);""".format(INPUT_TABLE_NAME, input_stream_name, input_region, stream_initpos, input_stream_interval)
+);"""
 
+# Stream records read from NDJSON files, such as the publisher's corpora, for running the job offline
+FILESYSTEM_SOURCE_TABLE_DEF = """
+CREATE TABLE {0} (""" + INPUT_TABLE_COLUMNS + """) WITH (
+    'connector' = 'filesystem',
+    'path' = '{1}',
+    'format' = 'json',
+    'json.timestamp-format.standard' = 'ISO-8601'
+);"""
 
-SINK_TABLE_DEF = """
+# Random events timestamped as they are generated, for running the job offline in real time.
+# The generated columns are turned into stream records by DATAGEN_VIEW_DEF
+DATAGEN_TABLE_DEF = """
 CREATE TABLE {0} (
+    event_number BIGINT,
+    event_type_index INT,
+    application_index INT,
+{1},
+    rowtime AS TO_TIMESTAMP_LTZ(UNIX_TIMESTAMP(), 0),
+    WATERMARK FOR rowtime AS rowtime - INTERVAL '5' SECOND
+) WITH (
+    'connector' = 'datagen',
+    'rows-per-second' = '{2}',{3}
+    'fields.event_type_index.min' = '1',
+    'fields.event_type_index.max' = '{4}',
+    'fields.application_index.min' = '1',
+    'fields.application_index.max' = '{5}',
+{6}
+);"""
+
+DATAGEN_VIEW_DEF = """
+CREATE TEMPORARY VIEW {0} AS
+SELECT
+    CAST(ROW(
+        '1.0.0',
+        CAST(event_number AS STRING),
+        {2},
+        {2},
+        UNIX_TIMESTAMP(),
+        '1.0.0',
+        ROW({3})
+    ) AS """ + EVENT_ROW + """) AS event,
+    'datagen-application-' || CAST(application_index AS STRING) AS application_id,
+    rowtime
+FROM {1};"""
+
+# Columns of the metric records, shared by every sink connector
+OUTPUT_TABLE_COLUMNS = """
     METRIC_NAME STRING,
     METRIC_TIMESTAMP TIMESTAMP_LTZ(3),
     METRIC_UNIT_VALUE_INT BIGINT,
     METRIC_UNIT STRING,
+    METRIC_RESOLUTION STRING,
     DIMENSION_APPLICATION_ID STRING,
     DIMENSION_APP_VERSION STRING,
     DIMENSION_COUNTRY_ID STRING,
@@ -163,194 +230,234 @@ CREATE TABLE {0} (
     DIMENSION_SPELL_ID STRING,
     DIMENSION_MISSION_ID STRING,
     DIMENSION_ITEM_ID STRING,
+    DIMENSION_SERVER_ID STRING,
+    DIMENSION_REGION STRING,
     OUTPUT_TYPE STRING,
+    METRIC_TOP_VALUES """ + SUMMARY_TYPE + """,
+    METRIC_QUANTILES """ + QUANTILES_TYPE + """,
     WATERMARK FOR METRIC_TIMESTAMP AS METRIC_TIMESTAMP - INTERVAL '5' SECOND
-)
-PARTITIONED BY (METRIC_NAME)
+"""
+
+# Columns of the wide metric records: every metric of a window, application and app version, without their null columns
+WIDE_OUTPUT_TABLE_COLUMNS = """
+    METRIC_TIMESTAMP TIMESTAMP_LTZ(3),
+    METRIC_RESOLUTION STRING,
+    DIMENSION_APPLICATION_ID STRING,
+    DIMENSION_APP_VERSION STRING,
+    OUTPUT_TYPE STRING,
+    METRICS """ + wide_metrics_type() + """,
+    WATERMARK FOR METRIC_TIMESTAMP AS METRIC_TIMESTAMP - INTERVAL '5' SECOND
+"""
+
+# Columns and Kinesis partition key of each output mode
+OUTPUT_TABLE_SHAPES = {
+    "narrow": (OUTPUT_TABLE_COLUMNS, "METRIC_NAME"),
+    "wide": (WIDE_OUTPUT_TABLE_COLUMNS, "DIMENSION_APPLICATION_ID"),
+}
+
+SINK_TABLE_DEF = """
+CREATE TABLE {0} ({1})
+PARTITIONED BY ({2})
 WITH (
     'connector' = 'kinesis',
-    'stream.arn' = '{1}',
-    'aws.region' = '{2}',
+    'stream.arn' = '{3}',
+    'aws.region' = '{4}',
     'sink.partitioner-field-delimiter' = ';',
-    'sink.batch.max-size' = '100',
+    'sink.batch.max-size' = '{5}',
+    'sink.flush-buffer.timeout' = '{6}',
     'format' = 'json',
-    'json.timestamp-format.standard' = 'ISO-8601'
-);""".format(OUTPUT_TABLE_NAME, output_stream, output_region)
-
-
-# Queries
-
-# Total Events
-# Count of Total Events within period
-TOTAL_EVENTS_QUERY = """
-INSERT INTO {0} (
-    METRIC_NAME, 
-    METRIC_TIMESTAMP, 
-    METRIC_UNIT_VALUE_INT, 
-    METRIC_UNIT, 
-    DIMENSION_APPLICATION_ID, 
-    DIMENSION_APP_VERSION, 
-    OUTPUT_TYPE
-) SELECT 
-    'TotalEvents' AS METRIC_NAME,
-    window_start AS METRIC_TIMESTAMP, 
-    COUNT(event_id) AS METRIC_UNIT_VALUE_INT, 
-    'Count' AS METRIC_UNIT,
-    application_id AS DIMENSION_APPLICATION_ID, 
-    app_version AS DIMENSION_APP_VERSION,
-    'metrics' AS OUTPUT_TYPE
-FROM (
-    SELECT
-        window_start,
-        window_end,
-        event.event_id AS event_id,
-        application_id AS application_id,
-        event.app_version AS app_version,
-        ROW_NUMBER() OVER (PARTITION BY window_start, window_end, event.event_id ORDER BY rowtime asc) AS rownum
-    FROM TABLE(TUMBLE(TABLE {1}, DESCRIPTOR(rowtime), INTERVAL '1' MINUTE))
-) AS distinct_stream
-WHERE rownum = 1
-GROUP BY
-    window_start,
-    window_end,
-    application_id,
-    app_version;
-""".format(OUTPUT_TABLE_NAME, INPUT_TABLE_NAME)
-
-# Total Logins
-# Count of logins within period
-TOTAL_LOGINS_QUERY = """
-INSERT INTO {0} (
-    METRIC_NAME, 
-    METRIC_TIMESTAMP, 
-    METRIC_UNIT_VALUE_INT, 
-    METRIC_UNIT, 
-    DIMENSION_APPLICATION_ID, 
-    DIMENSION_APP_VERSION, 
-    OUTPUT_TYPE
-) SELECT 
-    'TotalLogins' AS METRIC_NAME,
-    window_start AS METRIC_TIMESTAMP, 
-    COUNT(event_id) AS METRIC_UNIT_VALUE_INT, 
-    'Count' AS METRIC_UNIT,
-    application_id AS DIMENSION_APPLICATION_ID, 
-    app_version AS DIMENSION_APP_VERSION,
-    'metrics' AS OUTPUT_TYPE
-FROM (
-    SELECT
-        window_start,
-        window_end,
-        event.event_id AS event_id,
-        application_id AS application_id,
-        event.app_version AS app_version,
-        ROW_NUMBER() OVER (PARTITION BY window_start, window_end, event.event_id ORDER BY rowtime asc) AS rownum
-    FROM TABLE(TUMBLE(TABLE {1}, DESCRIPTOR(rowtime), INTERVAL '1' MINUTE))
-    WHERE event.event_type = 'login'
-) AS distinct_stream
-WHERE rownum = 1
-GROUP BY
-    window_start,
-    window_end,
-    application_id,
-    app_version;
-""".format(OUTPUT_TABLE_NAME, INPUT_TABLE_NAME)
-
-# Knockouts By Spells
-# Get the number of knockouts by each spell used in a knockout in the period
-KNOCKOUTS_BY_SPELL_QUERY = """
-INSERT INTO {0} (
-    METRIC_NAME, 
-    METRIC_TIMESTAMP, 
-    METRIC_UNIT_VALUE_INT, 
-    METRIC_UNIT, 
-    DIMENSION_SPELL_ID,
-    DIMENSION_APPLICATION_ID, 
-    DIMENSION_APP_VERSION, 
-    OUTPUT_TYPE
-) SELECT 
-    'KnockoutsBySpell' AS METRIC_NAME,
-    window_start AS METRIC_TIMESTAMP,
-    COUNT(*) AS METRIC_UNIT_VALUE_INT,
-    'Count' AS METRIC_UNIT,
-    SPELL_ID AS DIMENSION_SPELL_ID,
-    application_id AS DIMENSION_APPLICATION_ID, 
-    app_version AS DIMENSION_APP_VERSION,
-    'metrics' AS OUTPUT_TYPE
-FROM
-(SELECT
-    window_start,
-    window_end,
-    JSON_VALUE(event.event_data, '$.spell_id' RETURNING STRING NULL ON EMPTY) AS SPELL_ID,
-    application_id AS application_id,
-    event.app_version AS app_version
-FROM TABLE(TUMBLE(TABLE {1}, DESCRIPTOR(rowtime), INTERVAL '1' MINUTE))
-WHERE 
-    event.event_type = 'user_knockout') AS knockout_events
-WHERE SPELL_ID IS NOT NULL
-GROUP BY
-    window_start,
-    window_end,
-    SPELL_ID,
-    application_id,
-    app_version
-HAVING COUNT(*) > 1;
-""".format(OUTPUT_TABLE_NAME, INPUT_TABLE_NAME)
-
-# Purchases
-# Get all purchases grouped by country over the period
-PURCHASES_PER_CURRENCY_QUERY = """
-INSERT INTO {0} (
-    METRIC_NAME, 
-    METRIC_TIMESTAMP, 
-    METRIC_UNIT_VALUE_INT, 
-    METRIC_UNIT, 
-    DIMENSION_CURRENCY_TYPE,
-    DIMENSION_APPLICATION_ID, 
-    DIMENSION_APP_VERSION, 
-    OUTPUT_TYPE
-) SELECT 
-    'Purchases' AS METRIC_NAME,
-    window_start AS METRIC_TIMESTAMP,
-    COUNT(*) AS METRIC_UNIT_VALUE_INT,
-    'Count' AS METRIC_UNIT,
-    CURRENCY_TYPE AS DIMENSION_CURRENCY_TYPE,
-    application_id AS DIMENSION_APPLICATION_ID, 
-    app_version AS DIMENSION_APP_VERSION,
-    'metrics' AS OUTPUT_TYPE
-FROM
-(SELECT
-    window_start,
-    window_end,
-    JSON_VALUE(event.event_data, '$.currency_type' RETURNING STRING NULL ON EMPTY) AS CURRENCY_TYPE,
-    application_id AS application_id,
-    event.app_version AS app_version
-FROM TABLE(TUMBLE(TABLE {1}, DESCRIPTOR(rowtime), INTERVAL '1' MINUTE))
-WHERE 
-    event.event_type = 'iap_transaction') AS transaction_events
-WHERE CURRENCY_TYPE IS NOT NULL
-GROUP BY
-    window_start,
-    window_end,
-    CURRENCY_TYPE,
-    application_id,
-    app_version
-HAVING COUNT(*) > 1;
-""".format(OUTPUT_TABLE_NAME, INPUT_TABLE_NAME)
+    'json.timestamp-format.standard' = 'ISO-8601',
+    'json.encode.ignore-null-fields' = '{7}'
+);"""
+
+FILESYSTEM_SINK_TABLE_DEF = """
+CREATE TABLE {0} ({1}) WITH (
+    'connector' = 'filesystem',
+    'path' = '{2}',
+    'format' = 'json',
+    'json.timestamp-format.standard' = 'ISO-8601',
+    'json.encode.ignore-null-fields' = '{3}'
+);"""
+
+# Discards the metric records, for measuring the job alone
+BLACKHOLE_SINK_TABLE_DEF = """
+CREATE TABLE {0} ({1}) WITH (
+    'connector' = 'blackhole'
+);"""
+
+
+def create_source_table(table_env, input_property_map, metrics):
+    """Create the input table with the connector of the sourceConfig property group.
+
+    datagen events are of the event types that `metrics` count, and of one
+    other event type, so that every metric counts some of them.
+    """
+
+    connector = input_property_map.get(source_connector_key, "kinesis")
+    if connector == "kinesis":
+        table_env.execute_sql(
+            SOURCE_TABLE_DEF.format(
+                INPUT_TABLE_NAME,
+                input_property_map[input_stream_name_key],
+                input_property_map[input_region_key],
+                input_property_map[input_starting_position_key],
+                input_property_map[input_stream_interval_key],
+            )
+        )
+    elif connector == "filesystem":
+        table_env.execute_sql(FILESYSTEM_SOURCE_TABLE_DEF.format(INPUT_TABLE_NAME, input_property_map[source_path_key]))
+    elif connector == "datagen":
+        event_types = sorted({t for metric in metrics for t in metric.event_types or ()}) + ["datagen_event"]
+        values = int(input_property_map.get(datagen_values_key, DEFAULT_DATAGEN_VALUES))
+        number_of_rows = input_property_map.get(datagen_number_of_rows_key)
+        datagen_table = INPUT_TABLE_NAME + "_datagen"
+        table_env.execute_sql(
+            DATAGEN_TABLE_DEF.format(
+                datagen_table,
+                ",\n".join(f"    data_{field} INT" for field in EVENT_DATA_FIELDS),
+                input_property_map.get(datagen_rows_per_second_key, DEFAULT_DATAGEN_ROWS_PER_SECOND),
+                f"\n    'number-of-rows' = '{number_of_rows}'," if number_of_rows else "",
+                len(event_types),
+                input_property_map.get(datagen_applications_key, DEFAULT_DATAGEN_APPLICATIONS),
+                ",\n".join(
+                    f"    'fields.data_{field}.min' = '1',\n    'fields.data_{field}.max' = '{values}'"
+                    for field in EVENT_DATA_FIELDS
+                ),
+            )
+        )
+        table_env.execute_sql(
+            DATAGEN_VIEW_DEF.format(
+                INPUT_TABLE_NAME,
+                datagen_table,
+                "ARRAY[" + ", ".join(f"'{event_type}'" for event_type in event_types) + "][event_type_index]",
+                ", ".join(f"CAST(data_{field} AS STRING)" for field in EVENT_DATA_FIELDS),
+            )
+        )
+    else:
+        raise ValueError(f"Unknown source connector {connector}, expected one of {SOURCE_CONNECTORS}")
+
+
+def output_mode(output_property_map):
+    """Return the validated output mode of the sinkConfig property group."""
+
+    mode = output_property_map.get(output_mode_key, DEFAULT_OUTPUT_MODE)
+    if mode not in OUTPUT_MODES:
+        raise ValueError(f"Unknown {output_mode_key} {mode}, expected one of {OUTPUT_MODES}")
+    return mode
+
+
+def wide_max_metrics(output_property_map):
+    """Return the validated number of metrics a wide record of the sinkConfig property group holds at most."""
+
+    max_metrics = int(output_property_map.get(output_wide_max_metrics_key, DEFAULT_WIDE_MAX_METRICS))
+    if max_metrics < 1:
+        raise ValueError(f"{output_wide_max_metrics_key} must be at least 1")
+    return max_metrics
+
+
+def create_sink_table(table_env, output_property_map):
+    """Create the output table with the connector and output mode of the sinkConfig property group."""
+
+    mode = output_mode(output_property_map)
+    columns, partition_key = OUTPUT_TABLE_SHAPES[mode]
+    # Wide records leave out the columns of the other metrics' dimensions and aggregations
+    ignore_null_fields = "true" if mode == "wide" else "false"
+    connector = output_property_map.get(sink_connector_key, "kinesis")
+    if connector == "kinesis":
+        batch_size = int(output_property_map.get(output_batch_size_key, DEFAULT_OUTPUT_BATCH_SIZE))
+        linger = int(output_property_map.get(output_linger_key, DEFAULT_OUTPUT_LINGER_MILLIS))
+        if not 0 < batch_size <= MAX_OUTPUT_BATCH_SIZE or linger < 0:
+            raise ValueError(
+                f"{output_batch_size_key} must be between 1 and {MAX_OUTPUT_BATCH_SIZE}, "
+                f"and {output_linger_key} positive or 0"
+            )
+        table_env.execute_sql(
+            SINK_TABLE_DEF.format(
+                OUTPUT_TABLE_NAME,
+                columns,
+                partition_key,
+                output_property_map[output_stream_key],
+                output_property_map[output_region_key],
+                batch_size,
+                linger,
+                ignore_null_fields,
+            )
+        )
+    elif connector == "filesystem":
+        table_env.execute_sql(
+            FILESYSTEM_SINK_TABLE_DEF.format(
+                OUTPUT_TABLE_NAME, columns, output_property_map[sink_path_key], ignore_null_fields
+            )
+        )
+    elif connector == "blackhole":
+        table_env.execute_sql(BLACKHOLE_SINK_TABLE_DEF.format(OUTPUT_TABLE_NAME, columns))
+    else:
+        raise ValueError(f"Unknown sink connector {connector}, expected one of {SINK_CONNECTORS}")
+
+
+def create_metric_views(table_env, plan, dedup):
+    """Create the views of a MetricPlan, and the functions and settings they need."""
+
+    print("Metric plan: " + plan.describe())
+    print("Deduplication: " + dedup.describe())
+    dedup.configure(table_env)
+    register_functions(table_env, plan.functions)
+
+    # Each reference to a view is expanded separately, so without this the planner only
+    # recognizes the shared stage below the first projection that differs per metric
+    table_env.get_config().set("table.optimizer.reuse-optimize-block-with-digest-enabled", "true")
+    for view in plan.views:
+        table_env.execute_sql(view)
+
+
+def create_metrics_statement_set(
+    table_env, metrics=None, dedup=None, mode=DEFAULT_OUTPUT_MODE, max_metrics=DEFAULT_WIDE_MAX_METRICS
+):
+    """Create the metric views and return a statement set with the metrics' INSERTs.
+
+    `metrics` defaults to the metrics in DEFAULT_METRICS, and `dedup` to exact
+    deduplication. The input and output tables must already exist, the output
+    table in the output `mode`, whose wide records hold up to `max_metrics`.
+    """
+
+    dedup = dedup or DedupConfig()
+    plan = compile_metrics(
+        metrics or load_metrics(), INPUT_TABLE_NAME, OUTPUT_TABLE_NAME, EVENTS_VIEW_NAME, dedup, mode, max_metrics
+    )
+    create_metric_views(table_env, plan, dedup)
 
-if __name__ == "__main__":
-    # Create tables inside Flink
-    table_env.execute_sql(SOURCE_TABLE_DEF)
-    table_env.execute_sql(SINK_TABLE_DEF)
-    print("Tables created")
-    
     # Create statement set to execute multiple queries at once
     statement_set = table_env.create_statement_set()
+    for insert in plan.inserts:
+        statement_set.add_insert_sql(insert)
+    return statement_set
+
+
+def main():
+    table_env = create_table_environment()
+
+    # get application properties
+    props = get_application_properties()
+
+    input_property_map = property_map(props, input_property_group_key)
+    output_property_map = property_map(props, producer_property_group_key)
+    # Metric definitions, optional: the default metrics are used without them
+    metrics = load_metrics(property_map(props, metrics_property_group_key), CURRENT_DIR)
+    # Deduplication settings, optional: exact deduplication over 60 seconds without them
+    dedup = DedupConfig.from_properties(property_map(props, dedup_property_group_key))
+    # Performance profile, optional: Flink's defaults without it
+    profile = ProfileConfig.from_properties(property_map(props, profile_property_group_key))
+    print("Performance profile: " + profile.describe())
+    profile.configure(table_env)
+
+    # Create tables inside Flink
+    create_source_table(table_env, input_property_map, metrics)
+    create_sink_table(table_env, output_property_map)
+    print("Tables created")
 
-    # Register the metric aggregation tasks to the statement set
-    statement_set.add_insert_sql(TOTAL_EVENTS_QUERY)
-    statement_set.add_insert_sql(TOTAL_LOGINS_QUERY)
-    statement_set.add_insert_sql(KNOCKOUTS_BY_SPELL_QUERY)
-    statement_set.add_insert_sql(PURCHASES_PER_CURRENCY_QUERY)
+    statement_set = create_metrics_statement_set(
+        table_env, metrics, dedup, output_mode(output_property_map), wide_max_metrics(output_property_map)
+    )
 
     # Execute all metric aggregation tasks
     table_result = statement_set.execute()
@@ -362,4 +469,7 @@ if __name__ == "__main__":
     else:
         # get job status through TableResult
         print(table_result.get_job_client().get_job_status())
-        pass
\ No newline at end of file
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,241 @@
+"""
+Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+
+Permission is hereby granted, free of charge, to any person obtaining a copy of this
+software and associated documentation files (the "Software"), to deal in the Software
+without restriction, including without limitation the rights to use, copy, modify,
+merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+permit persons to whom the Software is furnished to do so.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+
+
+"""Deduplication of events by event_id, ahead of every metric.
+
+Clients retry, so the same event can reach the stream more than once. Every
+metric reads events through one deduplication stage, in one of these modes:
+
+- "exact" (default): the first record of each event_id is kept, and the event_id
+  is remembered for `horizon_seconds` of processing time, after which Flink's
+  state TTL drops it. Memory grows with the number of events per horizon.
+- "bloom": a rotating pair of Bloom filters remembers event_ids for between one
+  and two horizons, in a fixed amount of memory per parallel instance. A new event
+  is dropped with the filters' false positive rate, which is reported as a metric.
+  The filters are not checkpointed: after a restart, duplicates of events seen
+  before it are not dropped. Records must be partitioned by event_id, as the
+  events API does by using it as the stream's partition key.
+- "window": the first record of each event_id is kept within each 1 minute
+  window, and forgotten when the window closes.
+- "none": every record is counted.
+
+Duplicates dropped by the exact and window modes are the difference between the
+records in and out of the job's Deduplicate or WindowDeduplicate operator. The
+Bloom filter mode reports `dedupDuplicatesDropped` and the estimated
+`dedupFalsePositivePpm` (parts per million) of each parallel instance.
+"""
+
+import math
+import time
+
+DEDUP_MODES = ("exact", "bloom", "window", "none")
+DEFAULT_DEDUP_MODE = "exact"
+DEFAULT_HORIZON_SECONDS = 60
+# Distinct events per horizon that each Bloom filter is sized for, and its false positive rate at that size
+DEFAULT_EXPECTED_EVENTS = 1000000
+DEFAULT_FALSE_POSITIVE_RATE = 0.001
+
+# dedupConfig property keys
+MODE_KEY = "dedup.mode"
+HORIZON_KEY = "dedup.horizon.seconds"
+EXPECTED_EVENTS_KEY = "dedup.bloom.expected.events"
+FALSE_POSITIVE_RATE_KEY = "dedup.bloom.false.positive.rate"
+
+# Name of the Bloom filter mode's function in SQL
+IS_NEW_EVENT_FUNCTION = "IS_NEW_EVENT"
+
+
+class DedupConfig:
+    """Validated deduplication settings, from the dedupConfig property group."""
+
+    def __init__(
+        self,
+        mode=DEFAULT_DEDUP_MODE,
+        horizon_seconds=DEFAULT_HORIZON_SECONDS,
+        expected_events=DEFAULT_EXPECTED_EVENTS,
+        false_positive_rate=DEFAULT_FALSE_POSITIVE_RATE,
+    ):
+        if mode not in DEDUP_MODES:
+            raise ValueError(f"Unknown {MODE_KEY} {mode}, expected one of {DEDUP_MODES}")
+        if horizon_seconds <= 0 or expected_events <= 0:
+            raise ValueError(f"{HORIZON_KEY} and {EXPECTED_EVENTS_KEY} must be positive")
+        if not 0 < false_positive_rate < 1:
+            raise ValueError(f"{FALSE_POSITIVE_RATE_KEY} must be between 0 and 1, not {false_positive_rate}")
+        self.mode = mode
+        self.horizon_seconds = horizon_seconds
+        self.expected_events = expected_events
+        self.false_positive_rate = false_positive_rate
+
+    @classmethod
+    def from_properties(cls, properties=None):
+        properties = properties or {}
+        return cls(
+            properties.get(MODE_KEY, DEFAULT_DEDUP_MODE),
+            int(properties.get(HORIZON_KEY, DEFAULT_HORIZON_SECONDS)),
+            int(properties.get(EXPECTED_EVENTS_KEY, DEFAULT_EXPECTED_EVENTS)),
+            float(properties.get(FALSE_POSITIVE_RATE_KEY, DEFAULT_FALSE_POSITIVE_RATE)),
+        )
+
+    def describe(self):
+        if self.mode == "exact":
+            return f"exact, event_ids kept for {self.horizon_seconds}s"
+        if self.mode == "bloom":
+            bits = bloom_filter_bits(self.expected_events, self.false_positive_rate)
+            return (
+                f"bloom, event_ids kept for {self.horizon_seconds}-{2 * self.horizon_seconds}s in "
+                f"2 x {bits // 8:,} bytes per instance, {self.false_positive_rate:g} false positive rate at "
+                f"{self.expected_events:,} events per horizon"
+            )
+        if self.mode == "window":
+            return "window, event_ids kept until their 1 minute window closes"
+        return "none"
+
+    def configure(self, table_env):
+        """Apply the mode's table options and register its functions."""
+
+        if self.mode == "exact":
+            # The TTL applies to the whole job. Apart from windows, which clear their own state, it
+            # also resets the running count numbering wide records' metrics once an application and
+            # app version is idle for the horizon; a window's metrics are numbered together, so
+            # they are still split the same way
+            table_env.get_config().set("table.exec.state.ttl", f"{self.horizon_seconds} s")
+        elif self.mode == "bloom":
+            from pyflink.table import DataTypes
+            from pyflink.table.udf import udf
+
+            table_env.create_temporary_function(
+                IS_NEW_EVENT_FUNCTION,
+                udf(
+                    IsNewEvent(self.horizon_seconds, self.expected_events, self.false_positive_rate),
+                    result_type=DataTypes.BOOLEAN(),
+                    func_type="pandas",
+                ),
+            )
+
+
+def bloom_filter_bits(expected_events, false_positive_rate):
+    """Return the bits of a Bloom filter holding `expected_events` at `false_positive_rate`, a multiple of 8."""
+
+    bits = math.ceil(-expected_events * math.log(false_positive_rate) / math.log(2) ** 2)
+    return bits + (-bits) % 8
+
+
+class RotatingBloomFilter:
+    """Two generations of Bloom filters over 64-bit hashes.
+
+    Hashes are added to the current generation and looked up in both. Once the
+    current generation is `rotate_seconds` old or holds `capacity` hashes, it
+    becomes the previous generation and the oldest one is cleared.
+    """
+
+    def __init__(self, capacity, false_positive_rate, rotate_seconds, clock=time.monotonic):
+        import numpy as np
+
+        self.np = np
+        self.capacity = capacity
+        self.bits = bloom_filter_bits(capacity, false_positive_rate)
+        self.hashes = max(1, round(self.bits / capacity * math.log(2)))
+        self.rotate_seconds = rotate_seconds
+        self.clock = clock
+        self.current = np.zeros(self.bits // 8, dtype=np.uint8)
+        self.previous = np.zeros(self.bits // 8, dtype=np.uint8)
+        self.current_count = 0
+        self.previous_count = 0
+        self.rotated_at = clock()
+
+    def rotate(self):
+        self.previous, self.current = self.current, self.previous
+        self.previous_count, self.current_count = self.current_count, 0
+        self.current[:] = 0
+        self.rotated_at = self.clock()
+
+    def positions(self, hashes):
+        """Return the k bit positions of every hash, by double hashing, as a (k, n) array."""
+
+        np = self.np
+        low = hashes & np.uint64(0xFFFFFFFF)
+        high = (hashes >> np.uint64(32)) | np.uint64(1)
+        steps = np.arange(self.hashes, dtype=np.uint64)[:, None]
+        return (low[None, :] + steps * high[None, :]) % np.uint64(self.bits)
+
+    def contains(self, generation, positions):
+        np = self.np
+        bytes_ = generation[positions >> np.uint64(3)]
+        return ((bytes_ >> (positions & np.uint64(7)).astype(np.uint8)) & 1).all(axis=0).astype(bool)
+
+    def add_new(self, hashes, duplicated=None):
+        """Add `hashes`, returning a boolean array that is True for those not seen before.
+
+        `duplicated` marks hashes repeated earlier in the same array, which are not new either.
+        """
+
+        np = self.np
+        if self.clock() - self.rotated_at >= self.rotate_seconds or self.current_count >= self.capacity:
+            self.rotate()
+        positions = self.positions(hashes)
+        seen = self.contains(self.current, positions) | self.contains(self.previous, positions)
+        if duplicated is not None:
+            seen |= duplicated
+        new_positions = positions[:, ~seen].ravel()
+        np.bitwise_or.at(
+            self.current, new_positions >> np.uint64(3), np.left_shift(1, new_positions & np.uint64(7)).astype(np.uint8)
+        )
+        self.current_count += int((~seen).sum())
+        return ~seen
+
+    def false_positive_rate(self):
+        """Estimate the chance that a new hash is reported as seen, from the number of hashes added."""
+
+        def generation_rate(count):
+            return (1 - math.exp(-self.hashes * count / self.bits)) ** self.hashes
+
+        return 1 - (1 - generation_rate(self.current_count)) * (1 - generation_rate(self.previous_count))
+
+
+try:
+    from pyflink.table.udf import ScalarFunction
+except ImportError:
+    ScalarFunction = object
+
+
+class IsNewEvent(ScalarFunction):
+    """Vectorized SQL function returning whether each event_id is seen for the first time within the horizon."""
+
+    def __init__(self, horizon_seconds, expected_events, false_positive_rate):
+        self.horizon_seconds = horizon_seconds
+        self.expected_events = expected_events
+        self.false_positive_rate = false_positive_rate
+        self.filter = None
+
+    def open(self, function_context):
+        self.filter = RotatingBloomFilter(self.expected_events, self.false_positive_rate, self.horizon_seconds)
+        metric_group = function_context.get_metric_group()
+        self.dropped = metric_group.counter("dedupDuplicatesDropped")
+        metric_group.gauge("dedupFalsePositivePpm", lambda: int(self.filter.false_positive_rate() * 1000000))
+
+    def is_deterministic(self):
+        # Called exactly once per record: the filters remember every event_id they see
+        return False
+
+    def eval(self, event_ids):
+        import pandas as pd
+
+        hashes = pd.util.hash_pandas_object(event_ids, index=False).to_numpy()
+        new = self.filter.add_new(hashes, event_ids.duplicated().to_numpy())
+        self.dropped.inc(int(len(new) - new.sum()))
+        return pd.Series(new)
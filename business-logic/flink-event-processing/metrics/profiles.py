@@ -0,0 +1,205 @@
+"""
+Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+
+Permission is hereby granted, free of charge, to any person obtaining a copy of this
+software and associated documentation files (the "Software"), to deal in the Software
+without restriction, including without limitation the rights to use, copy, modify,
+merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+permit persons to whom the Software is furnished to do so.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+
+
+"""Performance profiles: named sets of Flink execution options.
+
+A profile sets table execution, state backend, checkpointing and Python worker
+options together, so that they do not work against each other:
+
+- "default": Flink's defaults, as the job ran before profiles.
+- "low-latency": records and Python results are flushed as soon as possible,
+  watermarks advance often, and small checkpoints are taken often without
+  waiting for barriers to align, so windows are emitted soon after they end.
+- "high-throughput": the deduplication and aggregations work on mini-batches,
+  aggregations run in two phases, a local one before the shuffle and a global
+  one after it, distinct aggregations are split to spread hot keys, and records
+  and checkpoints are batched, at the cost of up to the mini-batch latency.
+- "large-state": state is kept in RocksDB, on disk, rather than on the heap,
+  and checkpoints are incremental, for more windows, dimensions or event_ids
+  than fit in memory. Mini-batches cut the number of state reads and writes.
+
+Options of the profile can be overridden one by one in the profileConfig property
+group, and are validated at startup. State TTL is left to the deduplication,
+which sets it in the exact mode. Every other stateful operator is a window,
+which clears its own state, except the running count that numbers the metrics
+of wide records: the TTL restarts it for an application and app version that
+has been idle for the horizon.
+"""
+
+import re
+
+PROFILE_KEY = "profile.name"
+DEFAULT_PROFILE = "default"
+
+DURATION = re.compile(r"^\d+ ?(ms|s|min)$")
+MINI_BATCH_ENABLED = "table.exec.mini-batch.enabled"
+MINI_BATCH_LATENCY = "table.exec.mini-batch.allow-latency"
+MINI_BATCH_SIZE = "table.exec.mini-batch.size"
+STATE_BACKEND = "state.backend.type"
+INCREMENTAL_CHECKPOINTS = "execution.checkpointing.incremental"
+CHECKPOINT_INTERVAL = "execution.checkpointing.interval"
+CHECKPOINT_MIN_PAUSE = "execution.checkpointing.min-pause"
+UNALIGNED_CHECKPOINTS = "execution.checkpointing.unaligned.enabled"
+
+OPTION_KINDS = {
+    "duration": "a duration such as 500 ms, 2 s or 1 min",
+    "boolean": "true or false",
+    "integer": "a positive integer",
+}
+
+# Options that profiles set, and the values each accepts: "duration", "boolean", "integer" or a tuple of values
+PROFILE_OPTIONS = {
+    MINI_BATCH_ENABLED: "boolean",
+    MINI_BATCH_LATENCY: "duration",
+    MINI_BATCH_SIZE: "integer",
+    "table.optimizer.agg-phase-strategy": ("AUTO", "ONE_PHASE", "TWO_PHASE"),
+    "table.optimizer.distinct-agg.split.enabled": "boolean",
+    "pipeline.object-reuse": "boolean",
+    "pipeline.auto-watermark-interval": "duration",
+    "execution.buffer-timeout.interval": "duration",
+    "python.fn-execution.bundle.size": "integer",
+    "python.fn-execution.bundle.time": "integer",
+    STATE_BACKEND: ("hashmap", "rocksdb"),
+    INCREMENTAL_CHECKPOINTS: "boolean",
+    "state.backend.rocksdb.memory.managed": "boolean",
+    "state.backend.rocksdb.predefined-options": (
+        "DEFAULT",
+        "SPINNING_DISK_OPTIMIZED",
+        "SPINNING_DISK_OPTIMIZED_HIGH_MEM",
+        "FLASH_SSD_OPTIMIZED",
+    ),
+    CHECKPOINT_INTERVAL: "duration",
+    CHECKPOINT_MIN_PAUSE: "duration",
+    UNALIGNED_CHECKPOINTS: "boolean",
+}
+
+PROFILES = {
+    "default": {},
+    "low-latency": {
+        MINI_BATCH_ENABLED: "false",
+        "pipeline.auto-watermark-interval": "50 ms",
+        "execution.buffer-timeout.interval": "5 ms",
+        "python.fn-execution.bundle.size": "1000",
+        "python.fn-execution.bundle.time": "50",
+        STATE_BACKEND: "hashmap",
+        CHECKPOINT_INTERVAL: "10 s",
+        CHECKPOINT_MIN_PAUSE: "5 s",
+        UNALIGNED_CHECKPOINTS: "true",
+    },
+    "high-throughput": {
+        MINI_BATCH_ENABLED: "true",
+        MINI_BATCH_LATENCY: "2 s",
+        MINI_BATCH_SIZE: "5000",
+        "table.optimizer.agg-phase-strategy": "TWO_PHASE",
+        "table.optimizer.distinct-agg.split.enabled": "true",
+        "pipeline.object-reuse": "true",
+        "execution.buffer-timeout.interval": "200 ms",
+        "python.fn-execution.bundle.size": "100000",
+        "python.fn-execution.bundle.time": "2000",
+        STATE_BACKEND: "hashmap",
+        CHECKPOINT_INTERVAL: "60 s",
+        CHECKPOINT_MIN_PAUSE: "30 s",
+    },
+    "large-state": {
+        MINI_BATCH_ENABLED: "true",
+        MINI_BATCH_LATENCY: "1 s",
+        MINI_BATCH_SIZE: "1000",
+        "table.optimizer.agg-phase-strategy": "TWO_PHASE",
+        STATE_BACKEND: "rocksdb",
+        INCREMENTAL_CHECKPOINTS: "true",
+        "state.backend.rocksdb.memory.managed": "true",
+        "state.backend.rocksdb.predefined-options": "SPINNING_DISK_OPTIMIZED_HIGH_MEM",
+        CHECKPOINT_INTERVAL: "60 s",
+        CHECKPOINT_MIN_PAUSE: "30 s",
+    },
+}
+
+
+def duration_millis(value):
+    number, unit = re.match(r"^(\d+) ?(\w+)$", value).groups()
+    return int(number) * {"ms": 1, "s": 1000, "min": 60000}[unit]
+
+
+def validate_option(key, value):
+    kind = PROFILE_OPTIONS.get(key)
+    if kind is None:
+        raise ValueError(f"Unknown profile option {key}, expected one of {sorted(PROFILE_OPTIONS)}")
+    if kind == "duration":
+        valid = bool(DURATION.match(value))
+    elif kind == "boolean":
+        valid = value in ("true", "false")
+    elif kind == "integer":
+        valid = value.isdigit() and int(value) > 0
+    else:
+        valid = value in kind
+    if not valid:
+        expected = OPTION_KINDS.get(kind) or f"one of {kind}"
+        raise ValueError(f"Invalid value {value!r} of profile option {key}, expected {expected}")
+
+
+class ProfileConfig:
+    """A validated performance profile, from the profileConfig property group."""
+
+    def __init__(self, name=DEFAULT_PROFILE, overrides=None):
+        if name not in PROFILES:
+            raise ValueError(f"Unknown {PROFILE_KEY} {name}, expected one of {tuple(PROFILES)}")
+        options = dict(PROFILES[name])
+        for key, value in (overrides or {}).items():
+            value = str(value).strip()
+            validate_option(key, value)
+            options[key] = value
+        check_options(options)
+        self.name = name
+        self.options = options
+
+    @classmethod
+    def from_properties(cls, properties=None):
+        properties = dict(properties or {})
+        name = properties.pop(PROFILE_KEY, DEFAULT_PROFILE)
+        return cls(name, properties)
+
+    def describe(self):
+        if not self.options:
+            return f"{self.name}, Flink's defaults"
+        return f"{self.name}, " + ", ".join(f"{key}={value}" for key, value in sorted(self.options.items()))
+
+    def configure(self, table_env):
+        """Apply the profile's options, which must be set before any statement is executed."""
+
+        config = table_env.get_config()
+        for key, value in self.options.items():
+            config.set(key, value)
+
+
+def check_options(options):
+    """Raise a ValueError if options that depend on each other are set inconsistently."""
+
+    if options.get(MINI_BATCH_ENABLED) == "true" and not (MINI_BATCH_LATENCY in options and MINI_BATCH_SIZE in options):
+        raise ValueError(f"{MINI_BATCH_ENABLED} requires {MINI_BATCH_LATENCY} and {MINI_BATCH_SIZE}")
+    if MINI_BATCH_LATENCY in options and duration_millis(options[MINI_BATCH_LATENCY]) == 0:
+        raise ValueError(f"{MINI_BATCH_LATENCY} must be positive")
+    if options.get(INCREMENTAL_CHECKPOINTS) == "true" and options.get(STATE_BACKEND) != "rocksdb":
+        raise ValueError(f"{INCREMENTAL_CHECKPOINTS} requires {STATE_BACKEND} rocksdb")
+    rocksdb_options = [key for key in options if key.startswith("state.backend.rocksdb.")]
+    if rocksdb_options and options.get(STATE_BACKEND) != "rocksdb":
+        raise ValueError(f"{', '.join(rocksdb_options)} require {STATE_BACKEND} rocksdb")
+    if CHECKPOINT_MIN_PAUSE in options:
+        if CHECKPOINT_INTERVAL not in options:
+            raise ValueError(f"{CHECKPOINT_MIN_PAUSE} requires {CHECKPOINT_INTERVAL}")
+        if duration_millis(options[CHECKPOINT_MIN_PAUSE]) >= duration_millis(options[CHECKPOINT_INTERVAL]):
+            raise ValueError(f"{CHECKPOINT_MIN_PAUSE} must be shorter than {CHECKPOINT_INTERVAL}")
@@ -0,0 +1,1235 @@
+"""
+Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+
+Permission is hereby granted, free of charge, to any person obtaining a copy of this
+software and associated documentation files (the "Software"), to deal in the Software
+without restriction, including without limitation the rights to use, copy, modify,
+merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+permit persons to whom the Software is furnished to do so.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+
+
+"""Declarative metric definitions, compiled into the Flink job's SQL.
+
+A metric is declared as a JSON object:
+
+    {
+        "name": "KnockoutsBySpell",                           # METRIC_NAME of the output records
+        "event_types": ["user_knockout"],                     # events counted, default: every event
+        "dimensions": {"DIMENSION_SPELL_ID": "$.spell_id"},   # output column: event_data path or event field
+        "aggregation": "count",                               # count, or sum, min, max, distinct, top or quantiles of "field"
+        "field": "$.exp_gained",                              # sum, min, max and quantiles: event_data path of the number
+                                                              # distinct and top: event_data path of the values
+        "precision": 12,                                      # distinct: 2^precision HyperLogLog registers
+        "k": 10,                                              # top: number of values reported
+        "capacity": 100,                                      # top: Space-Saving counters, default 10 * k
+        "quantiles": [0.5, 0.9, 0.99],                        # quantiles: fractions reported in METRIC_QUANTILES
+        "relative_accuracy": 0.01,                            # quantiles: DDSketch relative accuracy
+        "unit": "Count",                                      # METRIC_UNIT, default Count
+        "min_count": 2,                                       # only report groups of at least this many events
+        "window_minutes": 1,                                  # tumbling window, a whole number of minutes
+        "resolutions": ["1m", "1h", "1d"]                     # windows reported, default: window_minutes
+    }
+
+Every metric is also broken down by application and app version, and events
+without a value for one of a metric's event_data dimensions are not counted.
+event_data paths name one of EVENT_DATA_FIELDS.
+
+compile_metrics() builds the plan for a list of metrics:
+
+- one view that deduplicates the input (see metrics/dedup.py), and selects the
+  event_data fields that metrics use, only for the event types that use them.
+  event_data is parsed once per record by the source's JSON format, into a ROW
+  of the fields in EVENT_DATA_FIELDS
+- one window aggregation per distinct window and set of dimensions, computing
+  every metric that shares them with FILTER clauses, so that adding a metric
+  with existing dimensions adds a column rather than an operator
+- one rollup per coarser resolution of an aggregation, merging the partial
+  aggregates of the next finer resolution rather than re-reading events
+- distinct counts in aggregations of their own, of HyperLogLog registers, and
+  top values in a Python aggregation per window and dimensions, of Space-Saving
+  summaries, and quantiles in an aggregation per window and dimensions, of
+  DDSketch buckets (see metrics/sketches.py), which roll up like any other
+  aggregation
+- one INSERT per aggregation and resolution, fanning each of its rows out into
+  one record per metric, tagged with the resolution in METRIC_RESOLUTION, or in
+  the "wide" output mode one INSERT per resolution, gathering those records into
+  one per window, application and app version, or more if it has more than
+  DEFAULT_WIDE_MAX_METRICS or the given number of records
+"""
+
+import json
+import os
+import re
+
+from metrics.dedup import IS_NEW_EVENT_FUNCTION, DedupConfig
+from metrics.sketches import (
+    DEFAULT_CAPACITY_FACTOR,
+    DEFAULT_PRECISION,
+    DEFAULT_QUANTILES,
+    DEFAULT_RELATIVE_ACCURACY,
+    DEFAULT_TOP_K,
+    MAX_PRECISION,
+    MIN_PRECISION,
+    QUANTILES_FUNCTION,
+    QUANTILES_TYPE,
+    SUMMARY_TYPE,
+    TOP_K_FUNCTION,
+    TOP_K_MERGE_FUNCTION,
+    hll_estimate,
+    hll_rank,
+    hll_raw_estimate,
+    hll_register,
+    ddsketch_bucket,
+)
+
+# Dimension columns of the output table
+DIMENSION_COLUMNS = (
+    "DIMENSION_APPLICATION_ID",
+    "DIMENSION_APP_VERSION",
+    "DIMENSION_COUNTRY_ID",
+    "DIMENSION_CURRENCY_TYPE",
+    "DIMENSION_SPELL_ID",
+    "DIMENSION_MISSION_ID",
+    "DIMENSION_ITEM_ID",
+    "DIMENSION_SERVER_ID",
+    "DIMENSION_REGION",
+)
+# Output modes: one record per metric and dimensions, or one per window, application and app version with
+# every metric in it
+OUTPUT_MODES = ("narrow", "wide")
+DEFAULT_OUTPUT_MODE = "narrow"
+# Metrics of a wide record, at most: the rest of the window's go into more records. Kinesis records are at
+# most 1 MiB, and a metric record is about 650 bytes, more with many top values
+DEFAULT_WIDE_MAX_METRICS = 500
+# Columns of a wide record shared by its metrics, every other column is one of each metric in METRICS
+WIDE_SHARED_COLUMNS = ("METRIC_TIMESTAMP", "METRIC_RESOLUTION", "DIMENSION_APPLICATION_ID", "DIMENSION_APP_VERSION")
+WIDE_METRIC_COLUMNS = (
+    ("METRIC_NAME", "STRING"),
+    ("METRIC_UNIT", "STRING"),
+    ("METRIC_UNIT_VALUE_INT", "BIGINT"),
+    *((column, "STRING") for column in DIMENSION_COLUMNS if column not in WIDE_SHARED_COLUMNS),
+    ("METRIC_TOP_VALUES", SUMMARY_TYPE),
+    ("METRIC_QUANTILES", QUANTILES_TYPE),
+)
+SKETCH_COLUMNS = ("METRIC_TOP_VALUES", "METRIC_QUANTILES")
+# Every metric is broken down by application and app version
+DEFAULT_DIMENSIONS = {
+    "DIMENSION_APPLICATION_ID": "application_id",
+    "DIMENSION_APP_VERSION": "app_version",
+}
+# Fields of the stream record that dimensions can name directly
+EVENT_FIELDS = ("application_id", "app_version", "event_type")
+# event_data fields parsed by the source's JSON format, as the columns of its event_data ROW.
+# They are all STRING, which takes any JSON value: numbers are cast where a metric aggregates them
+EVENT_DATA_FIELDS = (
+    "platform",
+    "country_id",
+    "region",
+    "currency_type",
+    "currency_amount",
+    "spell_id",
+    "item_id",
+    "item_amount",
+    "level_id",
+    "match_id",
+    "match_type",
+    "map_id",
+    "exp_gained",
+    "connected_server_id",
+    "latency",
+    "user_id",
+    "session_id",
+)
+AGGREGATIONS = ("count", "sum", "min", "max", "distinct", "top", "quantiles")
+# Aggregations of their field's values as strings, where the others aggregate numbers
+STRING_AGGREGATIONS = ("distinct", "top")
+SPEC_KEYS = {
+    "name",
+    "event_types",
+    "dimensions",
+    "aggregation",
+    "field",
+    "unit",
+    "min_count",
+    "window_minutes",
+    "resolutions",
+    "precision",
+    "k",
+    "capacity",
+    "quantiles",
+    "relative_accuracy",
+}
+# How partial aggregates of each aggregation are merged into a coarser resolution
+ROLLUPS = {"count": "SUM", "sum": "SUM", "min": "MIN", "max": "MAX"}
+# Shared window and deduplication stage, every metric window is a whole number of these
+BASE_WINDOW_MINUTES = 1
+# Top values are counted in bundles of this many seconds before they are summarized
+TOP_BUNDLE_SECONDS = 1
+
+# metricsConfig property keys: a JSON file of metrics, and/or one metric per "metric.<name>" key
+SPEC_FILE_KEY = "metrics.spec.file"
+METRIC_KEY_PREFIX = "metric."
+
+NAME = re.compile(r"^[A-Za-z][A-Za-z0-9_]*$")
+RESOLUTION = re.compile(r"^(?P<count>[1-9][0-9]*)(?P<unit>[mhd])$")
+RESOLUTION_UNITS = {"m": 1, "h": 60, "d": 1440}
+JSON_PATH = re.compile(r"^\$\.(?P<field>[A-Za-z_][A-Za-z0-9_]*)$")
+
+DEFAULT_METRICS = [
+    # Count of Total Events within period
+    {"name": "TotalEvents"},
+    # Count of logins within period
+    {"name": "TotalLogins", "event_types": ["login"]},
+    # Get the number of knockouts by each spell used in a knockout in the period
+    {
+        "name": "KnockoutsBySpell",
+        "event_types": ["user_knockout"],
+        "dimensions": {"DIMENSION_SPELL_ID": "$.spell_id"},
+        "min_count": 2,
+    },
+    # Get all purchases grouped by currency over the period
+    {
+        "name": "Purchases",
+        "event_types": ["iap_transaction"],
+        "dimensions": {"DIMENSION_CURRENCY_TYPE": "$.currency_type"},
+        "min_count": 2,
+    },
+    # Most viewed items, most used knockout spells and most started maps, ranked in one record per period
+    {"name": "TopItemsViewed", "event_types": ["item_viewed"], "aggregation": "top", "field": "$.item_id"},
+    {"name": "TopKnockoutSpells", "event_types": ["user_knockout"], "aggregation": "top", "field": "$.spell_id"},
+    {"name": "TopMaps", "event_types": ["match_start"], "aggregation": "top", "field": "$.map_id"},
+    # Client latency percentiles of each server and region
+    {
+        "name": "ClientLatency",
+        "event_types": ["client_latency"],
+        "dimensions": {"DIMENSION_SERVER_ID": "$.connected_server_id", "DIMENSION_REGION": "$.region"},
+        "aggregation": "quantiles",
+        "field": "$.latency",
+        "unit": "Milliseconds",
+    },
+]
+
+
+def check_data_path(path, what):
+    match = JSON_PATH.match(str(path))
+    if not match:
+        raise ValueError(f"{what} must be an event_data path such as $.spell_id, not {path!r}")
+    if match.group("field") not in EVENT_DATA_FIELDS:
+        raise ValueError(
+            f"{what} reads {path}, which is not one of the event_data fields the source parses, "
+            f"{EVENT_DATA_FIELDS}: add it to EVENT_DATA_FIELDS in metrics/registry.py"
+        )
+
+
+def resolution_minutes(resolution, metric_name):
+    """Return the minutes of a resolution such as "5m", "1h" or "1d", or a number of minutes."""
+
+    if isinstance(resolution, int) and not isinstance(resolution, bool) and resolution > 0:
+        return resolution
+    match = RESOLUTION.match(str(resolution))
+    if not match:
+        raise ValueError(f"Resolutions of metric {metric_name} must be such as 5m, 1h or 1d, not {resolution!r}")
+    return int(match.group("count")) * RESOLUTION_UNITS[match.group("unit")]
+
+
+def resolution_label(minutes):
+    """Return the METRIC_RESOLUTION of a window of `minutes`, in its largest whole unit."""
+
+    for unit, unit_minutes in sorted(RESOLUTION_UNITS.items(), key=lambda item: -item[1]):
+        if minutes % unit_minutes == 0:
+            return f"{minutes // unit_minutes}{unit}"
+
+
+def event_data_row():
+    """Return the SQL type of the input table's event_data column."""
+
+    return "ROW(" + ", ".join(f"`{field}` STRING" for field in EVENT_DATA_FIELDS) + ")"
+
+
+class Metric:
+    """A validated metric definition. See the module docstring for the format."""
+
+    def __init__(self, spec):
+        unknown = set(spec) - SPEC_KEYS
+        if unknown:
+            raise ValueError(f"Unknown keys {sorted(unknown)} in metric {spec.get('name')}, expected {sorted(SPEC_KEYS)}")
+        self.name = spec.get("name")
+        if not isinstance(self.name, str) or not NAME.match(self.name):
+            raise ValueError(f"Metric names must be letters, digits and underscores, not {self.name!r}")
+
+        event_types = spec.get("event_types")
+        if isinstance(event_types, str):
+            event_types = [event_types]
+        if event_types is not None:
+            if not event_types or not all(isinstance(t, str) and NAME.match(t) for t in event_types):
+                raise ValueError(f"Invalid event_types {event_types!r} in metric {self.name}")
+            event_types = tuple(sorted(set(event_types)))
+        self.event_types = event_types
+
+        self.dimensions = dict(DEFAULT_DIMENSIONS)
+        for column, source in (spec.get("dimensions") or {}).items():
+            if column not in DIMENSION_COLUMNS:
+                raise ValueError(f"Unknown dimension {column} in metric {self.name}, expected one of {DIMENSION_COLUMNS}")
+            if source not in EVENT_FIELDS:
+                check_data_path(source, f"Dimension {column} of metric {self.name}")
+            self.dimensions[column] = source
+
+        self.aggregation = spec.get("aggregation", "count")
+        if self.aggregation not in AGGREGATIONS:
+            raise ValueError(f"Unknown aggregation {self.aggregation} in metric {self.name}, expected one of {AGGREGATIONS}")
+        self.field = spec.get("field")
+        if self.aggregation == "count":
+            if self.field is not None:
+                raise ValueError(f"Metric {self.name} counts events and takes no field")
+        else:
+            check_data_path(self.field, f"The field of metric {self.name}")
+
+        self.precision = spec.get("precision")
+        if self.precision is not None and self.aggregation != "distinct":
+            raise ValueError(f"Only distinct counts take a precision, not metric {self.name}")
+        self.precision = int(DEFAULT_PRECISION if self.precision is None else self.precision)
+        if not MIN_PRECISION <= self.precision <= MAX_PRECISION:
+            raise ValueError(f"The precision of metric {self.name} must be between {MIN_PRECISION} and {MAX_PRECISION}")
+
+        if self.aggregation != "top" and ("k" in spec or "capacity" in spec):
+            raise ValueError(f"Only top values take k and capacity, not metric {self.name}")
+        self.k = int(spec.get("k", DEFAULT_TOP_K))
+        self.capacity = int(spec.get("capacity", DEFAULT_CAPACITY_FACTOR * self.k))
+        if self.k < 1 or self.capacity < self.k:
+            raise ValueError(f"k of metric {self.name} must be at least 1, and its capacity at least k")
+
+        if self.aggregation != "quantiles" and ("quantiles" in spec or "relative_accuracy" in spec):
+            raise ValueError(f"Only quantiles take quantiles and relative_accuracy, not metric {self.name}")
+        quantiles = spec.get("quantiles", list(DEFAULT_QUANTILES))
+        if not isinstance(quantiles, list) or not quantiles:
+            raise ValueError(f"Quantiles of metric {self.name} must be a list such as [0.5, 0.9, 0.99]")
+        self.quantiles = tuple(sorted({float(quantile) for quantile in quantiles}))
+        self.relative_accuracy = float(spec.get("relative_accuracy", DEFAULT_RELATIVE_ACCURACY))
+        if not all(0 < quantile < 1 for quantile in self.quantiles) or not 0 < self.relative_accuracy < 1:
+            raise ValueError(f"Quantiles and relative_accuracy of metric {self.name} must be between 0 and 1")
+
+        self.unit = str(spec.get("unit", "Count"))
+        self.min_count = int(spec.get("min_count", 1))
+        self.window_minutes = int(spec.get("window_minutes", BASE_WINDOW_MINUTES))
+        if self.min_count < 1 or self.window_minutes < BASE_WINDOW_MINUTES:
+            raise ValueError(f"min_count and window_minutes of metric {self.name} must be at least 1")
+
+        # The finest resolution is the metric's window, and every other one rolls up from it
+        resolutions = spec.get("resolutions")
+        if resolutions is None:
+            self.resolutions = (self.window_minutes,)
+        else:
+            if not isinstance(resolutions, list) or not resolutions:
+                raise ValueError(f"Resolutions of metric {self.name} must be a list such as [\"1m\", \"1h\"]")
+            self.resolutions = tuple(sorted({resolution_minutes(resolution, self.name) for resolution in resolutions}))
+            if "window_minutes" in spec and self.resolutions[0] != self.window_minutes:
+                raise ValueError(f"The finest resolution of metric {self.name} must be its window_minutes")
+            self.window_minutes = self.resolutions[0]
+            if any(minutes % self.window_minutes for minutes in self.resolutions):
+                raise ValueError(f"Every resolution of metric {self.name} must be a multiple of its finest")
+
+    def data_paths(self):
+        """Return the event_data paths of the metric's dimensions."""
+
+        return [source for source in self.dimensions.values() if source.startswith("$")]
+
+    def group_key(self):
+        if self.aggregation == "distinct":
+            # Registers cannot be shared with other metrics
+            return self.window_minutes, tuple(sorted(self.dimensions.items())), self.name
+        if self.aggregation in ("top", "quantiles"):
+            # Summaries and buckets are only shared with metrics of the same aggregation
+            return self.window_minutes, tuple(sorted(self.dimensions.items())), self.aggregation
+        return self.window_minutes, tuple(sorted(self.dimensions.items()))
+
+
+def load_metrics(properties=None, base_dir=None):
+    """Return the metrics declared in the metricsConfig property group, or the default metrics.
+
+    A relative spec file path is resolved against `base_dir`.
+    """
+
+    properties = properties or {}
+    specs = []
+    path = properties.get(SPEC_FILE_KEY)
+    if path:
+        if base_dir and not os.path.isabs(path):
+            path = os.path.join(base_dir, path)
+        with open(path) as file:
+            spec = json.load(file)
+        specs.extend(spec["metrics"] if isinstance(spec, dict) else spec)
+    for key, value in sorted(properties.items()):
+        if key.startswith(METRIC_KEY_PREFIX):
+            spec = json.loads(value)
+            spec.setdefault("name", key[len(METRIC_KEY_PREFIX) :])
+            specs.append(spec)
+
+    metrics = [Metric(spec) for spec in specs or DEFAULT_METRICS]
+    names = [metric.name for metric in metrics]
+    duplicates = sorted({name for name in names if names.count(name) > 1})
+    if duplicates:
+        raise ValueError(f"Metrics declared more than once: {duplicates}")
+    return metrics
+
+
+def quote(value):
+    return "'" + str(value).replace("'", "''") + "'"
+
+
+def event_type_filter(event_types, column="event_type"):
+    return f"{column} IN ({', '.join(quote(event_type) for event_type in event_types)})"
+
+
+def data_column(path, sql_type="STRING"):
+    """Return the events view column holding the value of an event_data path."""
+
+    name = JSON_PATH.match(path).group("field")
+    return f"data_{name}" if sql_type == "STRING" else f"data_{name}_{sql_type.lower()}"
+
+
+def merge_event_types(current, event_types):
+    """Widen the event types a parsed field is needed for; None means every event type."""
+
+    if current is None or event_types is None:
+        return None
+    return tuple(sorted(set(current) | set(event_types)))
+
+
+class MetricPlan:
+    """The SQL of a compiled list of metrics: views to create, in order, and INSERT statements."""
+
+    def __init__(self, views, inserts, groups, fields, rollups=0, functions=(), queries=()):
+        self.views = views
+        self.inserts = inserts
+        # (label, extra output columns, SELECT) of each INSERT, for running and measuring them one at a time
+        self.queries = list(queries)
+        self.groups = groups
+        self.fields = fields
+        self.rollups = rollups
+        # Python functions the views call, which must be registered before they are created
+        self.functions = set(functions)
+
+    def describe(self):
+        return (
+            f"{sum(len(metrics) for metrics in self.groups)} metrics in {len(self.groups)} window aggregations "
+            f"and {self.rollups} rollups, {len(self.fields)} event_data fields read"
+        )
+
+
+def compile_events_view(metrics, input_table, events_view, dedup):
+    # event_data fields to read, with their SQL type, for the event types that use them
+    fields = {}
+    for metric in metrics:
+        parsed = [(path, "STRING") for path in metric.data_paths()]
+        if metric.field:
+            parsed.append((metric.field, "STRING" if metric.aggregation in STRING_AGGREGATIONS else "DOUBLE"))
+        for key in parsed:
+            fields[key] = merge_event_types(fields[key], metric.event_types) if key in fields else metric.event_types
+
+    columns = []
+    expressions = []
+    for (path, sql_type), event_types in sorted(fields.items()):
+        column = data_column(path, sql_type)
+        expression = f"event.event_data.{JSON_PATH.match(path).group('field')}"
+        if sql_type != "STRING":
+            # Non-numbers should not fail the job
+            expression = f"TRY_CAST({expression} AS {sql_type})"
+        if event_types is not None:
+            expression = f"CASE WHEN {event_type_filter(event_types, 'event.event_type')}\n            THEN {expression} END"
+        columns.append(f",\n    {column}")
+        expressions.append(f",\n        {expression} AS {column}")
+
+    if dedup.mode == "window":
+        view = """
+CREATE TEMPORARY VIEW {0} AS
+SELECT
+    window_time AS rowtime,
+    event_id,
+    event_type,
+    application_id,
+    app_version{1}
+FROM (
+    SELECT
+        window_start,
+        window_end,
+        window_time,
+        event.event_id AS event_id,
+        event.event_type AS event_type,
+        application_id AS application_id,
+        event.app_version AS app_version{2},
+        ROW_NUMBER() OVER (PARTITION BY window_start, window_end, event.event_id ORDER BY rowtime asc) AS rownum
+    FROM TABLE(TUMBLE(TABLE {3}, DESCRIPTOR(rowtime), INTERVAL '{4}' MINUTE))
+)
+WHERE rownum = 1;
+""".format(events_view, "".join(columns), "".join(expressions), input_table, BASE_WINDOW_MINUTES)
+        return view, fields
+
+    if dedup.mode == "exact":
+        # Keeping the first record by processing time keeps rowtime a time attribute and the view append-only
+        source = """(
+    SELECT *
+    FROM (
+        SELECT *, ROW_NUMBER() OVER (PARTITION BY event.event_id ORDER BY proctime asc) AS rownum
+        FROM (SELECT *, PROCTIME() AS proctime FROM {0})
+    )
+    WHERE rownum = 1
+)""".format(input_table)
+    elif dedup.mode == "bloom":
+        source = "{0}\nWHERE {1}(event.event_id)".format(input_table, IS_NEW_EVENT_FUNCTION)
+    else:
+        source = input_table
+    view = """
+CREATE TEMPORARY VIEW {0} AS
+SELECT
+    rowtime,
+    event.event_id AS event_id,
+    event.event_type AS event_type,
+    application_id AS application_id,
+    event.app_version AS app_version{1}
+FROM {2};
+""".format(events_view, "".join(expressions).replace("\n        ", "\n    "), source)
+    return view, fields
+
+
+def dimension_expression(source):
+    return data_column(source) if source.startswith("$") else source
+
+
+def group_event_types(metrics):
+    """Return the event types of a group of metrics, or None if one of them counts every event."""
+
+    if any(metric.event_types is None for metric in metrics):
+        return None
+    return tuple(sorted({event_type for metric in metrics for event_type in metric.event_types}))
+
+
+def compile_group(name, metrics, events_view):
+    """Return the view aggregating a group of metrics that share a window and dimensions.
+
+    Each row holds the start of its window, period_start, and its window_time as
+    rowtime, and the partial aggregates of the group's metrics, value_<i>, and
+    for metrics other than counts the number of events matched, matched_<i>, so
+    that coarser resolutions can merge them. min_count and rounding are applied
+    when rows are fanned out.
+    """
+
+    window_minutes, dimensions = metrics[0].group_key()
+    dimensions = dict(dimensions)
+    group_types = group_event_types(metrics)
+
+    conditions = []
+    if group_types is not None:
+        conditions.append(event_type_filter(group_types))
+    conditions.extend(f"{data_column(path)} IS NOT NULL" for path in metrics[0].data_paths())
+
+    values = []
+    for index, metric in enumerate(metrics):
+        # Every row of the group matches a metric with the group's own event types
+        aggregate_filter = ""
+        if metric.event_types is not None and metric.event_types != group_types:
+            aggregate_filter = f" FILTER (WHERE {event_type_filter(metric.event_types)})"
+        if metric.aggregation == "count":
+            values.append(f"    COUNT(*){aggregate_filter} AS value_{index}")
+        else:
+            # Numbers are parsed as DOUBLE, and rounded down to the output's integers once fanned out
+            field = data_column(metric.field, "DOUBLE")
+            values.append(f"    {metric.aggregation.upper()}({field}){aggregate_filter} AS value_{index}")
+            values.append(f"    COUNT(*){aggregate_filter} AS matched_{index}")
+
+    columns = [f"    {dimension_expression(source)} AS {column}" for column, source in sorted(dimensions.items())]
+    group_by = ["window_start", "window_end", "window_time"] + [
+        dimension_expression(source) for column, source in sorted(dimensions.items())
+    ]
+    return """
+CREATE TEMPORARY VIEW {0} AS
+SELECT
+    window_start AS period_start,
+    window_time AS rowtime,
+{1}
+FROM TABLE(TUMBLE(TABLE {2}, DESCRIPTOR(rowtime), INTERVAL '{3}' MINUTE)){4}
+GROUP BY
+    {5};
+""".format(
+        name,
+        ",\n".join(columns + values),
+        events_view,
+        window_minutes,
+        "\nWHERE\n    " + "\n    AND ".join(conditions) if conditions else "",
+        ",\n    ".join(group_by),
+    )
+
+
+def compile_rollup(name, source, metrics, window_minutes):
+    """Return the view merging the partial aggregates of the group view `source` into `window_minutes` windows."""
+
+    dimensions = sorted(dict(metrics[0].dimensions))
+    values = []
+    for index, metric in enumerate(metrics):
+        values.append(f"    {ROLLUPS[metric.aggregation]}(value_{index}) AS value_{index}")
+        if metric.aggregation != "count":
+            values.append(f"    SUM(matched_{index}) AS matched_{index}")
+    return """
+CREATE TEMPORARY VIEW {0} AS
+SELECT
+    window_start AS period_start,
+    window_time AS rowtime,
+{1}
+FROM TABLE(TUMBLE(TABLE {2}, DESCRIPTOR(rowtime), INTERVAL '{3}' MINUTE))
+GROUP BY
+    {4};
+""".format(
+        name,
+        ",\n".join([f"    {column}" for column in dimensions] + values),
+        source,
+        window_minutes,
+        ",\n    ".join(["window_start", "window_end", "window_time"] + dimensions),
+    )
+
+
+def metric_value(index, metric, group_types):
+    """Return the output value of a metric from a row of partial aggregates, NULL if it is not reported."""
+
+    value = f"value_{index}" if metric.aggregation == "count" else f"CAST(value_{index} AS BIGINT)"
+    matched = f"value_{index}" if metric.aggregation == "count" else f"matched_{index}"
+    # Groups without any matching event must not report a value
+    if metric.min_count > 1 or (metric.event_types is not None and metric.event_types != group_types):
+        value = f"CASE WHEN {matched} >= {metric.min_count} THEN {value} END"
+    return value
+
+
+def compile_fan_out(name, metrics, indexes, window_minutes):
+    """Return the SELECT turning each row of a group view into one output record per metric.
+
+    Only the metrics of the group at `indexes` are reported.
+    """
+
+    dimensions = dict(metrics[0].dimensions)
+    group_types = group_event_types(metrics)
+    resolution = quote(resolution_label(window_minutes))
+    columns = [
+        f"    {column}" if column in dimensions else f"    CAST(NULL AS STRING) AS {column}"
+        for column in DIMENSION_COLUMNS
+    ]
+    if len(indexes) == 1:
+        index = indexes[0]
+        metric = metrics[index]
+        return """SELECT
+    CAST({0} AS STRING) AS METRIC_NAME,
+    period_start AS METRIC_TIMESTAMP,
+    metric_value AS METRIC_UNIT_VALUE_INT,
+    CAST({1} AS STRING) AS METRIC_UNIT,
+    CAST({2} AS STRING) AS METRIC_RESOLUTION,
+{3},
+    CAST('metrics' AS STRING) AS OUTPUT_TYPE,
+    rowtime
+FROM (SELECT *, {4} AS metric_value FROM {5})
+WHERE metric_value IS NOT NULL""".format(
+            quote(metric.name),
+            quote(metric.unit),
+            resolution,
+            ",\n".join(columns),
+            metric_value(index, metric, group_types),
+            name,
+        )
+
+    rows = [
+        f"    ROW(CAST({quote(metrics[index].name)} AS STRING), CAST({quote(metrics[index].unit)} AS STRING), "
+        f"{metric_value(index, metrics[index], group_types)})"
+        for index in indexes
+    ]
+    return """SELECT
+    metric_name AS METRIC_NAME,
+    period_start AS METRIC_TIMESTAMP,
+    metric_value AS METRIC_UNIT_VALUE_INT,
+    metric_unit AS METRIC_UNIT,
+    CAST({0} AS STRING) AS METRIC_RESOLUTION,
+{1},
+    CAST('metrics' AS STRING) AS OUTPUT_TYPE,
+    rowtime
+FROM {2}
+CROSS JOIN UNNEST(ARRAY[
+{3}
+]) AS metric (metric_name, metric_unit, metric_value)
+WHERE metric_value IS NOT NULL""".format(resolution, ",\n".join(columns), name, ",\n".join(rows))
+
+
+def sketch_conditions(metric, sql_type="STRING"):
+    conditions = [f"{data_column(path)} IS NOT NULL" for path in metric.data_paths()]
+    conditions.append(f"{data_column(metric.field, sql_type)} IS NOT NULL")
+    if metric.event_types is not None:
+        conditions.insert(0, event_type_filter(metric.event_types))
+    return conditions
+
+
+def compile_distinct_group(name, metric, events_view):
+    """Return the views of the HyperLogLog registers of a distinct count, in the metric's window.
+
+    Each row of the second view is one register used in a window, with its rank,
+    the highest of the values hashed to it.
+    """
+
+    dimensions = sorted(metric.dimensions.items())
+    field = data_column(metric.field)
+    hashes = """
+CREATE TEMPORARY VIEW {0}_hashes AS
+SELECT
+    rowtime,
+{1},
+    {2} AS register,
+    {3} AS register_rank
+FROM {4}
+WHERE
+    {5};
+""".format(
+        name,
+        ",\n".join(f"    {dimension_expression(source)} AS {column}" for column, source in dimensions),
+        hll_register(field, metric.precision),
+        hll_rank(field, metric.precision),
+        events_view,
+        "\n    AND ".join(sketch_conditions(metric)),
+    )
+    return [hashes, compile_distinct_rollup(name, f"{name}_hashes", metric, metric.window_minutes)]
+
+
+def compile_distinct_rollup(name, source, metric, window_minutes):
+    """Return the view merging the registers of `source` into `window_minutes` windows."""
+
+    dimensions = sorted(metric.dimensions)
+    return """
+CREATE TEMPORARY VIEW {0} AS
+SELECT
+    window_start AS period_start,
+    window_time AS rowtime,
+{1},
+    register,
+    MAX(register_rank) AS register_rank
+FROM TABLE(TUMBLE(TABLE {2}, DESCRIPTOR(rowtime), INTERVAL '{3}' MINUTE))
+GROUP BY
+    {4};
+""".format(
+        name,
+        ",\n".join(f"    {column}" for column in dimensions),
+        source,
+        window_minutes,
+        ",\n    ".join(["window_start", "window_end", "window_time"] + dimensions + ["register"]),
+    )
+
+
+def compile_distinct_fan_out(name, metric, window_minutes):
+    """Return the SELECT estimating a distinct count from the registers of each window of `name`."""
+
+    dimensions = sorted(metric.dimensions)
+    columns = [
+        f"    {column}" if column in metric.dimensions else f"    CAST(NULL AS STRING) AS {column}"
+        for column in DIMENSION_COLUMNS
+    ]
+    return """SELECT
+    CAST({0} AS STRING) AS METRIC_NAME,
+    period_start AS METRIC_TIMESTAMP,
+    metric_value AS METRIC_UNIT_VALUE_INT,
+    CAST({1} AS STRING) AS METRIC_UNIT,
+    CAST({2} AS STRING) AS METRIC_RESOLUTION,
+{3},
+    CAST('metrics' AS STRING) AS OUTPUT_TYPE,
+    rowtime
+FROM (
+    SELECT *, {4} AS metric_value
+    FROM (
+        SELECT *, {5} AS raw_estimate
+        FROM (
+            SELECT
+                window_start AS period_start,
+                window_time AS rowtime,
+{6},
+                SUM(POWER(2.0, -register_rank)) AS harmonic_sum,
+                COUNT(*) AS used_registers
+            FROM TABLE(TUMBLE(TABLE {7}, DESCRIPTOR(rowtime), INTERVAL '{8}' MINUTE))
+            GROUP BY
+                {9}
+        )
+    )
+)
+WHERE metric_value >= {10}""".format(
+        quote(metric.name),
+        quote(metric.unit),
+        quote(resolution_label(window_minutes)),
+        ",\n".join(columns),
+        hll_estimate("raw_estimate", "used_registers", metric.precision),
+        hll_raw_estimate("harmonic_sum", "used_registers", metric.precision),
+        ",\n".join(f"                {column}" for column in dimensions),
+        name,
+        window_minutes,
+        ",\n                ".join(["window_start", "window_end", "window_time"] + dimensions),
+        metric.min_count,
+    )
+
+
+def compile_top_group(name, metrics, events_view):
+    """Return the views of the Space-Saving summaries of a group of top values metrics, in their window.
+
+    The first view counts each value of TOP_BUNDLE_SECONDS bundles in SQL, so the
+    summaries add up one row per value and bundle rather than per event, and the
+    second summarizes each metric's counts. Counting values over the whole window
+    would keep a row per value until it ends, where bundles end within the
+    watermark delay, and the summaries keep at most `capacity` counters. Python
+    aggregate functions only run in group windows, not window table functions, so
+    it groups by TUMBLE, and all the group's metrics share it, as each runs in a
+    Python worker.
+    """
+
+    dimensions = sorted(metrics[0].dimensions.items())
+    counts = []
+    for index, metric in enumerate(metrics):
+        counts.append(
+            """SELECT
+    window_time AS rowtime,
+{0},
+    {1} AS top_metric,
+    {2} AS top_value,
+    COUNT(*) AS occurrences
+FROM TABLE(TUMBLE(TABLE {3}, DESCRIPTOR(rowtime), INTERVAL '{4}' SECOND))
+WHERE
+    {5}
+GROUP BY
+    {6}""".format(
+                ",\n".join(f"    {dimension_expression(source)} AS {column}" for column, source in dimensions),
+                index,
+                data_column(metric.field),
+                events_view,
+                TOP_BUNDLE_SECONDS,
+                "\n    AND ".join(sketch_conditions(metric)),
+                ",\n    ".join(
+                    ["window_start", "window_end", "window_time"]
+                    + [dimension_expression(source) for column, source in dimensions]
+                    + [data_column(metric.field)]
+                ),
+            )
+        )
+
+    window = f"INTERVAL '{metrics[0].window_minutes}' MINUTE"
+    values = []
+    for index, metric in enumerate(metrics):
+        selected = f"CASE WHEN top_metric = {index} THEN"
+        values.append(f"    {TOP_K_FUNCTION}({selected} top_value END, occurrences, {metric.capacity}) AS summary_{index}")
+        values.append(f"    SUM({selected} occurrences ELSE 0 END) AS matched_{index}")
+    summaries = """
+CREATE TEMPORARY VIEW {0} AS
+SELECT
+    TUMBLE_START(rowtime, {1}) AS period_start,
+    TUMBLE_ROWTIME(rowtime, {1}) AS rowtime,
+{2},
+{3}
+FROM {0}_counts
+GROUP BY
+    {4};
+""".format(
+        name,
+        window,
+        ",\n".join(f"    {column}" for column, source in dimensions),
+        ",\n".join(values),
+        ",\n    ".join([f"TUMBLE(rowtime, {window})"] + [column for column, source in dimensions]),
+    )
+    return [f"\nCREATE TEMPORARY VIEW {name}_counts AS\n" + "\nUNION ALL\n".join(counts) + ";\n", summaries]
+
+
+def compile_top_rollup(name, source, metrics, window_minutes):
+    """Return the view merging the summaries of `source` into `window_minutes` windows."""
+
+    dimensions = sorted(metrics[0].dimensions)
+    window = f"INTERVAL '{window_minutes}' MINUTE"
+    values = []
+    for index, metric in enumerate(metrics):
+        values.append(f"    {TOP_K_MERGE_FUNCTION}(summary_{index}, {metric.capacity}) AS summary_{index}")
+        values.append(f"    SUM(matched_{index}) AS matched_{index}")
+    return """
+CREATE TEMPORARY VIEW {0} AS
+SELECT
+    TUMBLE_START(rowtime, {1}) AS period_start,
+    TUMBLE_ROWTIME(rowtime, {1}) AS rowtime,
+{2},
+{3}
+FROM {4}
+GROUP BY
+    {5};
+""".format(
+        name,
+        window,
+        ",\n".join(f"    {column}" for column in dimensions),
+        ",\n".join(values),
+        source,
+        ",\n    ".join([f"TUMBLE(rowtime, {window})"] + dimensions),
+    )
+
+
+def compile_top_fan_out(name, metrics, indexes, window_minutes):
+    """Return the SELECT reporting the k top values of each metric at `indexes`, with the number of events counted."""
+
+    columns = [
+        f"    {column}" if column in metrics[0].dimensions else f"    CAST(NULL AS STRING) AS {column}"
+        for column in DIMENSION_COLUMNS
+    ]
+    rows = [
+        f"    ROW(CAST({quote(metrics[index].name)} AS STRING), CAST({quote(metrics[index].unit)} AS STRING), "
+        f"CASE WHEN matched_{index} >= {metrics[index].min_count} THEN matched_{index} END, "
+        f"ARRAY_SLICE(summary_{index}, 1, {metrics[index].k}))"
+        for index in indexes
+    ]
+    return """SELECT
+    metric_name AS METRIC_NAME,
+    period_start AS METRIC_TIMESTAMP,
+    metric_value AS METRIC_UNIT_VALUE_INT,
+    metric_unit AS METRIC_UNIT,
+    CAST({0} AS STRING) AS METRIC_RESOLUTION,
+{1},
+    CAST('metrics' AS STRING) AS OUTPUT_TYPE,
+    top_values AS METRIC_TOP_VALUES,
+    rowtime
+FROM {2}
+CROSS JOIN UNNEST(ARRAY[
+{3}
+]) AS metric (metric_name, metric_unit, metric_value, top_values)
+WHERE metric_value IS NOT NULL""".format(
+        quote(resolution_label(window_minutes)), ",\n".join(columns), name, ",\n".join(rows)
+    )
+
+
+def compile_quantiles_group(name, metrics, events_view):
+    """Return the view of the DDSketch buckets of a group of quantiles metrics, in their window.
+
+    Each row is one bucket of one metric, numbered by quantile_metric, in a window and dimensions.
+    """
+
+    dimensions = sorted(metrics[0].dimensions.items())
+    selects = []
+    for index, metric in enumerate(metrics):
+        bucket = ddsketch_bucket(data_column(metric.field, "DOUBLE"), metric.relative_accuracy)
+        conditions = sketch_conditions(metric, "DOUBLE")
+        selects.append(
+            """SELECT
+    window_time AS rowtime,
+{0},
+    {1} AS quantile_metric,
+    {2} AS bucket,
+    COUNT(*) AS occurrences
+FROM TABLE(TUMBLE(TABLE {3}, DESCRIPTOR(rowtime), INTERVAL '{4}' MINUTE))
+WHERE
+    {5}
+GROUP BY
+    {6}""".format(
+                ",\n".join(f"    {dimension_expression(source)} AS {column}" for column, source in dimensions),
+                index,
+                bucket,
+                events_view,
+                metric.window_minutes,
+                "\n    AND ".join(conditions),
+                ",\n    ".join(
+                    ["window_start", "window_end", "window_time"]
+                    + [dimension_expression(source) for column, source in dimensions]
+                    + [bucket]
+                ),
+            )
+        )
+    return f"\nCREATE TEMPORARY VIEW {name} AS\n" + "\nUNION ALL\n".join(selects) + ";\n"
+
+
+def compile_quantiles_rollup(name, source, metrics, window_minutes):
+    """Return the view adding up the buckets of `source` in `window_minutes` windows."""
+
+    dimensions = sorted(metrics[0].dimensions)
+    return """
+CREATE TEMPORARY VIEW {0} AS
+SELECT
+    window_time AS rowtime,
+{1},
+    quantile_metric,
+    bucket,
+    SUM(occurrences) AS occurrences
+FROM TABLE(TUMBLE(TABLE {2}, DESCRIPTOR(rowtime), INTERVAL '{3}' MINUTE))
+GROUP BY
+    {4};
+""".format(
+        name,
+        ",\n".join(f"    {column}" for column in dimensions),
+        source,
+        window_minutes,
+        ",\n    ".join(["window_start", "window_end", "window_time"] + dimensions + ["quantile_metric", "bucket"]),
+    )
+
+
+def compile_quantiles_fan_out(name, metrics, indexes, window_minutes):
+    """Return the SELECT reporting the quantiles of each metric at `indexes`, with the number of values.
+
+    The buckets of each window are gathered into one array per metric, which QUANTILES reads.
+    """
+
+    dimensions = sorted(metrics[0].dimensions)
+    columns = [
+        f"    {column}" if column in dimensions else f"    CAST(NULL AS STRING) AS {column}" for column in DIMENSION_COLUMNS
+    ]
+    sketches = []
+    rows = []
+    for index in indexes:
+        metric = metrics[index]
+        selected = f"FILTER (WHERE quantile_metric = {index})"
+        sketches.append(f"        ARRAY_AGG(ROW(bucket, occurrences)) {selected} AS bucket_counts_{index}")
+        sketches.append(f"        SUM(occurrences) {selected} AS matched_{index}")
+        quantiles = ", ".join(f"CAST({quantile!r} AS DOUBLE)" for quantile in metric.quantiles)
+        rows.append(
+            f"    ROW(CAST({quote(metric.name)} AS STRING), CAST({quote(metric.unit)} AS STRING), "
+            f"CASE WHEN matched_{index} >= {metric.min_count} THEN matched_{index} END, "
+            f"{QUANTILES_FUNCTION}(bucket_counts_{index}, CAST({metric.relative_accuracy!r} AS DOUBLE), "
+            f"ARRAY[{quantiles}]))"
+        )
+    return """SELECT
+    metric_name AS METRIC_NAME,
+    period_start AS METRIC_TIMESTAMP,
+    metric_value AS METRIC_UNIT_VALUE_INT,
+    metric_unit AS METRIC_UNIT,
+    CAST({0} AS STRING) AS METRIC_RESOLUTION,
+{1},
+    CAST('metrics' AS STRING) AS OUTPUT_TYPE,
+    quantiles AS METRIC_QUANTILES,
+    rowtime
+FROM (
+    SELECT
+        window_start AS period_start,
+        window_time AS rowtime,
+{2},
+{3}
+    FROM TABLE(TUMBLE(TABLE {4}, DESCRIPTOR(rowtime), INTERVAL '{5}' MINUTE))
+    GROUP BY
+        {6}
+)
+CROSS JOIN UNNEST(ARRAY[
+{7}
+]) AS metric (metric_name, metric_unit, metric_value, quantiles)
+WHERE metric_value IS NOT NULL""".format(
+        quote(resolution_label(window_minutes)),
+        ",\n".join(columns),
+        ",\n".join(f"        {column}" for column in dimensions),
+        ",\n".join(sketches),
+        name,
+        window_minutes,
+        ",\n        ".join(["window_start", "window_end", "window_time"] + dimensions),
+        ",\n".join(rows),
+    )
+
+
+def wide_metrics_type():
+    """Return the SQL type of the METRICS column of wide records."""
+
+    return "ARRAY<ROW<" + ", ".join(f"`{column}` {sql_type}" for column, sql_type in WIDE_METRIC_COLUMNS) + ">>"
+
+
+def compile_wide_view(name, selects):
+    """Return the views of every metric record of one resolution, as a wide record's METRICS element.
+
+    `selects` are the (output columns, SELECT) of the resolution's fan-outs. The
+    second view numbers the elements of each application and app version, and
+    those of a window, which share its rowtime, get consecutive numbers. Its
+    running count is the one state that no window clears: exact deduplication's
+    state TTL resets it once the application and app version has been idle for
+    the horizon. In the other modes it is kept for good, one count per key.
+    """
+
+    entry_type = "ROW<" + ", ".join(f"`{column}` {sql_type}" for column, sql_type in WIDE_METRIC_COLUMNS) + ">"
+    unions = []
+    for columns, select in selects:
+        # Only the top values and quantiles fan-outs select their own column of the two
+        values = [
+            f"CAST(NULL AS {sql_type})" if column in SKETCH_COLUMNS and column not in columns else column
+            for column, sql_type in WIDE_METRIC_COLUMNS
+        ]
+        unions.append(
+            """SELECT
+    rowtime,
+    METRIC_TIMESTAMP,
+    METRIC_RESOLUTION,
+    DIMENSION_APPLICATION_ID,
+    DIMENSION_APP_VERSION,
+    CAST(ROW({0}) AS {1}) AS metric
+FROM (
+{2}
+)""".format(", ".join(values), entry_type, select)
+        )
+    numbered = """
+CREATE TEMPORARY VIEW {0}_numbered AS
+SELECT
+    *,
+    COUNT(*) OVER (
+        PARTITION BY DIMENSION_APPLICATION_ID, DIMENSION_APP_VERSION
+        ORDER BY rowtime
+        ROWS BETWEEN UNBOUNDED PRECEDING AND CURRENT ROW
+    ) AS metric_number
+FROM {0};
+""".format(name)
+    return [f"\nCREATE TEMPORARY VIEW {name} AS\n" + "\nUNION ALL\n".join(unions) + ";\n", numbered]
+
+
+def compile_wide_insert(output_table, name, window_minutes, max_metrics=DEFAULT_WIDE_MAX_METRICS):
+    """Return the INSERT gathering the records of the wide view `name` into records of at most `max_metrics`.
+
+    A window's records of an application and app version go into as few records
+    as their consecutive numbers allow, which is one more than needed at most.
+    They are emitted together once the watermark passes the window, as soon as
+    the last of the window's aggregations has emitted it.
+    """
+
+    return """
+INSERT INTO {0}
+SELECT
+    window_start AS METRIC_TIMESTAMP,
+    CAST({1} AS STRING) AS METRIC_RESOLUTION,
+    DIMENSION_APPLICATION_ID,
+    DIMENSION_APP_VERSION,
+    CAST('metrics' AS STRING) AS OUTPUT_TYPE,
+    ARRAY_AGG(metric) AS METRICS
+FROM TABLE(TUMBLE(TABLE {2}_numbered, DESCRIPTOR(rowtime), INTERVAL '{3}' MINUTE))
+GROUP BY window_start, window_end, DIMENSION_APPLICATION_ID, DIMENSION_APP_VERSION, (metric_number - 1) / {4};
+""".format(output_table, quote(resolution_label(window_minutes)), name, window_minutes, max_metrics)
+
+
+def compile_metrics(
+    metrics,
+    input_table,
+    output_table,
+    events_view,
+    dedup=None,
+    output_mode=DEFAULT_OUTPUT_MODE,
+    wide_max_metrics=DEFAULT_WIDE_MAX_METRICS,
+):
+    """Compile `metrics` into a MetricPlan reading `input_table` and writing `output_table`.
+
+    `dedup` is the DedupConfig of the events view, by default exact deduplication.
+    `output_mode` is "narrow", one record per metric and dimensions, or "wide",
+    one record per window, application and app version, holding its metrics in
+    METRICS, up to `wide_max_metrics` of them.
+    """
+
+    if output_mode not in OUTPUT_MODES:
+        raise ValueError(f"Unknown output mode {output_mode}, expected one of {OUTPUT_MODES}")
+    if wide_max_metrics < 1:
+        raise ValueError(f"Wide records must hold at least 1 metric, not {wide_max_metrics}")
+
+    dedup = dedup or DedupConfig()
+    events_view_def, fields = compile_events_view(metrics, input_table, events_view, dedup)
+    groups = {}
+    for metric in metrics:
+        groups.setdefault(metric.group_key(), []).append(metric)
+    groups = list(groups.values())
+
+    views = [events_view_def]
+    selects = []
+    # Resolution of each of the selects, whose records a wide record gathers
+    select_minutes = []
+    rollups = 0
+    functions = set()
+    for index, group in enumerate(groups):
+        # Views of the group's resolutions, finest first: each rollup merges the coarsest one that divides it
+        resolution_views = {}
+        aggregation = group[0].aggregation
+        if aggregation == "top":
+            functions.update((TOP_K_FUNCTION, TOP_K_MERGE_FUNCTION))
+        elif aggregation == "quantiles":
+            functions.add(QUANTILES_FUNCTION)
+        for window_minutes in sorted({minutes for metric in group for minutes in metric.resolutions}):
+            name = f"metric_group_{index}"
+            if not resolution_views:
+                if aggregation == "distinct":
+                    views.extend(compile_distinct_group(name, group[0], events_view))
+                elif aggregation == "top":
+                    views.extend(compile_top_group(name, group, events_view))
+                elif aggregation == "quantiles":
+                    views.append(compile_quantiles_group(name, group, events_view))
+                else:
+                    views.append(compile_group(name, group, events_view))
+            else:
+                source = max(minutes for minutes in resolution_views if window_minutes % minutes == 0)
+                name = f"{name}_{resolution_label(window_minutes)}"
+                if aggregation == "distinct":
+                    views.append(compile_distinct_rollup(name, resolution_views[source], group[0], window_minutes))
+                elif aggregation == "top":
+                    views.append(compile_top_rollup(name, resolution_views[source], group, window_minutes))
+                elif aggregation == "quantiles":
+                    views.append(compile_quantiles_rollup(name, resolution_views[source], group, window_minutes))
+                else:
+                    views.append(compile_rollup(name, resolution_views[source], group, window_minutes))
+                rollups += 1
+            resolution_views[window_minutes] = name
+            if aggregation == "distinct":
+                label = f"{group[0].name} @ {resolution_label(window_minutes)}"
+                selects.append((label, [], compile_distinct_fan_out(name, group[0], window_minutes)))
+                select_minutes.append(window_minutes)
+                continue
+            indexes = [i for i, metric in enumerate(group) if window_minutes in metric.resolutions]
+            if not indexes:
+                continue
+            label = f"{', '.join(group[i].name for i in indexes)} @ {resolution_label(window_minutes)}"
+            if aggregation == "top":
+                selects.append((label, ["METRIC_TOP_VALUES"], compile_top_fan_out(name, group, indexes, window_minutes)))
+            elif aggregation == "quantiles":
+                selects.append(
+                    (label, ["METRIC_QUANTILES"], compile_quantiles_fan_out(name, group, indexes, window_minutes))
+                )
+            else:
+                selects.append((label, [], compile_fan_out(name, group, indexes, window_minutes)))
+            select_minutes.append(window_minutes)
+
+    if output_mode == "wide":
+        # One INSERT per resolution, of the records of every group
+        inserts = []
+        for window_minutes in sorted(set(select_minutes)):
+            name = f"metric_records_{resolution_label(window_minutes)}"
+            views.extend(
+                compile_wide_view(
+                    name,
+                    [
+                        (columns, select)
+                        for (_, columns, select), minutes in zip(selects, select_minutes)
+                        if minutes == window_minutes
+                    ],
+                )
+            )
+            inserts.append(compile_wide_insert(output_table, name, window_minutes, wide_max_metrics))
+    else:
+        # One INSERT per group and resolution: the planner only shares views between separate sinks
+        inserts = [compile_insert(output_table, columns, select) for _, columns, select in selects]
+    return MetricPlan(views, inserts, groups, fields, rollups, functions, selects)
+
+
+def compile_insert(output_table, columns, select):
+    """Return the INSERT of a fan-out SELECT into the narrow output table.
+
+    `columns` are the output columns the SELECT adds after OUTPUT_TYPE. The
+    others, like the top values and quantiles of the other aggregations, are NULL.
+    The SELECT ends with the rowtime of its window, which is left out.
+    """
+
+    columns = [
+        "METRIC_NAME",
+        "METRIC_TIMESTAMP",
+        "METRIC_UNIT_VALUE_INT",
+        "METRIC_UNIT",
+        "METRIC_RESOLUTION",
+        *DIMENSION_COLUMNS,
+        "OUTPUT_TYPE",
+        *columns,
+    ]
+    return """
+INSERT INTO {0} (
+    {1}
+)
+SELECT
+    {1}
+FROM (
+{2}
+);
+""".format(output_table, ",\n    ".join(columns), select)
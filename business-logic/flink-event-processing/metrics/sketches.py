@@ -0,0 +1,290 @@
+"""
+Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+
+Permission is hereby granted, free of charge, to any person obtaining a copy of this
+software and associated documentation files (the "Software"), to deal in the Software
+without restriction, including without limitation the rights to use, copy, modify,
+merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+permit persons to whom the Software is furnished to do so.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+
+
+"""Sketches behind approximate metrics.
+
+Distinct counts use HyperLogLog, computed by Flink's own SQL operators rather
+than a Python function: each value is hashed with HASH_CODE of its MD5 digest.
+HASH_CODE alone is Java's String.hashCode, whose bits barely differ between
+similar strings such as sequential ids, while the digests of any two values are
+unrelated, so their hashes are spread over the non-negative 31 bit integers. The
+low `precision` bits pick one of 2^precision registers, and a register keeps
+the highest rank (position of the first 1 bit) of the remaining bits. A window
+holds one row per register used, which is never more than the number of
+distinct values, and registers of finer windows merge into coarser ones with
+MAX. The estimate is the standard HyperLogLog one, with its small and large
+range corrections, and has a relative standard error of about
+1.04 / sqrt(2^precision).
+
+Top values use Space-Saving summaries, kept by Python aggregate functions: a
+summary holds at most `capacity` counters, each value's count and the most it
+may overcount by, which is at most the number of values counted divided by the
+capacity. TOP_K summarizes the values of a window, counted per value by SQL
+over bundles of a second first, so it is exact while a window holds no more
+values than the capacity, and TOP_K_MERGE merges finer summaries into coarser
+resolutions. Summaries are
+arrays of (value, count, error) rows, highest count first, so that the top k are
+their first k rows.
+
+Quantiles use DDSketch, counted by SQL too: a positive value falls in bucket
+ceil(log_gamma(value)), with gamma = (1 + a) / (1 - a) for a relative accuracy
+a, and zero and negative values in the NULL bucket, worth 0. A window holds one
+row per bucket used, which is at most log_gamma(largest / smallest value), a few
+hundred for latencies at 1% accuracy, and buckets of finer windows merge into
+coarser ones with SUM. The Python function QUANTILES reads the quantiles off a
+window's buckets, each within the relative accuracy of the exact quantile.
+"""
+
+import math
+
+# Names of the Space-Saving functions in SQL
+TOP_K_FUNCTION = "TOP_K"
+TOP_K_MERGE_FUNCTION = "TOP_K_MERGE"
+DEFAULT_TOP_K = 10
+# Counters per summary, as a multiple of the number of values reported
+DEFAULT_CAPACITY_FACTOR = 10
+# SQL type of a summary, matching summary_type()
+SUMMARY_TYPE = "ARRAY<ROW<`value` STRING, `count` BIGINT, `error` BIGINT>>"
+
+# Name of the DDSketch quantiles function in SQL
+QUANTILES_FUNCTION = "QUANTILES"
+DEFAULT_QUANTILES = (0.5, 0.9, 0.99)
+DEFAULT_RELATIVE_ACCURACY = 0.01
+# SQL type of a metric's quantiles, by label such as p50 or p99.9
+QUANTILES_TYPE = "MAP<STRING, DOUBLE>"
+
+DEFAULT_PRECISION = 12
+MIN_PRECISION = 4
+MAX_PRECISION = 16
+HASH_BITS = 31
+
+
+def registers(precision):
+    return 1 << precision
+
+
+def hll_alpha(precision):
+    """Return the bias correction constant of HyperLogLog with 2^precision registers."""
+
+    m = registers(precision)
+    return {16: 0.673, 32: 0.697, 64: 0.709}.get(m, 0.7213 / (1 + 1.079 / m))
+
+
+def hll_hash(column):
+    """Return the SQL of the HASH_BITS bit hash of `column`, as a BIGINT."""
+
+    # HASH_CODE is the absolute value of the hash, and the BIGINT keeps that of -2^31 positive
+    return f"ABS(CAST(HASH_CODE(MD5({column})) AS BIGINT))"
+
+
+def hll_register(column, precision):
+    return f"CAST(MOD({hll_hash(column)}, {registers(precision)}) AS INT)"
+
+
+def hll_rank(column, precision):
+    """Return the SQL of the rank of `column`: the position of the first 1 bit of its hash above the register bits."""
+
+    bits = HASH_BITS - precision
+    rest = f"({hll_hash(column)} / {registers(precision)})"
+    # The epsilon keeps exact powers of two on the right side of FLOOR, and is far below log2(w) - log2(w - 1)
+    return (
+        f"CASE WHEN {rest} = 0 THEN {bits + 1} "
+        f"ELSE {bits} - CAST(FLOOR(LOG2(CAST({rest} AS DOUBLE)) + 1e-12) AS INT) END"
+    )
+
+
+def hll_raw_estimate(harmonic_sum, used_registers, precision):
+    """Return the SQL of the raw estimate, from the sum of 2^-rank over the used registers and their number."""
+
+    m = registers(precision)
+    return f"{hll_alpha(precision) * m * m!r} / ({harmonic_sum} + ({m} - {used_registers}))"
+
+
+def hll_estimate(raw_estimate, used_registers, precision):
+    """Return the SQL of the corrected estimate, rounded to a BIGINT."""
+
+    m = registers(precision)
+    hash_space = float(1 << HASH_BITS)
+    return (
+        f"CAST(ROUND(CASE "
+        f"WHEN {raw_estimate} <= {2.5 * m!r} AND {used_registers} < {m} "
+        f"THEN {m} * LN(CAST({m} AS DOUBLE) / ({m} - {used_registers})) "
+        f"WHEN {raw_estimate} > {hash_space / 30!r} THEN {-hash_space!r} * LN(1 - {raw_estimate} / {hash_space!r}) "
+        f"ELSE {raw_estimate} END, 0) AS BIGINT)"
+    )
+
+
+def hll_relative_error(precision):
+    return 1.04 / math.sqrt(registers(precision))
+
+
+def ddsketch_gamma(relative_accuracy):
+    return (1 + relative_accuracy) / (1 - relative_accuracy)
+
+
+def ddsketch_bucket(column, relative_accuracy):
+    """Return the SQL of the DDSketch bucket of `column`, NULL for zero and negative values."""
+
+    log_gamma = math.log(ddsketch_gamma(relative_accuracy))
+    return f"CASE WHEN {column} > 0 THEN CAST(CEIL(LN({column}) / {log_gamma!r}) AS INT) END"
+
+
+def ddsketch_quantiles(bucket_counts, relative_accuracy, quantiles):
+    """Return the value of each of `quantiles` among (bucket, count) pairs, or None without any count.
+
+    A bucket's value is the one within the relative accuracy of every value in it.
+    """
+
+    bucket_counts = sorted(bucket_counts, key=lambda pair: -math.inf if pair[0] is None else pair[0])
+    total = sum(count for bucket, count in bucket_counts)
+    if not total:
+        return [None] * len(quantiles)
+    gamma = ddsketch_gamma(relative_accuracy)
+    values = []
+    for quantile in quantiles:
+        rank = quantile * (total - 1)
+        seen = 0
+        for bucket, count in bucket_counts:
+            seen += count
+            if seen > rank:
+                break
+        values.append(0.0 if bucket is None else 2 * gamma**bucket / (gamma + 1))
+    return values
+
+
+def quantile_label(quantile):
+    """Return the key of a quantile in METRIC_QUANTILES, such as p50 for 0.5 or p99.9 for 0.999."""
+
+    return f"p{round(quantile * 100, 6):g}"
+
+
+def space_saving_add(counters, capacity, value, count=1, error=0):
+    """Add `count` occurrences of `value` to a Space-Saving summary, a dict of value: [count, error]."""
+
+    counter = counters.get(value)
+    if counter is not None:
+        counter[0] += count
+        counter[1] += error
+    elif len(counters) < capacity:
+        counters[value] = [count, error]
+    else:
+        # The new value takes the place of the least counted one, inheriting its count as error
+        victim = min(counters, key=lambda key: counters[key][0])
+        floor = counters.pop(victim)[0]
+        counters[value] = [floor + count, floor + error]
+
+
+def space_saving_merge(counters, capacity, summary):
+    """Merge a summary of (value, count, error) rows into `counters`.
+
+    A value missing from one side may have been counted up to that side's
+    smallest count, if it is full, which is added to its count and error.
+    """
+
+    floor = min((counter[0] for counter in counters.values()), default=0) if len(counters) >= capacity else 0
+    summary_floor = summary[-1][1] if summary and len(summary) >= capacity else 0
+    merged = {}
+    for value, count, error in summary:
+        counter = counters.get(value)
+        if counter is None:
+            merged[value] = [count + floor, error + floor]
+        else:
+            merged[value] = [count + counter[0], error + counter[1]]
+    for value, counter in counters.items():
+        if value not in merged:
+            merged[value] = [counter[0] + summary_floor, counter[1] + summary_floor]
+    counters.clear()
+    counters.update(sorted(merged.items(), key=lambda item: -item[1][0])[:capacity])
+
+
+try:
+    from pyflink.common import Row
+    from pyflink.table import DataTypes
+    from pyflink.table.udf import AggregateFunction, ScalarFunction, udaf, udf
+except ImportError:
+    AggregateFunction = ScalarFunction = object
+
+
+class SpaceSavingFunction(AggregateFunction):
+    """Base of the Space-Saving aggregate functions, whose accumulator is a one field row of counters."""
+
+    def create_accumulator(self):
+        return [{}]
+
+    def get_value(self, accumulator):
+        ranked = sorted(accumulator[0].items(), key=lambda item: -item[1][0])
+        return [Row(value, count, error) for value, (count, error) in ranked]
+
+    def get_accumulator_type(self):
+        return DataTypes.ROW(
+            [DataTypes.FIELD("counters", DataTypes.MAP(DataTypes.STRING(), DataTypes.ARRAY(DataTypes.BIGINT())))]
+        )
+
+    def get_result_type(self):
+        return summary_type()
+
+
+class TopK(SpaceSavingFunction):
+    """TOP_K(value, occurrences, capacity): the Space-Saving summary of the values of a group, counted so far."""
+
+    def accumulate(self, accumulator, value, occurrences, capacity):
+        if value is not None:
+            space_saving_add(accumulator[0], capacity, value, occurrences)
+
+
+class TopKMerge(SpaceSavingFunction):
+    """TOP_K_MERGE(summary, capacity): the Space-Saving summary merging the summaries of a group."""
+
+    def accumulate(self, accumulator, summary, capacity):
+        if summary:
+            space_saving_merge(accumulator[0], capacity, [tuple(row) for row in summary])
+
+
+def summary_type():
+    return DataTypes.ARRAY(
+        DataTypes.ROW(
+            [
+                DataTypes.FIELD("value", DataTypes.STRING()),
+                DataTypes.FIELD("count", DataTypes.BIGINT()),
+                DataTypes.FIELD("error", DataTypes.BIGINT()),
+            ]
+        )
+    )
+
+
+class Quantiles(ScalarFunction):
+    """QUANTILES(bucket_counts, relative_accuracy, quantiles): the quantiles of a DDSketch, by label."""
+
+    def eval(self, bucket_counts, relative_accuracy, quantiles):
+        pairs = [(row[0], row[1]) for row in bucket_counts or []]
+        values = ddsketch_quantiles(pairs, relative_accuracy, quantiles)
+        return {quantile_label(quantile): value for quantile, value in zip(quantiles, values) if value is not None}
+
+
+def register_functions(table_env, functions):
+    """Register the Python functions named in `functions` with `table_env`."""
+
+    implementations = {
+        TOP_K_FUNCTION: lambda: udaf(TopK()),
+        TOP_K_MERGE_FUNCTION: lambda: udaf(TopKMerge()),
+        QUANTILES_FUNCTION: lambda: udf(
+            Quantiles(), result_type=DataTypes.MAP(DataTypes.STRING(), DataTypes.DOUBLE())
+        ),
+    }
+    for name in sorted(functions):
+        table_env.create_temporary_function(name, implementations[name]())
@@ -0,0 +1,63 @@
+"""
+Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+
+Permission is hereby granted, free of charge, to any person obtaining a copy of this
+software and associated documentation files (the "Software"), to deal in the Software
+without restriction, including without limitation the rights to use, copy, modify,
+merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+permit persons to whom the Software is furnished to do so.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+
+"""Tests of the Flink application, run with `python -m pytest tests` from its directory.
+
+Tests marked `flink` run queries on a local mini-cluster: they need `apache-flink`
+and a Java 11 or 17 runtime, on the PATH or in JAVA_HOME, and are skipped otherwise.
+"""
+
+import os
+import shutil
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+
+
+def flink_available():
+    try:
+        import pyflink  # noqa: F401
+    except ImportError:
+        return False
+    java_home = os.environ.get("JAVA_HOME")
+    return bool(shutil.which("java") or (java_home and os.path.isfile(os.path.join(java_home, "bin", "java"))))
+
+
+def pytest_configure(config):
+    config.addinivalue_line("markers", "flink: runs queries on a local Flink mini-cluster")
+
+
+def pytest_collection_modifyitems(config, items):
+    if flink_available():
+        return
+    skip = pytest.mark.skip(reason="needs apache-flink and a Java runtime")
+    for item in items:
+        if "flink" in item.keywords:
+            item.add_marker(skip)
+
+
+@pytest.fixture
+def batch_env():
+    """A batch TableEnvironment on one parallel instance."""
+
+    from pyflink.table import EnvironmentSettings, TableEnvironment
+
+    table_env = TableEnvironment.create(EnvironmentSettings.in_batch_mode())
+    table_env.get_config().set("parallelism.default", "1")
+    return table_env
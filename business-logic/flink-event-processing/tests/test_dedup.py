@@ -0,0 +1,151 @@
+"""
+Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+
+Permission is hereby granted, free of charge, to any person obtaining a copy of this
+software and associated documentation files (the "Software"), to deal in the Software
+without restriction, including without limitation the rights to use, copy, modify,
+merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+permit persons to whom the Software is furnished to do so.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+import math
+
+import pytest
+
+from metrics.dedup import DedupConfig, IsNewEvent, RotatingBloomFilter, bloom_filter_bits
+
+np = pytest.importorskip("numpy")
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class MetricGroup:
+    """The counters and gauges IsNewEvent registers, in place of a Flink function context's metric group."""
+
+    def __init__(self):
+        self.counters = {}
+        self.gauges = {}
+
+    def get_metric_group(self):
+        return self
+
+    def counter(self, name):
+        self.counters[name] = Counter()
+        return self.counters[name]
+
+    def gauge(self, name, value):
+        self.gauges[name] = value
+
+
+class Counter:
+    def __init__(self):
+        self.count = 0
+
+    def inc(self, value=1):
+        self.count += value
+
+
+def random_hashes(count, seed):
+    return np.random.default_rng(seed).integers(0, 2**64, size=count, dtype=np.uint64)
+
+
+@pytest.mark.parametrize("capacity, false_positive_rate", [(1000000, 0.001), (100000, 0.01), (1000, 0.05)])
+def test_bloom_filter_bits(capacity, false_positive_rate):
+    bits = bloom_filter_bits(capacity, false_positive_rate)
+    assert bits % 8 == 0
+    assert bits == pytest.approx(-capacity * math.log(false_positive_rate) / math.log(2) ** 2, abs=8)
+
+
+@pytest.mark.parametrize("false_positive_rate", [0.01, 0.001])
+def test_false_positive_rate_at_capacity(false_positive_rate):
+    capacity = 200000
+    bloom = RotatingBloomFilter(capacity, false_positive_rate, 60, clock=Clock())
+    bloom.add_new(random_hashes(capacity, 1))
+    assert bloom.current_count == pytest.approx(capacity, rel=false_positive_rate * 2)
+    assert bloom.false_positive_rate() == pytest.approx(false_positive_rate, rel=0.1)
+    # Full: the next batch rotates the filled generation to previous, where new hashes are still looked up
+    new = bloom.add_new(random_hashes(capacity, 2))
+    assert bloom.previous_count == pytest.approx(capacity, rel=false_positive_rate * 2)
+    assert 1 - new.mean() == pytest.approx(false_positive_rate, rel=0.15)
+
+
+def test_seen_hashes_are_dropped():
+    bloom = RotatingBloomFilter(100000, 0.001, 60, clock=Clock())
+    hashes = random_hashes(10000, 1)
+    assert bloom.add_new(hashes).sum() >= 9990
+    assert not bloom.add_new(hashes).any()
+    assert not bloom.add_new(hashes[:100]).any()
+
+
+def test_duplicates_within_a_batch_are_dropped():
+    bloom = RotatingBloomFilter(100000, 0.001, 60, clock=Clock())
+    hashes = random_hashes(100, 1)
+    batch = np.concatenate([hashes, hashes[:10]])
+    duplicated = np.arange(len(batch)) >= 100
+    new = bloom.add_new(batch, duplicated)
+    assert new[:100].sum() >= 99
+    assert not new[100:].any()
+
+
+def test_rotation_keeps_hashes_for_the_horizon():
+    clock = Clock()
+    bloom = RotatingBloomFilter(100000, 0.001, 60, clock=clock)
+    hashes = random_hashes(1000, 1)
+    bloom.add_new(hashes)
+    clock.now = 59.9
+    assert not bloom.add_new(hashes).any()
+    # The first rotation moves them to the previous generation, where they are still found
+    clock.now = 60.0
+    assert not bloom.add_new(hashes).any()
+    assert bloom.previous_count >= 999
+    clock.now = 119.9
+    assert not bloom.add_new(hashes).any()
+    # The second rotation clears them: they were remembered for between one and two horizons
+    clock.now = 120.0
+    assert bloom.add_new(hashes).sum() >= 999
+
+
+def test_rotation_at_capacity():
+    bloom = RotatingBloomFilter(1000, 0.01, 60, clock=Clock())
+    bloom.add_new(random_hashes(1000, 1))
+    bloom.add_new(random_hashes(10, 2))
+    assert bloom.previous_count >= 990
+    assert bloom.current_count <= 10
+
+
+def test_is_new_event_counts_dropped_duplicates():
+    pd = pytest.importorskip("pandas")
+    config = DedupConfig("bloom", horizon_seconds=60, expected_events=100000, false_positive_rate=0.001)
+    function = IsNewEvent(config.horizon_seconds, config.expected_events, config.false_positive_rate)
+    context = MetricGroup()
+    function.open(context)
+    event_ids = [f"event-{i}" for i in range(0, 1000)]
+    first = function.eval(pd.Series(event_ids + event_ids[:100]))
+    assert first[:1000].sum() >= 998
+    assert not first[1000:].any()
+    dropped = context.counters["dedupDuplicatesDropped"]
+    assert dropped.count == 1100 - first.sum()
+    # Retries of events from an earlier batch are dropped too
+    second = function.eval(pd.Series(event_ids[500:] + [f"event-{i}" for i in range(1000, 1500)]))
+    assert not second[:500].any()
+    assert second[500:].sum() >= 498
+    assert dropped.count == 2100 - first.sum() - second.sum()
+    false_positive_ppm = context.gauges["dedupFalsePositivePpm"]
+    assert false_positive_ppm() == int(function.filter.false_positive_rate() * 1000000)
+    # 1,500 events in a filter sized for 100,000 at 0.1%
+    assert false_positive_ppm() < 1
+    # and at the capacity it is sized for
+    function.filter.add_new(random_hashes(100000 - function.filter.current_count, 1))
+    assert false_positive_ppm() == pytest.approx(1000, rel=0.1)
@@ -0,0 +1,187 @@
+"""
+Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+
+Permission is hereby granted, free of charge, to any person obtaining a copy of this
+software and associated documentation files (the "Software"), to deal in the Software
+without restriction, including without limitation the rights to use, copy, modify,
+merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+permit persons to whom the Software is furnished to do so.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+
+import json
+
+import pytest
+
+from metrics.dedup import DedupConfig
+from metrics.registry import (
+    DEFAULT_METRICS,
+    DIMENSION_COLUMNS,
+    Metric,
+    compile_metrics,
+    load_metrics,
+    resolution_label,
+    resolution_minutes,
+)
+
+
+def compile_specs(*specs, **options):
+    return compile_metrics([Metric(spec) for spec in specs], "input_table", "output_table", "events", **options)
+
+
+@pytest.mark.parametrize(
+    "spec, message",
+    [
+        ({"name": "A", "colour": "red"}, "Unknown keys"),
+        ({"name": "1st"}, "Metric names"),
+        ({"name": "A", "event_types": []}, "Invalid event_types"),
+        ({"name": "A", "dimensions": {"DIMENSION_COLOUR": "$.region"}}, "Unknown dimension"),
+        ({"name": "A", "dimensions": {"DIMENSION_REGION": "region"}}, "event_data path"),
+        ({"name": "A", "dimensions": {"DIMENSION_REGION": "$.colour"}}, "not one of the event_data fields"),
+        ({"name": "A", "aggregation": "median", "field": "$.latency"}, "Unknown aggregation"),
+        ({"name": "A", "field": "$.latency"}, "takes no field"),
+        ({"name": "A", "aggregation": "sum"}, "event_data path"),
+        ({"name": "A", "precision": 12}, "Only distinct counts take a precision"),
+        ({"name": "A", "aggregation": "distinct", "field": "$.user_id", "precision": 20}, "precision"),
+        ({"name": "A", "k": 5}, "Only top values take k"),
+        ({"name": "A", "aggregation": "top", "field": "$.item_id", "k": 10, "capacity": 5}, "capacity at least k"),
+        ({"name": "A", "quantiles": [0.5]}, "Only quantiles take quantiles"),
+        ({"name": "A", "aggregation": "quantiles", "field": "$.latency", "quantiles": [1.5]}, "between 0 and 1"),
+        ({"name": "A", "min_count": 0}, "must be at least 1"),
+        ({"name": "A", "resolutions": "1h"}, "must be a list"),
+        ({"name": "A", "resolutions": ["1w"]}, "such as 5m, 1h or 1d"),
+        ({"name": "A", "resolutions": ["5m", "7m"]}, "multiple of its finest"),
+        ({"name": "A", "window_minutes": 1, "resolutions": ["5m"]}, "finest resolution"),
+    ],
+)
+def test_invalid_specs_are_rejected(spec, message):
+    with pytest.raises(ValueError, match=message):
+        Metric(spec)
+
+
+def test_spec_defaults():
+    metric = Metric({"name": "Logins", "event_types": "login"})
+    assert metric.event_types == ("login",)
+    assert metric.dimensions == {"DIMENSION_APPLICATION_ID": "application_id", "DIMENSION_APP_VERSION": "app_version"}
+    assert metric.aggregation == "count"
+    assert metric.resolutions == (1,)
+    assert metric.unit == "Count"
+
+
+def test_resolutions_are_sorted_minutes():
+    metric = Metric({"name": "A", "resolutions": ["1d", "1m", "1h", "5m", "60m"]})
+    assert metric.resolutions == (1, 5, 60, 1440)
+    assert metric.window_minutes == 1
+    assert [resolution_label(minutes) for minutes in metric.resolutions] == ["1m", "5m", "1h", "1d"]
+    assert resolution_minutes(15, "A") == 15
+
+
+def test_load_metrics_defaults():
+    assert [metric.name for metric in load_metrics()] == [spec["name"] for spec in DEFAULT_METRICS]
+
+
+def test_load_metrics_from_properties(tmp_path):
+    spec_file = tmp_path / "metrics.json"
+    spec_file.write_text(json.dumps({"metrics": [{"name": "Logins", "event_types": ["login"]}]}))
+    metrics = load_metrics(
+        {"metrics.spec.file": "metrics.json", "metric.Matches": json.dumps({"event_types": ["match_start"]})},
+        str(tmp_path),
+    )
+    assert [metric.name for metric in metrics] == ["Logins", "Matches"]
+
+
+def test_load_metrics_rejects_duplicate_names():
+    with pytest.raises(ValueError, match="more than once"):
+        load_metrics({"metric.A": "{}", "metric.B": json.dumps({"name": "A"})})
+
+
+def test_metrics_with_the_same_window_and_dimensions_share_an_aggregation():
+    plan = compile_specs(
+        {"name": "Total"},
+        {"name": "Logins", "event_types": ["login"]},
+        {"name": "Spells", "event_types": ["user_knockout"], "dimensions": {"DIMENSION_SPELL_ID": "$.spell_id"}},
+    )
+    assert [[metric.name for metric in group] for group in plan.groups] == [["Total", "Logins"], ["Spells"]]
+    # The events view, one view per group, and one INSERT per group and resolution
+    assert len(plan.views) == 3
+    assert len(plan.inserts) == 2
+    assert "COUNT(*) FILTER (WHERE event_type IN ('login')) AS value_1" in plan.views[1]
+    assert "data_spell_id IS NOT NULL" in plan.views[2]
+    assert plan.fields == {("$.spell_id", "STRING"): ("user_knockout",)}
+
+
+def test_numbers_are_parsed_once_per_field():
+    plan = compile_specs(
+        {"name": "Spent", "event_types": ["iap_transaction"], "aggregation": "sum", "field": "$.currency_amount"},
+        {"name": "MostSpent", "event_types": ["iap_transaction"], "aggregation": "max", "field": "$.currency_amount"},
+    )
+    events_view = plan.views[0]
+    assert events_view.count("TRY_CAST(event.event_data.currency_amount AS DOUBLE)") == 1
+    assert "SUM(data_currency_amount_double) AS value_0" in plan.views[1]
+    assert "MAX(data_currency_amount_double) AS value_1" in plan.views[1]
+
+
+def test_rollups_merge_the_next_finer_resolution():
+    plan = compile_specs({"name": "Total", "resolutions": ["1m", "5m", "1h"]})
+    assert plan.rollups == 2
+    assert "FROM TABLE(TUMBLE(TABLE metric_group_0, DESCRIPTOR(rowtime), INTERVAL '5' MINUTE))" in plan.views[2]
+    assert "FROM TABLE(TUMBLE(TABLE metric_group_0_5m, DESCRIPTOR(rowtime), INTERVAL '60' MINUTE))" in plan.views[3]
+    assert [label for label, columns, select in plan.queries] == ["Total @ 1m", "Total @ 5m", "Total @ 1h"]
+    assert "CAST('1h' AS STRING) AS METRIC_RESOLUTION" in plan.inserts[2]
+
+
+def test_sketch_aggregations_register_their_functions():
+    plan = compile_specs(
+        {"name": "Players", "aggregation": "distinct", "field": "$.user_id", "precision": 14},
+        {"name": "TopItems", "event_types": ["item_viewed"], "aggregation": "top", "field": "$.item_id"},
+        {"name": "Latency", "event_types": ["client_latency"], "aggregation": "quantiles", "field": "$.latency"},
+    )
+    assert plan.functions == {"TOP_K", "TOP_K_MERGE", "QUANTILES"}
+    assert any("MOD(ABS(CAST(HASH_CODE(MD5(data_user_id)) AS BIGINT)), 16384)" in view for view in plan.views)
+    assert any("TOP_K(" in view for view in plan.views)
+    assert "METRIC_TOP_VALUES" in plan.inserts[1]
+    assert "METRIC_QUANTILES" in plan.inserts[2]
+
+
+def test_dedup_modes_change_only_the_events_view():
+    specs = [{"name": "Total"}]
+    exact = compile_specs(*specs)
+    window = compile_specs(*specs, dedup=DedupConfig(mode="window"))
+    none = compile_specs(*specs, dedup=DedupConfig(mode="none"))
+    assert "PARTITION BY event.event_id" in exact.views[0]
+    assert "PARTITION BY window_start, window_end, event.event_id" in window.views[0]
+    assert "ROW_NUMBER" not in none.views[0]
+    assert exact.views[1:] == window.views[1:] == none.views[1:]
+
+
+def test_narrow_inserts_name_every_output_column():
+    plan = compile_specs({"name": "Total"})
+    for column in DIMENSION_COLUMNS:
+        assert column in plan.inserts[0]
+    assert "rowtime" not in plan.inserts[0].split("FROM (")[0]
+
+
+def test_wide_inserts_one_per_resolution_with_a_metric_limit():
+    plan = compile_specs(
+        {"name": "Total", "resolutions": ["1m", "5m"]},
+        {"name": "Spells", "event_types": ["user_knockout"], "dimensions": {"DIMENSION_SPELL_ID": "$.spell_id"}},
+        output_mode="wide",
+        wide_max_metrics=50,
+    )
+    assert len(plan.inserts) == 2
+    assert "TABLE metric_records_1m_numbered" in plan.inserts[0]
+    assert "(metric_number - 1) / 50" in plan.inserts[0]
+    assert "ARRAY_AGG(metric) AS METRICS" in plan.inserts[1]
+
+
+def test_invalid_output_options_are_rejected():
+    with pytest.raises(ValueError, match="Unknown output mode"):
+        compile_specs({"name": "Total"}, output_mode="columnar")
+    with pytest.raises(ValueError, match="at least 1 metric"):
+        compile_specs({"name": "Total"}, output_mode="wide", wide_max_metrics=0)
@@ -0,0 +1,124 @@
+"""
+Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+
+Permission is hereby granted, free of charge, to any person obtaining a copy of this
+software and associated documentation files (the "Software"), to deal in the Software
+without restriction, including without limitation the rights to use, copy, modify,
+merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+permit persons to whom the Software is furnished to do so.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+
+import json
+import os
+import random
+import uuid
+
+import pytest
+
+from metrics.registry import Metric
+
+# Start of the generated events, on the hour, and their span, over two whole hours and part of a third
+START_TIME = 1700006400
+SECONDS = 8000
+EVENTS = 4000
+
+# Metrics of every aggregation, each computed three ways: rolled up from 1 minute, and directly in 5 and 60 minute
+# windows. Top values report every value counted, as which of the values tied for the k-th count are kept is arbitrary
+AGGREGATIONS = {
+    "Logins": {"event_types": ["login"]},
+    "Spent": {"event_types": ["iap_transaction"], "aggregation": "sum", "field": "$.currency_amount"},
+    "LeastSpent": {"event_types": ["iap_transaction"], "aggregation": "min", "field": "$.currency_amount"},
+    "MostSpent": {"event_types": ["iap_transaction"], "aggregation": "max", "field": "$.currency_amount"},
+    "Knockouts": {"event_types": ["user_knockout"], "dimensions": {"DIMENSION_SPELL_ID": "$.spell_id"}},
+    "Players": {"aggregation": "distinct", "field": "$.user_id"},
+    "TopItems": {"event_types": ["item_viewed"], "aggregation": "top", "field": "$.item_id", "k": 50},
+    "Latency": {"event_types": ["client_latency"], "aggregation": "quantiles", "field": "$.latency"},
+}
+EVENT_DATA = {
+    "login": lambda rng: {},
+    "iap_transaction": lambda rng: {"currency_amount": rng.randint(1, 100)},
+    "user_knockout": lambda rng: {"spell_id": f"spell-{rng.randint(1, 4)}"},
+    "item_viewed": lambda rng: {"item_id": f"item-{min(int(rng.paretovariate(1.5)), 30)}"},
+    "client_latency": lambda rng: {"latency": rng.randint(5, 400)},
+}
+
+
+def metric_specs():
+    specs = []
+    for name, spec in AGGREGATIONS.items():
+        specs.append({"name": f"Rolled{name}", "resolutions": ["1m", "5m", "1h"], **spec})
+        specs.append({"name": f"Direct5m{name}", "window_minutes": 5, **spec})
+        specs.append({"name": f"Direct1h{name}", "window_minutes": 60, **spec})
+    return specs
+
+
+def write_events(path):
+    rng = random.Random(3)
+    with open(path, "w") as file:
+        for index in range(EVENTS):
+            event_type = rng.choice(sorted(EVENT_DATA))
+            event = {
+                "event_version": "1.0.0",
+                "event_id": str(uuid.UUID(int=rng.getrandbits(128))),
+                "event_type": event_type,
+                "event_name": event_type,
+                "event_timestamp": START_TIME + index * SECONDS // EVENTS,
+                "app_version": rng.choice(["1.0.0", "1.1.0"]),
+                "event_data": {"user_id": f"user-{rng.randint(1, 300)}", **EVENT_DATA[event_type](rng)},
+            }
+            file.write(json.dumps({"event": event, "application_id": "test-application"}) + "\n")
+
+
+def read_records(path):
+    records = []
+    for root, directories, files in os.walk(path):
+        for name in files:
+            if not name.startswith("."):
+                with open(os.path.join(root, name)) as file:
+                    records.extend(json.loads(line) for line in file)
+    return records
+
+
+def record_key(record):
+    dimensions = tuple(sorted((column, value) for column, value in record.items() if column.startswith("DIMENSION_")))
+    return record["METRIC_RESOLUTION"], record["METRIC_TIMESTAMP"], dimensions
+
+
+def record_value(record):
+    top_values = record["METRIC_TOP_VALUES"]
+    # Values of equal counts may come in either order
+    top_values = sorted((row["value"], row["count"], row["error"]) for row in top_values) if top_values else None
+    return record["METRIC_UNIT_VALUE_INT"], top_values, record["METRIC_QUANTILES"]
+
+
+@pytest.mark.flink
+def test_rollups_match_direct_windows(tmp_path):
+    import main
+
+    input_path = str(tmp_path / "events.ndjson")
+    output_path = str(tmp_path / "metrics")
+    write_events(input_path)
+    metrics = [Metric(spec) for spec in metric_specs()]
+
+    table_env = main.create_table_environment()
+    table_env.get_config().set("parallelism.default", "1")
+    main.create_source_table(table_env, {"source.connector": "filesystem", "path": input_path}, metrics)
+    main.create_sink_table(table_env, {"sink.connector": "filesystem", "path": output_path})
+    main.create_metrics_statement_set(table_env, metrics).execute().wait()
+
+    records = {}
+    for record in read_records(output_path):
+        records.setdefault(record["METRIC_NAME"], {})[record_key(record)] = record_value(record)
+    for name in AGGREGATIONS:
+        rolled = records[f"Rolled{name}"]
+        for resolution in ("5m", "1h"):
+            direct = records[f"Direct{resolution}{name}"]
+            assert direct, f"{name} has no {resolution} records"
+            assert {key: value for key, value in rolled.items() if key[0] == resolution} == direct, name
@@ -0,0 +1,150 @@
+"""
+Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+
+Permission is hereby granted, free of charge, to any person obtaining a copy of this
+software and associated documentation files (the "Software"), to deal in the Software
+without restriction, including without limitation the rights to use, copy, modify,
+merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+permit persons to whom the Software is furnished to do so.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+
+import collections
+import random
+
+import pytest
+
+from metrics.sketches import (
+    ddsketch_gamma,
+    ddsketch_quantiles,
+    hll_estimate,
+    hll_rank,
+    hll_raw_estimate,
+    hll_register,
+    hll_relative_error,
+    quantile_label,
+    space_saving_add,
+    space_saving_merge,
+)
+
+# Distinct values, as SQL of the sequence number `id`, that Java's String.hashCode spreads badly
+NON_UUID_VALUES = {
+    "sequential ids": "'user-' || CAST(id AS STRING)",
+    "numbers": "CAST(id AS STRING)",
+    "hex strings": "LOWER(HEX(id))",
+}
+
+
+def hll_query(value, precision):
+    """Return the SQL estimating the distinct values of `value` in table ids, like the distinct count views."""
+
+    return f"""
+SELECT {hll_estimate("raw_estimate", "used_registers", precision)}
+FROM (
+    SELECT {hll_raw_estimate("harmonic_sum", "used_registers", precision)} AS raw_estimate, used_registers
+    FROM (
+        SELECT SUM(POWER(2.0, -register_rank)) AS harmonic_sum, COUNT(*) AS used_registers
+        FROM (
+            SELECT register, MAX(register_rank) AS register_rank
+            FROM (
+                SELECT {hll_register("v", precision)} AS register, {hll_rank("v", precision)} AS register_rank
+                FROM (SELECT {value} AS v FROM ids)
+            )
+            GROUP BY register
+        )
+    )
+)"""
+
+
+@pytest.mark.flink
+@pytest.mark.parametrize("precision", [12, 14])
+@pytest.mark.parametrize("values", sorted(NON_UUID_VALUES))
+def test_hll_estimates_non_uuid_values(batch_env, values, precision):
+    distinct = 50000
+    batch_env.execute_sql(
+        f"""
+CREATE TEMPORARY TABLE ids (id BIGINT) WITH (
+    'connector' = 'datagen',
+    'number-of-rows' = '{distinct}',
+    'fields.id.kind' = 'sequence',
+    'fields.id.start' = '1',
+    'fields.id.end' = '{distinct}'
+)"""
+    )
+    with batch_env.execute_sql(hll_query(NON_UUID_VALUES[values], precision)).collect() as results:
+        estimate = next(results)[0]
+    # Four standard errors
+    assert abs(estimate - distinct) <= 4 * hll_relative_error(precision) * distinct
+
+
+@pytest.mark.flink
+def test_hll_small_range_is_exact_enough(batch_env):
+    batch_env.execute_sql(
+        """
+CREATE TEMPORARY TABLE ids (id BIGINT) WITH (
+    'connector' = 'datagen',
+    'number-of-rows' = '100',
+    'fields.id.kind' = 'sequence',
+    'fields.id.start' = '1',
+    'fields.id.end' = '100'
+)"""
+    )
+    with batch_env.execute_sql(hll_query("CAST(id AS STRING)", 12)).collect() as results:
+        assert abs(next(results)[0] - 100) <= 2
+
+
+def test_space_saving_is_exact_within_capacity():
+    counters = {}
+    values = ["a"] * 5 + ["b"] * 3 + ["c"]
+    for value in values:
+        space_saving_add(counters, 3, value)
+    assert counters == {"a": [5, 0], "b": [3, 0], "c": [1, 0]}
+
+
+def test_space_saving_bounds_overcounts():
+    rng = random.Random(1)
+    capacity = 20
+    values = [str(min(int(rng.paretovariate(1.2)), 500)) for _ in range(5000)]
+    counters = {}
+    for value in values:
+        space_saving_add(counters, capacity, value)
+    exact = collections.Counter(values)
+    assert len(counters) == capacity
+    for value, (count, error) in counters.items():
+        assert count - error <= exact[value] <= count
+        assert error <= len(values) / capacity
+    # The most frequent value is always kept
+    assert exact.most_common(1)[0][0] in counters
+
+
+def test_space_saving_merge_adds_counts():
+    counters = {"a": [4, 0], "b": [2, 0]}
+    space_saving_merge(counters, 10, [("a", 3, 0), ("c", 1, 0)])
+    assert counters == {"a": [7, 0], "b": [2, 0], "c": [1, 0]}
+
+
+def test_ddsketch_quantiles_within_relative_accuracy():
+    import math
+
+    accuracy = 0.01
+    rng = random.Random(2)
+    values = sorted(rng.lognormvariate(3, 1) for _ in range(10000))
+    buckets = collections.Counter(math.ceil(math.log(value) / math.log(ddsketch_gamma(accuracy))) for value in values)
+    quantiles = [0.5, 0.9, 0.99]
+    for quantile, estimate in zip(quantiles, ddsketch_quantiles(buckets.items(), accuracy, quantiles)):
+        exact = values[int(quantile * (len(values) - 1))]
+        assert abs(estimate - exact) <= accuracy * exact * 1.0001
+
+
+def test_ddsketch_quantiles_of_nothing():
+    assert ddsketch_quantiles([], 0.01, [0.5]) == [None]
+
+
+def test_quantile_labels():
+    assert [quantile_label(q) for q in (0.5, 0.99, 0.999)] == ["p50", "p99", "p99.9"]
@@ -186,6 +186,7 @@ export class ManagedFlinkConstruct extends Construct {
               propertyMap: {
                 "python": "main.py",
                 "jarfile": "lib/pyflink-dependencies.jar",
+                "pyFiles": "metrics/",
               }
             }, {
               propertyGroupId: "sourceConfig",
@@ -194,6 +195,8 @@ export class ManagedFlinkConstruct extends Construct {
               propertyGroupId: "sinkConfig",
               propertyMap: {
                 "sink.connector": "kinesis",
+                // The OpenSearch ingestion pipeline reads the same mode
+                "sink.output.mode": props.config.METRIC_OUTPUT_MODE === "WIDE" ? "wide" : "narrow",
                 "kinesis.stream.arn": metricOutputStream.streamArn,
                 "aws.region": cdk.Aws.REGION
               }
@@ -256,6 +256,22 @@ export class OpenSearchConstruct extends Construct {
 
     const unformattedIngestionDefinition = fs.readFileSync(`${codePath}/opensearch-ingestion/ingestion-definition.yml`, "utf8")
 
+    // Narrow metric records are parsed one per line, and wide ones fanned out into one event per metric
+    const ingestionFormat = props.config.METRIC_OUTPUT_MODE === "WIDE"
+      ? {
+        codec: {
+          json: {
+            key_name: "METRICS",
+            include_keys: ["METRIC_TIMESTAMP", "METRIC_RESOLUTION", "DIMENSION_APPLICATION_ID", "DIMENSION_APP_VERSION", "OUTPUT_TYPE"]
+          }
+        },
+        processor: []
+      }
+      : {
+        codec: { newline: {} },
+        processor: [{ parse_json: { handle_failed_events: "skip" } }]
+      };
+
     const formattedIngestionDefinition = cdk.Fn.sub(unformattedIngestionDefinition, {
       pipeline_name: pipelineName,
       stream_name: props.metricOutputStream.streamName,
@@ -263,7 +279,9 @@ export class OpenSearchConstruct extends Construct {
       network_policy_name: collectionName,
       role: ingestionRole.roleArn,
       dlq_bucket_name: dlqBucket.bucketName,
-      region: cdk.Aws.REGION
+      region: cdk.Aws.REGION,
+      codec: JSON.stringify(ingestionFormat.codec),
+      processor: JSON.stringify(ingestionFormat.processor)
     })
 
     const ingestionLogGroup = new logs.LogGroup(this, "IngestionLogGroup", {
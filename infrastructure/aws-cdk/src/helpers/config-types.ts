@@ -6,6 +6,7 @@ export interface GameAnalyticsPipelineConfig {
   INGEST_MODE: "DIRECT_BATCH" | "KINESIS_DATA_STREAMS";
   DATA_STACK: "DATA_LAKE" | "REDSHIFT";
   REAL_TIME_ANALYTICS: boolean;
+  METRIC_OUTPUT_MODE: "NARROW" | "WIDE";
   ENABLE_APACHE_ICEBERG_SUPPORT: boolean;
 
   EVENTS_DATABASE: string;
@@ -167,6 +167,7 @@ resource "aws_kinesisanalyticsv2_application" "managed_flink_app" {
         property_map = {
           "python"  = "main.py"
           "jarfile" = "lib/pyflink-dependencies.jar"
+          "pyFiles" = "metrics/"
         }
       }
 
@@ -189,6 +190,7 @@ resource "aws_kinesisanalyticsv2_application" "managed_flink_app" {
         property_map = {
           "kinesis.stream.arn" = aws_kinesis_stream.metric_output_stream.arn
           "aws.region"         = "${data.aws_region.current.region}"
+          "sink.output.mode"   = lower(var.metric_output_mode)
         }
       }
     }
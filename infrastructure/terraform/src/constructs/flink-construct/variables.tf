@@ -31,6 +31,16 @@ variable "flink_deploy_artifact" {
   default     = "deploy.zip"
 }
 
+variable "metric_output_mode" {
+  type        = string
+  default     = "NARROW"
+
+  validation {
+    condition     = contains(["NARROW", "WIDE"], var.metric_output_mode)
+    error_message = "metric_output_mode must be NARROW or WIDE."
+  }
+}
+
 variable "suffix" {
   type = string
 }
\ No newline at end of file
@@ -174,6 +174,8 @@ resource "aws_osis_pipeline" "ingestion" {
     role                = aws_iam_role.ingestion_role.arn
     dlq_bucket_name     = aws_s3_bucket.dead_letter_queue.id
     region              = data.aws_region.current.region
+    codec               = local.ingestion_codec
+    processor           = local.ingestion_processor
   })
 
   log_publishing_options {
@@ -6,6 +6,16 @@ variable "metric_output_stream_name" {
     type        = string
 }
 
+variable "metric_output_mode" {
+  type        = string
+  default     = "NARROW"
+
+  validation {
+    condition     = contains(["NARROW", "WIDE"], var.metric_output_mode)
+    error_message = "metric_output_mode must be NARROW or WIDE."
+  }
+}
+
 variable "dev_mode" {
   type = bool
 }
@@ -21,4 +31,12 @@ variable "cloudwatch_retention_days" {
 locals {
   collection_name = substr(lower(replace(lower(var.stack_name), "/[^a-z0-9-]+/", "")), 0, 28)
   pipeline_name = substr(lower(replace("${lower(var.stack_name)}-ingestion", "/[^a-z0-9-]+/", "")), 0, 28)
+  # Narrow metric records are parsed one per line, and wide ones fanned out into one event per metric
+  ingestion_codec = var.metric_output_mode == "WIDE" ? jsonencode({
+    json = {
+      key_name     = "METRICS"
+      include_keys = ["METRIC_TIMESTAMP", "METRIC_RESOLUTION", "DIMENSION_APPLICATION_ID", "DIMENSION_APP_VERSION", "OUTPUT_TYPE"]
+    }
+  }) : jsonencode({ newline = {} })
+  ingestion_processor = var.metric_output_mode == "WIDE" ? "[]" : jsonencode([{ parse_json = { handle_failed_events = "skip" } }])
 }
\ No newline at end of file
@@ -389,6 +389,7 @@ module "flink_construct" {
   analytics_bucket_name    = aws_s3_bucket.analytics_bucket.id
   game_events_stream_name              = aws_kinesis_stream.game_events_stream[0].name
   game_events_stream_arn           = aws_kinesis_stream.game_events_stream[0].arn
+  metric_output_mode               = try(local.config.METRIC_OUTPUT_MODE, "NARROW")
   suffix                           = random_string.stack-random-id-suffix.result
 }
 
@@ -402,6 +403,7 @@ module "opensearch_construct" {
   dev_mode                         = local.config.DEV_MODE
   metric_output_stream_arn         = module.flink_construct[0].kinesis_metrics_stream_arn
   metric_output_stream_name        = module.flink_construct[0].kinesis_metrics_stream_name
+  metric_output_mode               = try(local.config.METRIC_OUTPUT_MODE, "NARROW")
 }
 
 // ---- Redshift ---- //
@@ -0,0 +1,253 @@
+######################################################################################################################
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this
+# software and associated documentation files (the "Software"), to deal in the Software
+# without restriction, including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so.
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+######################################################################################################################
+
+"""Throttling-aware retries and adaptive (AIMD) sending.
+
+AimdController searches for the highest throughput the API sustains: while
+responses are fast and unthrottled it grows the batch size and then the number of
+batches in flight additively, and on throttling, server errors or high latency it
+cuts the number in flight multiplicatively. Failed batches, and the failed records
+of partially successful batches, are retried after a jittered exponential backoff
+from a bounded RetryQueue.
+"""
+
+import heapq
+import itertools
+import random
+import threading
+import time
+
+from stats import LatencyHistogram
+
+# Kinesis PutRecords and Firehose PutRecordBatch both accept at most 500 records per call
+MAX_BATCH_SIZE = 500
+MIN_BATCH_SIZE = 10
+DEFAULT_MAX_CONCURRENCY = 64
+DEFAULT_TARGET_LATENCY = 1.0
+DEFAULT_ADJUST_INTERVAL = 2.0
+DEFAULT_MAX_ATTEMPTS = 5
+DEFAULT_RETRY_QUEUE_SIZE = 1000
+# Bounds of the pause between sends once a single batch in flight is still too many
+MIN_PAUSE = 0.01
+MAX_PAUSE = 5.0
+# Windows in which more than this fraction of requests were throttled or failed count as congested
+CONGESTION_THRESHOLD = 0.01
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+class RetryPolicy:
+    """Exponential backoff with full jitter.
+
+    The delay before retry `attempt` (1 for the first retry) is drawn uniformly from
+    [0, min(max_delay, base_delay * 2^attempt)], so clients that were throttled
+    together do not all retry together.
+    """
+
+    def __init__(self, max_attempts=DEFAULT_MAX_ATTEMPTS, base_delay=0.1, max_delay=10.0, seed=None):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.rng = random.Random(seed)
+
+    @staticmethod
+    def retryable(status):
+        """Return whether a request that ended with `status` may succeed if sent again.
+
+        `status` is an HTTP status code, or the name of the exception raised instead of
+        a response (connection errors and timeouts are always retryable).
+        """
+
+        return not isinstance(status, int) or status in RETRYABLE_STATUS_CODES
+
+    def delay(self, attempt):
+        return self.rng.uniform(0, min(self.max_delay, self.base_delay * 2**attempt))
+
+
+class RetryQueue:
+    """Thread-safe, bounded queue of batches waiting for their backoff to expire."""
+
+    def __init__(self, max_size=DEFAULT_RETRY_QUEUE_SIZE):
+        self.max_size = max_size
+        self.lock = threading.Lock()
+        self.heap = []
+        self.sequence = itertools.count()
+
+    def __len__(self):
+        return len(self.heap)
+
+    def push(self, due, records, attempt):
+        """Queue `records` to be retried at `due`. Returns False, dropping them, if the queue is full."""
+
+        with self.lock:
+            if len(self.heap) >= self.max_size:
+                return False
+            heapq.heappush(self.heap, (due, next(self.sequence), records, attempt))
+            return True
+
+    def pop_due(self, now):
+        """Return the (records, attempt) retry that is most overdue at `now`, or None."""
+
+        with self.lock:
+            if not self.heap or self.heap[0][0] > now:
+                return None
+            due, sequence, records, attempt = heapq.heappop(self.heap)
+            return records, attempt
+
+    def drain(self):
+        """Remove and return every queued (records, attempt) retry."""
+
+        with self.lock:
+            pending = [(records, attempt) for due, sequence, records, attempt in self.heap]
+            self.heap = []
+            return pending
+
+
+class AimdController:
+    """Additive-increase, multiplicative-decrease control of batch size and batches in flight.
+
+    Responses are observed from sender threads. Every `adjust_interval` seconds the
+    controller looks at the window of responses since the previous adjustment:
+
+    - if more than CONGESTION_THRESHOLD of them were throttled (429), failed (5xx,
+      connection errors) or had records rejected, or their p90 latency exceeded
+      `target_latency`, the number of batches in flight is multiplied by
+      `decrease_factor`. When it is already at its minimum, slow responses cut the
+      batch size instead, and throttling doubles a pause taken before each send.
+    - otherwise any pause is halved (and dropped below MIN_PAUSE), then the batch
+      size grows by `batch_size_step` up to `max_batch_size`, and once batches are
+      full-size, the number in flight grows by one.
+
+    The best accepted throughput seen in an uncongested window is the estimate of
+    the API's maximum sustainable throughput.
+    """
+
+    def __init__(
+        self,
+        concurrency,
+        batch_size,
+        max_concurrency=DEFAULT_MAX_CONCURRENCY,
+        max_batch_size=MAX_BATCH_SIZE,
+        target_latency=DEFAULT_TARGET_LATENCY,
+        adjust_interval=DEFAULT_ADJUST_INTERVAL,
+        decrease_factor=0.5,
+        batch_size_step=50,
+        min_concurrency=1,
+        min_batch_size=MIN_BATCH_SIZE,
+        label=None,
+        verbose=True,
+    ):
+        self.max_concurrency = max(max_concurrency, min_concurrency)
+        self.min_concurrency = min_concurrency
+        self.max_batch_size = min(max_batch_size, MAX_BATCH_SIZE)
+        self.min_batch_size = min(min_batch_size, self.max_batch_size)
+        self.concurrency = min(max(concurrency, min_concurrency), self.max_concurrency)
+        self.batch_size = min(max(batch_size, self.min_batch_size), self.max_batch_size)
+        self.target_latency = target_latency
+        self.adjust_interval = adjust_interval
+        self.decrease_factor = decrease_factor
+        self.batch_size_step = batch_size_step
+        self.pause = 0.0
+        self.prefix = f"[{label}] " if label else ""
+        self.verbose = verbose
+        self.lock = threading.Lock()
+        self.window_start = time.perf_counter()
+        self.window_latency = LatencyHistogram()
+        self.window_congested = 0
+        self.window_records = 0
+        self.increases = 0
+        self.decreases = 0
+        self.best_throughput = 0.0
+        self.best_setting = None
+
+    def observe(self, latency, accepted_records, congested):
+        """Record a response that took `latency` seconds and had `accepted_records` accepted."""
+
+        with self.lock:
+            self.window_latency.record(latency)
+            self.window_records += accepted_records
+            if congested:
+                self.window_congested += 1
+
+    def maybe_adjust(self, now=None):
+        """Apply an increase or decrease if an adjustment interval has passed with responses in it."""
+
+        now = time.perf_counter() if now is None else now
+        if now - self.window_start < self.adjust_interval:
+            return
+        with self.lock:
+            responses = self.window_latency.total
+            if not responses:
+                return
+            elapsed = now - self.window_start
+            throughput = self.window_records / elapsed
+            congestion = self.window_congested / responses
+            p90 = self.window_latency.percentile(90)
+            self.window_start = now
+            self.window_latency = LatencyHistogram()
+            self.window_congested = 0
+            self.window_records = 0
+
+            congested = congestion > CONGESTION_THRESHOLD or p90 > self.target_latency
+            if congested:
+                self.decreases += 1
+                if self.concurrency > self.min_concurrency:
+                    self.concurrency = max(
+                        self.min_concurrency, int(self.concurrency * self.decrease_factor)
+                    )
+                elif p90 > self.target_latency:
+                    self.batch_size = max(
+                        self.min_batch_size, int(self.batch_size * self.decrease_factor)
+                    )
+                else:
+                    self.pause = min(MAX_PAUSE, max(MIN_PAUSE, self.pause * 2))
+            else:
+                self.increases += 1
+                if throughput > self.best_throughput:
+                    self.best_throughput = throughput
+                    self.best_setting = (self.concurrency, self.batch_size, self.pause)
+                if self.pause:
+                    self.pause = self.pause / 2 if self.pause / 2 >= MIN_PAUSE else 0.0
+                elif self.batch_size < self.max_batch_size:
+                    self.batch_size = min(self.max_batch_size, self.batch_size + self.batch_size_step)
+                elif self.concurrency < self.max_concurrency:
+                    self.concurrency += 1
+            concurrency, batch_size, pause = self.concurrency, self.batch_size, self.pause
+
+        if self.verbose:
+            print(
+                f"{self.prefix}[aimd] {throughput:,.0f} records/sec accepted, p90 {p90 * 1000:.0f}ms, "
+                f"{congestion:.1%} throttled or failed -> {'decrease' if congested else 'increase'} to "
+                f"{concurrency} in flight x {batch_size} events"
+                + (f", {pause * 1000:.0f}ms pause between sends" if pause else "")
+            )
+
+    def summary(self):
+        """Print the final settings and the best uncongested throughput seen."""
+
+        if not self.verbose:
+            return
+        print("===========================================")
+        print(f"{self.prefix}ADAPTIVE SUMMARY:")
+        print(f"- FINAL SETTING: {self.concurrency} in flight x {self.batch_size} events")
+        print(f"- ADJUSTMENTS: {self.increases} increases, {self.decreases} decreases")
+        if self.best_setting:
+            concurrency, batch_size, pause = self.best_setting
+            print(
+                f"- MAX SUSTAINED THROUGHPUT: {self.best_throughput:,.0f} records/sec "
+                f"at {concurrency} in flight x {batch_size} events"
+                + (f", {pause * 1000:.0f}ms pause between sends" if pause else "")
+            )
+        print("===========================================\n")
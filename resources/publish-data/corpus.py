@@ -0,0 +1,152 @@
+######################################################################################################################
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this
+# software and associated documentation files (the "Software"), to deal in the Software
+# without restriction, including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so.
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+######################################################################################################################
+
+"""Deterministic, pre-generated event corpora.
+
+A corpus file holds ready-to-send request bodies, so a load test pays the cost of
+generating and serializing events once, up front. The layout is:
+
+    MAGIC, FORMAT_VERSION
+    chunk 0 .. chunk N-1   gzip-compressed {"events": [...]} request bodies, one per batch
+    index                  zlib-compressed JSON: generation settings and, per chunk,
+                           [offset, length, event_count, first_timestamp, last_timestamp]
+    footer                 index offset, index length, MAGIC
+
+The footer lets a reader find the index without scanning the file, and the index
+lets it seek straight to any chunk. Chunks are gzip members so that they can be
+posted as-is with a gzip Content-Encoding.
+"""
+
+import json
+import mmap
+import struct
+import zlib
+
+from event_generator import EventGenerator
+from sender import EncodedBatch, encode_batch
+
+MAGIC = b"GACORPUS"
+FORMAT_VERSION = 2
+HEADER = struct.Struct("<8sH")
+FOOTER = struct.Struct("<QQ8s")
+
+# 2025-01-01T00:00:00Z, so corpora generated without an explicit start time are reproducible
+DEFAULT_START_TIME = 1735689600
+DEFAULT_CORPUS_EVENTS_PER_SECOND = 1000
+DEFAULT_COMPRESSION_LEVEL = 6
+
+
+def write_corpus(
+    path,
+    seed,
+    event_count,
+    batch_size,
+    start_time=DEFAULT_START_TIME,
+    events_per_second=DEFAULT_CORPUS_EVENTS_PER_SECOND,
+    compression_level=DEFAULT_COMPRESSION_LEVEL,
+    injector=None,
+):
+    """Generate `event_count` events from `seed` into a corpus file at `path`.
+
+    Event timestamps start at `start_time` and advance at `events_per_second`, so the
+    same arguments always produce the same file. A disorder.DisorderInjector passed
+    as `injector` makes events late, skewed or duplicated once they are timestamped.
+    Returns the corpus index.
+    """
+
+    generator = EventGenerator(seed=seed)
+    chunks = []
+    with open(path, "wb") as file:
+        file.write(HEADER.pack(MAGIC, FORMAT_VERSION))
+        generated = 0
+        while generated < event_count:
+            count = min(batch_size, event_count - generated)
+            first_timestamp = start_time + int(generated / events_per_second)
+            events = generator.generate_batch(count, now=first_timestamp)
+            last_timestamp = start_time + int((generated + count - 1) / events_per_second)
+            # Spread the batch over the seconds it spans at the corpus rate
+            for position, event in enumerate(events):
+                event["event_timestamp"] = start_time + int(
+                    (generated + position) / events_per_second
+                )
+            if injector is not None:
+                events = injector.inject(events)
+            body = encode_batch(events, True, compression_level).body
+            chunks.append([file.tell(), len(body), count, first_timestamp, last_timestamp])
+            file.write(body)
+            generated += count
+
+        index = {
+            "format_version": FORMAT_VERSION,
+            "seed": seed,
+            "event_count": event_count,
+            "batch_size": batch_size,
+            "start_time": start_time,
+            "events_per_second": events_per_second,
+            "chunks": chunks,
+        }
+        if injector is not None:
+            index["disorder"] = injector.settings()
+        index_offset = file.tell()
+        index_body = zlib.compress(json.dumps(index, separators=(",", ":")).encode("utf-8"))
+        file.write(index_body)
+        file.write(FOOTER.pack(index_offset, len(index_body), MAGIC))
+    return index
+
+
+class CorpusReader:
+    """Memory-maps a corpus file and serves its chunks as EncodedBatch request bodies."""
+
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, "rb")
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version = HEADER.unpack_from(self.map, 0)
+        index_offset, index_length, footer_magic = FOOTER.unpack_from(
+            self.map, len(self.map) - FOOTER.size
+        )
+        if magic != MAGIC or footer_magic != MAGIC:
+            raise ValueError(f"{path} is not an event corpus")
+        if version != FORMAT_VERSION:
+            raise ValueError(f"{path} has unsupported corpus format version {version}")
+        self.index = json.loads(
+            zlib.decompress(self.map[index_offset : index_offset + index_length])
+        )
+        self.chunks = self.index["chunks"]
+
+    def __len__(self):
+        return len(self.chunks)
+
+    def chunk(self, number):
+        """Return chunk `number` as a gzip EncodedBatch, without decompressing it."""
+
+        offset, length, event_count, first_timestamp, last_timestamp = self.chunks[number]
+        return EncodedBatch(self.map[offset : offset + length], event_count, "gzip")
+
+    def batches(self, start_chunk=0, stride=1, loop=False):
+        """Yield every `stride`-th chunk from `start_chunk`, optionally wrapping around forever."""
+
+        while True:
+            numbers = range(start_chunk, len(self.chunks), stride)
+            for number in numbers:
+                yield self.chunk(number)
+            if not loop or not numbers:
+                return
+            start_chunk %= stride
+
+    def close(self):
+        self.map.close()
+        self.file.close()
@@ -0,0 +1,292 @@
+######################################################################################################################
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this
+# software and associated documentation files (the "Software"), to deal in the Software
+# without restriction, including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so.
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+######################################################################################################################
+
+"""Late, out-of-order and duplicate event injection, with ground-truth metric counts.
+
+DisorderInjector wraps an event source (EventGenerator or PopulationSimulator) and
+reproduces what real clients do to a stream:
+
+- late delivery: a fraction of events are delivered `lateness` seconds after they
+  happened, i.e. with a timestamp that far behind the rest of the stream
+- clock skew: every client's clock is off by a fixed offset, drawn once per client
+- duplicates: a fraction of the records sent are redeliveries of a recent event,
+  as left behind by client retries and at-least-once delivery
+
+GroundTruth counts every distinct event once, at the time it actually happened,
+into the same windows and dimensions as the Flink application's metrics, so that
+their output can be checked for accuracy. It also estimates how many records the
+application's watermark will drop as late.
+"""
+
+import json
+import random
+import time
+from collections import Counter, deque
+
+from sender import ApplicationEvents
+
+DEFAULT_LATENESS = "exponential"
+LATENESS_DISTRIBUTIONS = ("exponential", "uniform", "pareto")
+DEFAULT_MEAN_LATENESS = 30.0
+DEFAULT_MAX_LATENESS = 3600.0
+DEFAULT_CLIENTS = 1000
+# Duplicates are redeliveries of one of this many most recent events of the same application
+RECENT_EVENTS = 1000
+# Shape of the Pareto lateness distribution; 2 gives a heavy tail with a finite mean
+PARETO_SHAPE = 2.0
+
+# The Flink application's tumbling window and bounded out-of-orderness watermark, in seconds
+WINDOW_SECONDS = 60
+WATERMARK_DELAY = 5
+
+
+class GroundTruth:
+    """Counts distinct events into the windows and dimensions of the Flink application's metrics.
+
+    `add()` takes each distinct event once, with the application it belongs to and
+    the timestamp it really happened at. `sent()` takes every record in the order it
+    is sent, with the timestamp it carries, to estimate late drops.
+    """
+
+    def __init__(self):
+        self.metrics = {
+            "TotalEvents": Counter(),
+            "TotalLogins": Counter(),
+            "KnockoutsBySpell": Counter(),
+            "Purchases": Counter(),
+        }
+        self.events = 0
+        self.records = 0
+        self.expected_late = 0
+        self.max_timestamp = None
+
+    def add(self, event, application_id):
+        window = event["event_timestamp"] - event["event_timestamp"] % WINDOW_SECONDS
+        dimensions = (window, application_id, event["app_version"])
+        self.events += 1
+        self.metrics["TotalEvents"][dimensions] += 1
+        event_type = event["event_type"]
+        if event_type == "login":
+            self.metrics["TotalLogins"][dimensions] += 1
+        elif event_type == "user_knockout":
+            spell_id = event["event_data"].get("spell_id")
+            if spell_id is not None:
+                self.metrics["KnockoutsBySpell"][dimensions + (spell_id,)] += 1
+        elif event_type == "iap_transaction":
+            currency_type = event["event_data"].get("currency_type")
+            if currency_type is not None:
+                self.metrics["Purchases"][dimensions + (currency_type,)] += 1
+
+    def sent(self, timestamp):
+        """Count a record that was sent with `timestamp`.
+
+        The estimate assumes a single, ordered partition: a record is late once the
+        watermark (the highest timestamp sent so far less WATERMARK_DELAY) has passed
+        the end of its window. With several shards the watermark is the minimum of
+        theirs, so fewer records are dropped.
+        """
+
+        self.records += 1
+        if self.max_timestamp is None or timestamp > self.max_timestamp:
+            self.max_timestamp = timestamp
+        window_end = timestamp - timestamp % WINDOW_SECONDS + WINDOW_SECONDS
+        if window_end <= self.max_timestamp - WATERMARK_DELAY:
+            self.expected_late += 1
+
+    def rows(self):
+        """Return the expected metric records, in the sink table's columns."""
+
+        rows = []
+        for metric_name, counts in self.metrics.items():
+            # KnockoutsBySpell and Purchases only report groups of more than one event
+            minimum = 2 if metric_name in ("KnockoutsBySpell", "Purchases") else 1
+            for key, count in sorted(counts.items()):
+                if count < minimum:
+                    continue
+                row = {
+                    "METRIC_NAME": metric_name,
+                    "METRIC_TIMESTAMP": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(key[0])),
+                    "METRIC_UNIT_VALUE_INT": count,
+                    "METRIC_UNIT": "Count",
+                    "METRIC_RESOLUTION": "1m",
+                    "DIMENSION_APPLICATION_ID": key[1],
+                    "DIMENSION_APP_VERSION": key[2],
+                }
+                if metric_name == "KnockoutsBySpell":
+                    row["DIMENSION_SPELL_ID"] = key[3]
+                elif metric_name == "Purchases":
+                    row["DIMENSION_CURRENCY_TYPE"] = key[3]
+                rows.append(row)
+        return rows
+
+    def write(self, path, injected=None):
+        """Write the expected metrics, totals and the injection settings and counts to `path` as JSON."""
+
+        totals = {metric_name: sum(counts.values()) for metric_name, counts in self.metrics.items()}
+        with open(path, "w") as file:
+            json.dump(
+                {
+                    "window_seconds": WINDOW_SECONDS,
+                    "watermark_delay_seconds": WATERMARK_DELAY,
+                    "distinct_events": self.events,
+                    "records_sent": self.records,
+                    "expected_late_records": self.expected_late,
+                    "distinct_events_by_metric": totals,
+                    "injected": injected or {},
+                    "metrics": self.rows(),
+                },
+                file,
+                indent=2,
+            )
+
+
+class DisorderInjector:
+    """Wraps an event source, making some events late or duplicated and skewing client clocks.
+
+    - `duplicate_rate` is the fraction of records sent that are duplicates.
+    - `late_rate` is the fraction of events delivered late, by a number of seconds
+      drawn from the `lateness` distribution ("exponential", "uniform" or "pareto")
+      with mean `mean_lateness`, capped at `max_lateness`.
+    - `clock_skew` is the standard deviation, in seconds, of the clock offset of each
+      client. Simulated events belong to their player's client; other events to one
+      of `clients` clients at random.
+
+    Events of sources that do not return ApplicationEvents belong to `application_id`.
+    Event timestamps are whole seconds, like the events the pipeline accepts.
+    """
+
+    def __init__(
+        self,
+        source,
+        duplicate_rate=0.0,
+        late_rate=0.0,
+        lateness=DEFAULT_LATENESS,
+        mean_lateness=DEFAULT_MEAN_LATENESS,
+        max_lateness=DEFAULT_MAX_LATENESS,
+        clock_skew=0.0,
+        clients=DEFAULT_CLIENTS,
+        seed=None,
+        truth=None,
+        application_id=None,
+    ):
+        if lateness not in LATENESS_DISTRIBUTIONS:
+            raise ValueError(f"Unknown lateness distribution {lateness}, expected one of {LATENESS_DISTRIBUTIONS}")
+        self.source = source
+        self.duplicate_rate = duplicate_rate
+        self.late_rate = late_rate
+        self.lateness = lateness
+        self.mean_lateness = mean_lateness
+        self.max_lateness = max_lateness
+        self.clock_skew = clock_skew
+        self.clients = clients
+        # A seed of its own, so that injection does not replay the source's random draws
+        self.random = random.Random(None if seed is None else f"disorder-{seed}")
+        self.truth = truth
+        self.application_id = application_id
+        self.recent = {}
+        self.skews = {}
+        self.duplicates = Counter()
+        self.late = 0
+        self.skewed = 0
+
+    def settings(self):
+        return {
+            "duplicate_rate": self.duplicate_rate,
+            "late_rate": self.late_rate,
+            "lateness": self.lateness,
+            "mean_lateness": self.mean_lateness,
+            "max_lateness": self.max_lateness,
+            "clock_skew": self.clock_skew,
+            "clients": self.clients,
+        }
+
+    def sample_lateness(self):
+        if self.lateness == "uniform":
+            delay = self.random.uniform(0, 2 * self.mean_lateness)
+        elif self.lateness == "pareto":
+            scale = self.mean_lateness * (PARETO_SHAPE - 1) / PARETO_SHAPE
+            delay = scale * self.random.paretovariate(PARETO_SHAPE)
+        else:
+            delay = self.random.expovariate(1 / self.mean_lateness)
+        return max(1, int(min(delay, self.max_lateness)))
+
+    def client_skew(self, event):
+        client = event["event_data"].get("user_id") if isinstance(event.get("event_data"), dict) else None
+        if client is None:
+            client = self.random.randrange(self.clients)
+        skew = self.skews.get(client)
+        if skew is None:
+            skew = self.skews[client] = int(round(self.random.gauss(0, self.clock_skew)))
+        return skew
+
+    def inject(self, events, application_id=None):
+        """Return the records to send in place of `events`, which all belong to `application_id`.
+
+        The same number of records is returned, so batches keep their size: a
+        duplicate takes the place of the fresh event that would have been sent.
+        """
+
+        recent = self.recent.get(application_id)
+        if recent is None:
+            recent = self.recent[application_id] = deque(maxlen=RECENT_EVENTS)
+        records = []
+        for event in events:
+            if recent and self.duplicate_rate and self.random.random() < self.duplicate_rate:
+                duplicate = recent[self.random.randrange(len(recent))]
+                self.duplicates[duplicate["event_type"]] += 1
+                if self.truth is not None:
+                    self.truth.sent(duplicate["event_timestamp"])
+                records.append(duplicate)
+                continue
+            if self.late_rate and self.random.random() < self.late_rate:
+                event["event_timestamp"] -= self.sample_lateness()
+                self.late += 1
+            # The ground truth is when the event happened, not what the client's clock said
+            if self.truth is not None:
+                self.truth.add(event, application_id)
+            if self.clock_skew:
+                skew = self.client_skew(event)
+                if skew:
+                    event["event_timestamp"] += skew
+                    self.skewed += 1
+            if self.truth is not None:
+                self.truth.sent(event["event_timestamp"])
+            recent.append(event)
+            records.append(event)
+        if isinstance(events, ApplicationEvents):
+            return ApplicationEvents(events.application_id, records)
+        return records
+
+    def generate_batch(self, count, now=None):
+        events = self.source.generate_batch(count, now)
+        return self.inject(events, getattr(events, "application_id", self.application_id))
+
+    def batches(self, batch_size):
+        """Yield batches of `batch_size` records indefinitely."""
+
+        while True:
+            yield self.generate_batch(batch_size)
+
+    def summary(self):
+        """Return the counts of injected disorder so far."""
+
+        return {
+            "late_events": self.late,
+            "skewed_events": self.skewed,
+            "clients_skewed": sum(1 for skew in self.skews.values() if skew),
+            "duplicates": sum(self.duplicates.values()),
+            "duplicates_by_event_type": dict(self.duplicates),
+        }
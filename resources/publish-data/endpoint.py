@@ -0,0 +1,384 @@
+######################################################################################################################
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this
+# software and associated documentation files (the "Software"), to deal in the Software
+# without restriction, including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so.
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+######################################################################################################################
+
+"""Local stand-in for the POST /applications/{application_id}/events endpoint.
+
+Requests are handled the way the deployed API handles them: the Authorization
+header is checked, every event in the body is validated against the event schema
+(a single invalid event fails the whole request with a 400, like the API Gateway
+request validator), and each event is wrapped in the same
+{"event": ..., "application_id": ...} record that the API puts on the events
+stream. Records are appended to a single NDJSON file, or to a Kinesis-like log of
+one NDJSON file per shard, with shards chosen from the MD5 hash of the event_id
+partition key as Kinesis does.
+
+With several processes, each process binds the same port with SO_REUSEPORT (so
+the kernel spreads connections between them) and writes its own files.
+"""
+
+import gzip
+import hashlib
+import json
+import multiprocessing
+import os
+import re
+import signal
+import socket
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from schema_validator import compile_schema
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+DEFAULT_PORT = 8080
+DEFAULT_SCHEMA_PATH = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)),
+    "..",
+    "..",
+    "business-logic",
+    "events-processing",
+    "config",
+    "event_schema.json",
+)
+WRITE_BUFFER_SIZE = 1024 * 1024
+# The whole request path, as the API only routes /applications/{application_id}/events
+EVENTS_PATH = re.compile(r"/applications/([^/]+)/events/?")
+
+
+def loads(body):
+    return orjson.loads(body) if orjson is not None else json.loads(body)
+
+
+def dumps(value):
+    if orjson is not None:
+        return orjson.dumps(value)
+    return json.dumps(value, separators=(",", ":")).encode("utf-8")
+
+
+def load_event_validator(schema_path=DEFAULT_SCHEMA_PATH):
+    """Compile the validator for a single event, from the event definition of the stream record schema."""
+
+    with open(schema_path) as file:
+        schema = json.load(file)
+    return compile_schema(schema["definitions"]["event"], schema, "event")
+
+
+class RecordLog:
+    """Appends stream records to a single NDJSON file."""
+
+    def __init__(self, path):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.lock = threading.Lock()
+        self.file = open(path, "ab", buffering=WRITE_BUFFER_SIZE)
+
+    def append(self, records):
+        """Append (partition_key, record_bytes) pairs."""
+
+        with self.lock:
+            self.file.write(b"".join(record + b"\n" for partition_key, record in records))
+
+    def flush(self):
+        with self.lock:
+            self.file.flush()
+
+    def close(self):
+        with self.lock:
+            self.file.close()
+
+
+class ShardLog:
+    """Appends stream records to one NDJSON file per shard, like a Kinesis stream with `shards` shards.
+
+    The 128-bit hash key space is split evenly between the shards, and a record
+    goes to the shard owning the MD5 hash of its partition key.
+    """
+
+    def __init__(self, directory, shards, suffix=""):
+        os.makedirs(directory, exist_ok=True)
+        self.lock = threading.Lock()
+        self.shards = shards
+        self.files = [
+            open(
+                os.path.join(directory, f"shard-{shard:05d}{suffix}.ndjson"),
+                "ab",
+                buffering=WRITE_BUFFER_SIZE,
+            )
+            for shard in range(0, shards)
+        ]
+
+    def shard(self, partition_key):
+        hash_key = int.from_bytes(hashlib.md5(partition_key.encode("utf-8")).digest(), "big")
+        return hash_key * self.shards >> 128
+
+    def append(self, records):
+        lines = [[] for shard in range(0, self.shards)]
+        for partition_key, record in records:
+            lines[self.shard(partition_key)].append(record + b"\n")
+        with self.lock:
+            for file, shard_lines in zip(self.files, lines):
+                if shard_lines:
+                    file.write(b"".join(shard_lines))
+
+    def flush(self):
+        with self.lock:
+            for file in self.files:
+                file.flush()
+
+    def close(self):
+        with self.lock:
+            for file in self.files:
+                file.close()
+
+
+class IngestCounters:
+    """Thread-safe request and record counters, with periodic ingest rate reports."""
+
+    def __init__(self, label):
+        self.label = label
+        self.lock = threading.Lock()
+        self.start = time.perf_counter()
+        self.requests = 0
+        self.records = 0
+        self.bytes = 0
+        self.rejected_requests = 0
+        self.unauthorized_requests = 0
+        self.interval_start = self.start
+        self.interval_records = 0
+        self.interval_requests = 0
+
+    def accepted(self, records, body_bytes):
+        with self.lock:
+            self.requests += 1
+            self.records += records
+            self.bytes += body_bytes
+            self.interval_requests += 1
+            self.interval_records += records
+
+    def rejected(self, unauthorized=False):
+        with self.lock:
+            self.requests += 1
+            self.interval_requests += 1
+            if unauthorized:
+                self.unauthorized_requests += 1
+            else:
+                self.rejected_requests += 1
+
+    def print_interval(self):
+        now = time.perf_counter()
+        with self.lock:
+            interval = now - self.interval_start
+            records, requests = self.interval_records, self.interval_requests
+            self.interval_start = now
+            self.interval_records = 0
+            self.interval_requests = 0
+        if requests:
+            print(
+                f"[{self.label}] {records / interval:,.0f} records/sec, {requests / interval:,.0f} requests/sec, "
+                f"{self.records:,} records stored, {self.rejected_requests} invalid and "
+                f"{self.unauthorized_requests} unauthorized requests"
+            )
+
+    def summary(self):
+        elapsed = time.perf_counter() - self.start
+        print("===========================================")
+        print(f"INGEST SUMMARY ({self.label}):")
+        print(f"- ELAPSED: {elapsed:.1f}s")
+        print(f"- RECORDS STORED: {self.records:,} ({self.records / elapsed if elapsed else 0:,.0f} records/sec)")
+        print(f"- REQUESTS: {self.requests:,}, {self.rejected_requests} invalid, {self.unauthorized_requests} unauthorized")
+        print(f"- REQUEST BODY BYTES: {self.bytes:,}")
+        print("===========================================\n")
+
+
+class EventsRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def respond(self, status, body):
+        payload = dumps(body)
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_POST(self):
+        server = self.server
+        body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        received = len(body)
+        match = EVENTS_PATH.fullmatch(self.path.split("?", 1)[0])
+        if not match:
+            server.counters.rejected()
+            return self.respond(404, {"message": "Not Found"})
+        application_id = match.group(1)
+
+        authorization = self.headers.get("Authorization")
+        if not authorization:
+            server.counters.rejected(unauthorized=True)
+            return self.respond(401, {"message": "Unauthorized"})
+        if authorization != server.api_key or (
+            server.application_ids and application_id not in server.application_ids
+        ):
+            server.counters.rejected(unauthorized=True)
+            return self.respond(
+                403, {"message": "User is not authorized to access this resource"}
+            )
+
+        try:
+            if self.headers.get("Content-Encoding") == "gzip":
+                body = gzip.decompress(body)
+            events = loads(body)["events"]
+            if not isinstance(events, list):
+                raise TypeError("events must be an array")
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            server.counters.rejected()
+            return self.respond(400, {"error": "BadRequest", "error_detail": f"Invalid request body: {e}"})
+
+        validate = server.validate_event
+        for index, event in enumerate(events):
+            error = validate(event, f"events[{index}]")
+            if error:
+                server.counters.rejected()
+                return self.respond(400, {"error": "BadRequest", "error_detail": error})
+
+        request_id = str(uuid.uuid4())
+        request_time = int(time.time() * 1000)
+        server.log.append(
+            [
+                (
+                    str(event["event_id"]),
+                    dumps(
+                        {
+                            "event": event,
+                            "aws_ga_api_validated_flag": True,
+                            "aws_ga_api_requestId": request_id,
+                            "aws_ga_api_requestTimeEpoch": request_time,
+                            "application_id": application_id,
+                        }
+                    ),
+                )
+                for event in events
+            ]
+        )
+        server.counters.accepted(len(events), received)
+        self.respond(
+            200,
+            {
+                "Total": len(events),
+                "FailedRecordCount": 0,
+                "Events": [{"Result": "Ok"}] * len(events),
+            },
+        )
+
+
+class EventsServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024
+
+    def __init__(self, address, reuse_port, api_key, application_ids, validate_event, log, counters):
+        self.reuse_port = reuse_port
+        self.api_key = api_key
+        self.application_ids = set(application_ids or [])
+        self.validate_event = validate_event
+        self.log = log
+        self.counters = counters
+        super().__init__(address, EventsRequestHandler)
+
+    def server_bind(self):
+        if self.reuse_port:
+            self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        super().server_bind()
+
+
+def serve(params, index=None):
+    """Run one endpoint process until interrupted. `index` numbers the process when there are several."""
+
+    label = "endpoint" if index is None else f"endpoint {index}"
+    suffix = "" if index is None else f"-{index}"
+    if params.get("shards"):
+        log = ShardLog(params["output"], params["shards"], suffix)
+    else:
+        root, extension = os.path.splitext(params["output"])
+        log = RecordLog(f"{root}{suffix}{extension}")
+    counters = IngestCounters(label)
+    server = EventsServer(
+        (params.get("host") or "127.0.0.1", params.get("port") or DEFAULT_PORT),
+        index is not None,
+        params["api_key"],
+        params.get("application_ids"),
+        load_event_validator(params.get("schema") or DEFAULT_SCHEMA_PATH),
+        log,
+        counters,
+    )
+    stopped = threading.Event()
+
+    def report():
+        while not stopped.wait(params.get("report_interval") or 5.0):
+            # Flushing here keeps readers tailing the log at most one interval behind
+            log.flush()
+            counters.print_interval()
+
+    def interrupt(signum, frame):
+        raise KeyboardInterrupt()
+
+    # Stop cleanly, flushing the log, when terminated as well as on Ctrl-C
+    signal.signal(signal.SIGTERM, interrupt)
+
+    threading.Thread(target=report, name="ingest-stats", daemon=True).start()
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stopped.set()
+        server.server_close()
+        log.close()
+        counters.summary()
+
+
+def run_endpoint(params):
+    """Serve events with params["processes"] processes (default one, in this process)."""
+
+    processes = params.get("processes") or 1
+    where = params["output"] + (f" ({params['shards']} shards)" if params.get("shards") else "")
+    print(
+        f"Accepting events on http://{params.get('host') or '127.0.0.1'}:{params.get('port') or DEFAULT_PORT}"
+        f"/applications/<APPLICATION_ID>/events, writing to {where}"
+    )
+    if processes == 1:
+        serve(params)
+        return
+    context = multiprocessing.get_context("spawn")
+    workers = [
+        context.Process(target=serve, args=(params, index), name=f"endpoint-{index}")
+        for index in range(0, processes)
+    ]
+    for worker in workers:
+        worker.start()
+    try:
+        for worker in workers:
+            worker.join()
+    except KeyboardInterrupt:
+        # Every process receives the interrupt and prints its own summary
+        for worker in workers:
+            worker.join()
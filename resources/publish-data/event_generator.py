@@ -0,0 +1,374 @@
+######################################################################################################################
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this
+# software and associated documentation files (the "Software"), to deal in the Software
+# without restriction, including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so.
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+######################################################################################################################
+
+"""Batched sample event generator.
+
+The per-type field distributions mirror getEvent() in handler.py, but every value
+pool and cumulative weight table is built once when the generator is created, and a
+whole batch of events is sampled per call with vectorized NumPy draws.
+"""
+
+import time
+
+import numpy as np
+
+DEFAULT_EVENT_VERSION = "1.0.0"
+
+# Relative frequency of each event type in the generated stream
+EVENT_TYPE_WEIGHTS = {
+    "user_registration": 0.04,
+    "user_knockout": 0.05,
+    "item_viewed": 0.18,
+    "iap_transaction": 0.02,
+    "login": 0.1,
+    "logout": 0.06,
+    "tutorial_progression": 0.04,
+    "user_rank_up": 0.03,
+    "matchmaking_start": 0.025,
+    "matchmaking_complete": 0.025,
+    "matchmaking_failed": 0.01,
+    "match_start": 0.03,
+    "match_end": 0.03,
+    "level_started": 0.08,
+    "level_completed": 0.08,
+    "level_failed": 0.08,
+    "lootbox_opened": 0.04,
+    "user_report": 0.04,
+    "user_sentiment": 0.04,
+    "client_latency": 0.05,
+}
+
+APP_VERSIONS = ["1.0.0", "1.1.0", "1.2.0"]
+APP_VERSION_WEIGHTS = [0.05, 0.80, 0.15]
+
+LEVELS = ["1", "2", "3", "4", "5"]
+COUNTRIES = [
+    "UNITED STATES",
+    "UK",
+    "JAPAN",
+    "SINGAPORE",
+    "AUSTRALIA",
+    "BRAZIL",
+    "SOUTH KOREA",
+    "GERMANY",
+    "CANADA",
+    "FRANCE",
+]
+COUNTRY_WEIGHTS = [0.3, 0.1, 0.2, 0.05, 0.05, 0.02, 0.15, 0.05, 0.03, 0.05]
+CURRENCIES = ["USD", "EUR", "YEN", "RMB"]
+PLATFORMS = ["nintendo_switch", "ps4", "xbox_360", "iOS", "android", "pc", "fb_messenger"]
+PLATFORM_WEIGHTS = [0.2, 0.1, 0.3, 0.15, 0.1, 0.05, 0.1]
+TUTORIAL_SCREENS = ["1_INTRO", "2_MOVEMENT", "3_WEAPONS", "4_FINISH"]
+MATCH_TYPES = ["1v1", "TEAM_DM_5v5", "CTF"]
+MATCHING_FAILED_MSG = ["timeout", "user_quit", "too_few_users"]
+MAPS = ["WAREHOUSE", "CASTLE", "AIRPORT"]
+GAME_RESULTS = ["WIN", "LOSE", "KICKED", "DISCONNECTED", "QUIT"]
+SPELLS = ["WATER", "EARTH", "FIRE", "AIR"]
+RANKS = ["1_BRONZE", "2_SILVER", "3_GOLD", "4_PLATINUM", "5_DIAMOND", "6_MASTER"]
+ITEM_RARITIES = ["COMMON", "UNCOMMON", "RARE", "LEGENDARY"]
+REPORT_REASONS = ["GRIEFING", "CHEATING", "AFK", "RACISM/HARASSMENT"]
+
+# Sizes of the randomly generated id pools, and the weights used when sampling them
+DEFAULT_POOL_SIZES = {"items": 10, "matches": 50, "servers": 3}
+ITEM_WEIGHTS = [0.125, 0.11, 0.35, 0.125, 0.04, 0.01, 0.07, 0.1, 0.05, 0.02]
+
+
+# Field samplers. Each one draws `count` values for a single event_data field.
+
+
+class Choice:
+    """Weighted choice from a fixed list of values."""
+
+    def __init__(self, values, weights=None):
+        self.values = np.array(values, dtype=object)
+        if weights is None:
+            weights = np.ones(len(values))
+        cumulative = np.cumsum(np.asarray(weights, dtype=float))
+        self.cumulative = cumulative / cumulative[-1]
+
+    def sample(self, rng, count, now):
+        indexes = np.searchsorted(self.cumulative, rng.random(count), side="right")
+        return self.values[np.minimum(indexes, len(self.values) - 1)].tolist()
+
+
+class Pool:
+    """Weighted choice from one of the generator's id pools, resolved at compile time."""
+
+    def __init__(self, name, weights=None):
+        self.name = name
+        self.weights = weights
+
+
+class RandInt:
+    """Uniform integer in the inclusive range [low, high]."""
+
+    def __init__(self, low, high):
+        self.low = low
+        self.high = high
+
+    def sample(self, rng, count, now):
+        return rng.integers(self.low, self.high + 1, size=count).tolist()
+
+
+class SecondsAgo:
+    """Epoch timestamp between `low` and `high` seconds before the batch was generated."""
+
+    def __init__(self, low, high):
+        self.low = low
+        self.high = high
+
+    def sample(self, rng, count, now):
+        return (now - rng.integers(self.low, self.high + 1, size=count)).tolist()
+
+
+class Const:
+    """The same value for every event."""
+
+    def __init__(self, value):
+        self.value = value
+
+    def sample(self, rng, count, now):
+        return [self.value] * count
+
+
+class NewUUID:
+    """A fresh random (version 4) UUID string per event."""
+
+    def sample(self, rng, count, now):
+        return random_uuids(rng, count)
+
+
+# event_data layout for every event type that the generator can emit
+EVENT_DATA_SPEC = {
+    "login": {
+        "platform": Choice(PLATFORMS, PLATFORM_WEIGHTS),
+        "last_login_time": SecondsAgo(40000, 4000000),
+    },
+    "logout": {"last_screen_seen": Const("the last screen")},
+    "client_latency": {
+        "latency": RandInt(40, 185),
+        "connected_server_id": Pool("servers"),
+        "region": Choice(COUNTRIES),
+    },
+    "user_registration": {
+        "country_id": Choice(COUNTRIES, COUNTRY_WEIGHTS),
+        "platform": Choice(PLATFORMS, PLATFORM_WEIGHTS),
+    },
+    "user_knockout": {
+        "match_id": Pool("matches"),
+        "map_id": Choice(MAPS, [0.6, 0.3, 0.1]),
+        "spell_id": Choice(SPELLS, [0.1, 0.4, 0.3, 0.2]),
+        "exp_gained": RandInt(1, 2),
+    },
+    "item_viewed": {
+        "item_id": Pool("items", ITEM_WEIGHTS),
+        "item_version": RandInt(1, 2),
+    },
+    "iap_transaction": {
+        "item_id": Pool("items", ITEM_WEIGHTS),
+        "item_version": RandInt(1, 2),
+        "item_amount": RandInt(1, 4),
+        "currency_type": Choice(CURRENCIES, [0.7, 0.15, 0.1, 0.05]),
+        "country_id": Choice(COUNTRIES, COUNTRY_WEIGHTS),
+        "currency_amount": RandInt(1, 10),
+        "transaction_id": NewUUID(),
+    },
+    "tutorial_progression": {
+        "tutorial_screen_id": Choice(TUTORIAL_SCREENS, [0.3, 0.3, 0.2, 0.2]),
+        "tutorial_screen_version": RandInt(1, 2),
+    },
+    "user_rank_up": {
+        "user_rank_reached": Choice(RANKS, [0.25, 0.35, 0.2, 0.15, 0.0499, 0.0001]),
+    },
+    "matchmaking_start": {
+        "match_id": Pool("matches"),
+        "match_type": Choice(MATCH_TYPES, [0.4, 0.3, 0.3]),
+    },
+    "matchmaking_complete": {
+        "match_id": Pool("matches"),
+        "match_type": Choice(MATCH_TYPES, [0.6, 0.2, 0.2]),
+        "matched_slots": RandInt(6, 9),
+    },
+    "matchmaking_failed": {
+        "match_id": Pool("matches"),
+        "match_type": Choice(MATCH_TYPES, [0.35, 0.2, 0.45]),
+        "matched_slots": RandInt(1, 9),
+        "matching_failed_msg": Choice(MATCHING_FAILED_MSG, [0.35, 0.2, 0.45]),
+    },
+    "match_start": {
+        "match_id": Pool("matches"),
+        "map_id": Choice(MAPS, [0.3, 0.3, 0.4]),
+    },
+    "match_end": {
+        "match_id": Pool("matches"),
+        "map_id": Choice(MAPS, [0.3, 0.3, 0.4]),
+        "match_result_type": Choice(GAME_RESULTS, [0.4, 0.4, 0.05, 0.05, 0.1]),
+        "exp_gained": RandInt(100, 199),
+        "most_used_spell": Choice(SPELLS, [0.1, 0.4, 0.2, 0.3]),
+    },
+    "level_started": {
+        "level_id": Choice(LEVELS, [0.2, 0.2, 0.2, 0.2, 0.2]),
+        "level_version": RandInt(1, 2),
+    },
+    "level_completed": {
+        "level_id": Choice(LEVELS, [0.6, 0.2, 0.12, 0.05, 0.03]),
+        "level_version": RandInt(1, 2),
+    },
+    "level_failed": {
+        "level_id": Choice(LEVELS, [0.001, 0.049, 0.05, 0.3, 0.6]),
+        "level_version": RandInt(1, 2),
+    },
+    "lootbox_opened": {
+        "lootbox_id": NewUUID(),
+        "lootbox_cost": RandInt(2, 5),
+        "item_rarity": Choice(ITEM_RARITIES, [0.5, 0.3, 0.17, 0.03]),
+        "item_id": Pool("items", ITEM_WEIGHTS),
+        "item_version": RandInt(1, 2),
+        "item_cost": RandInt(1, 5),
+    },
+    "user_report": {
+        "report_id": NewUUID(),
+        "report_reason": Choice(REPORT_REASONS, [0.2, 0.5, 0.1, 0.2]),
+    },
+    "user_sentiment": {"user_rating": RandInt(1, 5)},
+}
+
+
+def random_uuids(rng, count):
+    """Format `count` random version 4 UUID strings from a single draw of random bytes."""
+
+    digits = rng.bytes(16 * count).hex()
+    uuids = []
+    for offset in range(0, 32 * count, 32):
+        h = digits[offset : offset + 32]
+        uuids.append(
+            f"{h[:8]}-{h[8:12]}-4{h[13:16]}-{'89ab'[int(h[16], 16) & 3]}{h[17:20]}-{h[20:]}"
+        )
+    return uuids
+
+
+class EventGenerator:
+    """Samples batches of sample game events.
+
+    All id pools (items, matches, servers) and cumulative weight tables are built
+    once in the constructor. `generate_batch()` then draws the event type of every
+    event in the batch at once, and each event_data field once per event type.
+
+    `pool_weights` maps pool names to sampling weights, one per pool entry, that
+    replace the default weights of that pool; `app_version_weights` maps app
+    versions to weights.
+    """
+
+    def __init__(
+        self,
+        seed=None,
+        event_weights=None,
+        pool_sizes=None,
+        pool_weights=None,
+        app_version_weights=None,
+    ):
+        self.rng = np.random.default_rng(seed)
+        self.event_weights = dict(event_weights or EVENT_TYPE_WEIGHTS)
+        self.pools = {
+            name: random_uuids(self.rng, size)
+            for name, size in {**DEFAULT_POOL_SIZES, **(pool_sizes or {})}.items()
+        }
+        self.pool_weights = dict(pool_weights or {})
+        self.event_types = np.array(list(self.event_weights), dtype=object)
+        self.event_type_sampler = Choice(self.event_types, list(self.event_weights.values()))
+        if app_version_weights:
+            self.app_version_sampler = Choice(list(app_version_weights), list(app_version_weights.values()))
+        else:
+            self.app_version_sampler = Choice(APP_VERSIONS, APP_VERSION_WEIGHTS)
+        self.event_data_spec = {
+            event_type: self.compile_fields(EVENT_DATA_SPEC[event_type])
+            for event_type in self.event_weights
+        }
+
+    def compile_fields(self, fields):
+        """Resolve Pool references in an event_data spec into samplers over this generator's pools."""
+
+        compiled = {}
+        for name, sampler in fields.items():
+            if isinstance(sampler, Pool):
+                pool = self.pools[sampler.name]
+                weights = self.pool_weights.get(sampler.name, sampler.weights)
+                weights = weights if weights is not None and len(weights) == len(pool) else None
+                sampler = Choice(pool, weights)
+            compiled[name] = sampler
+        return compiled
+
+    def set_event_weights(self, event_weights):
+        """Switch to a new mix of event types, which must all be types the generator was created with."""
+
+        unknown = set(event_weights) - set(self.event_weights)
+        if unknown:
+            raise ValueError(f"The generator was not created with event types {sorted(unknown)}")
+        self.event_type_sampler = Choice(
+            self.event_types,
+            [event_weights.get(event_type, 0.0) for event_type in self.event_types.tolist()],
+        )
+
+    def generate_batch(self, count, now=None):
+        """Return a list of `count` complete events, timestamped `now` (default: the current time)."""
+
+        type_indexes = np.searchsorted(
+            self.event_type_sampler.cumulative, self.rng.random(count), side="right"
+        )
+        type_indexes = np.minimum(type_indexes, len(self.event_types) - 1)
+        return self.build_events(type_indexes, now)
+
+    def build_events(self, type_indexes, now=None):
+        """Return complete events of the given types, as indexes into `self.event_types`.
+
+        Callers that decide the event types themselves (such as the population
+        simulator) use this to sample every other field a batch at a time.
+        """
+
+        now = int(time.time()) if now is None else int(now)
+        type_indexes = np.asarray(type_indexes)
+        count = len(type_indexes)
+        event_ids = random_uuids(self.rng, count)
+        app_versions = self.app_version_sampler.sample(self.rng, count, now)
+
+        events = [None] * count
+        for type_index in np.unique(type_indexes).tolist():
+            positions = np.flatnonzero(type_indexes == type_index).tolist()
+            event_type = self.event_types[type_index]
+            fields = self.event_data_spec[event_type]
+            columns = [
+                sampler.sample(self.rng, len(positions), now) for sampler in fields.values()
+            ]
+            names = list(fields)
+            for row, position in enumerate(positions):
+                # Within the demo script the event_name is set same as event_type for simplicity.
+                event = {
+                    "event_version": DEFAULT_EVENT_VERSION,
+                    "event_id": event_ids[position],
+                    "event_type": event_type,
+                    "event_name": event_type,
+                    "event_timestamp": now,
+                    "app_version": app_versions[position],
+                    "event_data": {name: column[row] for name, column in zip(names, columns)},
+                }
+                events[position] = event
+        return events
+
+    def batches(self, batch_size):
+        """Yield batches of `batch_size` events indefinitely."""
+
+        while True:
+            yield self.generate_batch(batch_size)
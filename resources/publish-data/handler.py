@@ -22,27 +22,150 @@ from datetime import datetime
 import uuid
 import os
 import argparse
+import functools
+import sys
+import threading
 import requests
 
+from adaptive import (
+    AimdController,
+    DEFAULT_MAX_ATTEMPTS,
+    DEFAULT_MAX_CONCURRENCY,
+    DEFAULT_RETRY_QUEUE_SIZE,
+    DEFAULT_TARGET_LATENCY,
+    RetryPolicy,
+    RetryQueue,
+)
+from event_generator import EventGenerator
+from sender import (
+    APPLICATION_ID_PLACEHOLDER,
+    ConcurrentSender,
+    DEFAULT_CONCURRENCY,
+    DEFAULT_GZIP_LEVEL,
+    PayloadEncoder,
+    events_path,
+    failed_records,
+    rejected_record_count,
+)
+from scheduler import ARRIVALS, ARRIVAL_POISSON, OpenLoopScheduler, PacingMonitor, RateProfile
+from stats import DEFAULT_REPORT_INTERVAL, LoadStats
+from workers import run_workers
+from replay import read_events, replay_batches
+from disorder import (
+    DEFAULT_CLIENTS,
+    DEFAULT_LATENESS,
+    DEFAULT_MAX_LATENESS,
+    DEFAULT_MEAN_LATENESS,
+    DisorderInjector,
+    GroundTruth,
+    LATENESS_DISTRIBUTIONS,
+)
+from traffic import ProfiledSource, load_profile
+from kinesis_sender import KinesisSender, MAX_RECORDS_PER_CALL, PARTITION_EVENT_ID, PARTITION_KEYS
+from endpoint import DEFAULT_PORT, DEFAULT_SCHEMA_PATH, run_endpoint
+from simulator import DEFAULT_ITEMS, DEFAULT_PLAYERS, DEFAULT_SESSIONS, PopulationSimulator
+from corpus import (
+    CorpusReader,
+    DEFAULT_COMPRESSION_LEVEL,
+    DEFAULT_CORPUS_EVENTS_PER_SECOND,
+    DEFAULT_START_TIME,
+    write_corpus,
+)
+
 # Event Payload defaults
 DEFAULT_EVENT_VERSION = "1.0.0"
 DEFAULT_BATCH_SIZE = 100
 
 
-def parse_cmd_line():
+DEFAULT_BENCHMARK_EVENTS = 100000
+
+SUBCOMMANDS = ("send", "generate", "benchmark", "serve")
+
+
+def add_disorder_arguments(parser):
+    """Add the late, skewed and duplicate event injection options to a subcommand's parser."""
+
+    parser.add_argument(
+        "--duplicate-rate",
+        type=float,
+        dest="duplicate_rate",
+        default=0.0,
+        help="Fraction of the records sent that are duplicates of a recent event, as left by client retries.",
+    )
+    parser.add_argument(
+        "--late-rate",
+        type=float,
+        dest="late_rate",
+        default=0.0,
+        help="Fraction of events delivered late, with a timestamp behind the rest of the stream.",
+    )
+    parser.add_argument(
+        "--lateness",
+        choices=LATENESS_DISTRIBUTIONS,
+        dest="lateness",
+        default=DEFAULT_LATENESS,
+        help="Distribution of how many seconds late events are delivered.",
+    )
+    parser.add_argument(
+        "--mean-lateness",
+        type=float,
+        dest="mean_lateness",
+        default=DEFAULT_MEAN_LATENESS,
+        help="Mean seconds late events are delivered after they happened.",
+    )
+    parser.add_argument(
+        "--max-lateness",
+        type=float,
+        dest="max_lateness",
+        default=DEFAULT_MAX_LATENESS,
+        help="The most seconds an event is delivered late.",
+    )
+    parser.add_argument(
+        "--clock-skew",
+        type=float,
+        dest="clock_skew",
+        default=0.0,
+        help="Standard deviation, in seconds, of each client's clock offset. Simulated players are clients; "
+        "otherwise events are spread over --clients clients.",
+    )
+    parser.add_argument(
+        "--clients",
+        type=int,
+        dest="clients",
+        default=DEFAULT_CLIENTS,
+        help="Number of clients with their own clock skew, without --simulate.",
+    )
+    parser.add_argument(
+        "--ground-truth",
+        type=str,
+        dest="ground_truth",
+        default=None,
+        help="Write the metrics the Flink application should output, counting each distinct event once at "
+        "the time it happened, and the injected disorder, to this JSON file.",
+    )
+
+
+def parse_cmd_line(argv=None):
     """Parse the command line and extract the necessary values."""
 
-    parser = argparse.ArgumentParser(
+    argv = sys.argv[1:] if argv is None else list(argv)
+    # "send" is the default subcommand, so existing invocations keep working
+    if not argv or (argv[0] not in SUBCOMMANDS and argv[0] not in ("-h", "--help")):
+        argv = ["send"] + argv
+
+    main_parser = argparse.ArgumentParser(
         description="Send data to a the Game Analytics Pipeline. By default, the script "
         "will send events infinitely. If an input file is specified, the "
         "script will instead read and transmit all of the events contained "
         "in the file and then terminate."
     )
+    subparsers = main_parser.add_subparsers(dest="command")
 
-    # REQUIRED arguments
+    parser = subparsers.add_parser("send", help="Send generated events to the pipeline (default).")
+
+    # REQUIRED arguments (--api-path and --api-key unless sending directly with --kinesis-stream)
     parser.add_argument(
         "--api-path",
-        required=True,
         type=str,
         dest="api_path",
         help="The API base path to use when submitting events to the pipeline. There should be no trailing slash (/).",
@@ -50,7 +173,6 @@ def parse_cmd_line():
 
     parser.add_argument(
         "--api-key",
-        required=True,
         type=str,
         dest="api_key",
         help="The value of the API key used to authorize events sent to the stream.",
@@ -61,18 +183,443 @@ def parse_cmd_line():
         required=True,
         type=str,
         dest="application_id",
-        help="The application_id to use when submitting events to ths stream (i.e. You can use the default application for testing).",
+        help="The application_id to use when submitting events to ths stream (i.e. You can use the default application for testing). "
+        "With --simulate, a comma separated list of application ids that the API key is authorized for.",
     )
     # OPTIONAL arguments
     parser.add_argument(
+        "--batch-size",
+        type=int,
+        dest="batch_size",
+        default=None,
+        help=f"The number of events to send in each request to the events API (default {DEFAULT_BATCH_SIZE}), "
+        f"or in each batch written with --kinesis-stream (default {MAX_RECORDS_PER_CALL}, the PutRecords limit).",
+    )
+    parser.add_argument(
+        "--kinesis-stream",
+        type=str,
+        dest="kinesis_stream",
+        default=None,
+        help="Write events directly to this Kinesis data stream (name or ARN) with PutRecords, bypassing the API. "
+        "Uses the default AWS credentials.",
+    )
+    parser.add_argument(
+        "--region",
+        type=str,
+        dest="region",
+        default=None,
+        help="The AWS region of --kinesis-stream. Defaults to the configured region.",
+    )
+    parser.add_argument(
+        "--endpoint-url",
+        type=str,
+        dest="endpoint_url",
+        default=None,
+        help="Send PutRecords to this endpoint instead of the regional Kinesis endpoint, e.g. a local emulator.",
+    )
+    parser.add_argument(
+        "--partition-key",
+        choices=PARTITION_KEYS,
+        dest="partition_key",
+        default=PARTITION_EVENT_ID,
+        help="How --kinesis-stream records are partitioned: by event id as the API does, by a random key, "
+        "by player (user_id, with --simulate), by application (a hot shard per application), or balanced "
+        "round-robin over the open shards with explicit hash keys.",
+    )
+    parser.add_argument(
+        "--input-file",
+        type=str,
+        dest="input_file",
+        default=None,
+        help="Replay the events in this NDJSON (or gzip compressed .gz NDJSON) capture instead of "
+        "generating events, then terminate.",
+    )
+    parser.add_argument(
+        "--corpus",
+        type=str,
+        dest="corpus",
+        default=None,
+        help="Send the pre-built request bodies in this corpus file (see the generate subcommand) "
+        "instead of generating events. The corpus batch size replaces --batch-size.",
+    )
+    parser.add_argument(
+        "--start-chunk",
+        type=int,
+        dest="start_chunk",
+        default=0,
+        help="The corpus chunk (batch) to start sending from.",
+    )
+    parser.add_argument(
+        "--loop",
+        action="store_true",
+        dest="loop",
+        help="Start over from the beginning of the corpus when it runs out.",
+    )
+    parser.add_argument(
+        "--replay-speed",
+        type=float,
+        dest="replay_speed",
+        default=1.0,
+        help="Replay speed-up factor relative to the original event timestamps. "
+        "Use 0 to replay as fast as possible.",
+    )
+    parser.add_argument(
+        "--rewrite-timestamps",
+        action="store_true",
+        dest="rewrite_timestamps",
+        help="Shift replayed event timestamps so that the capture starts now.",
+    )
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        dest="concurrency",
+        default=None,
+        help="Send continuously with this many batches in flight over pooled keep-alive connections, "
+        "instead of pausing between batches.",
+    )
+    parser.add_argument(
+        "--events-per-second",
+        type=float,
+        dest="events_per_second",
+        default=None,
+        help="Send open-loop at this target rate, on a fixed schedule regardless of response times.",
+    )
+    parser.add_argument(
+        "--ramp-up",
+        type=float,
+        dest="ramp_up",
+        default=0,
+        help="Seconds over which to ramp linearly from zero to --events-per-second.",
+    )
+    parser.add_argument(
+        "--ramp-profile",
+        type=str,
+        dest="ramp_profile",
+        default=None,
+        help="Piecewise-linear target rate as comma separated seconds:events_per_second points, "
+        'e.g. "0:1000,60:20000,600:20000". Overrides --events-per-second and --ramp-up.',
+    )
+    parser.add_argument(
+        "--arrival",
+        choices=ARRIVALS,
+        dest="arrival",
+        default=ARRIVAL_POISSON,
+        help="Arrival process for batches in target-rate mode: Poisson, or evenly spaced (token bucket).",
+    )
+    parser.add_argument(
+        "--simulate",
+        action="store_true",
+        dest="simulate",
+        help="Generate events from a simulated population of players, each playing sessions of "
+        "registration, login, matchmaking, matches and logout, instead of sampling events independently.",
+    )
+    parser.add_argument(
+        "--applications",
+        type=int,
+        dest="applications",
+        default=None,
+        help="Number of applications to spread the simulated players over. Ids beyond those given with "
+        "--application-id are generated, and need an endpoint that accepts any application.",
+    )
+    parser.add_argument(
+        "--players",
+        type=int,
+        dest="players",
+        default=DEFAULT_PLAYERS,
+        help="Size of the simulated player population (user_id cardinality).",
+    )
+    parser.add_argument(
+        "--sessions",
+        type=int,
+        dest="sessions",
+        default=DEFAULT_SESSIONS,
+        help="Number of concurrent simulated player sessions.",
+    )
+    parser.add_argument(
+        "--items",
+        type=int,
+        dest="items",
+        default=DEFAULT_ITEMS,
+        help="Number of distinct item ids in the simulation.",
+    )
+    parser.add_argument(
+        "--profile",
+        type=str,
+        dest="profile",
+        default=None,
+        help="A YAML or JSON traffic profile of application, app version and item skew, "
+        "time-varying event mixes and bursts.",
+    )
+    parser.add_argument(
+        "--adaptive",
+        action="store_true",
+        dest="adaptive",
+        help="Search for the API's maximum sustainable throughput: grow the batch size and batches in "
+        "flight while responses are fast, and back off on throttling, server errors or high latency.",
+    )
+    parser.add_argument(
+        "--max-concurrency",
+        type=int,
+        dest="max_concurrency",
+        default=DEFAULT_MAX_CONCURRENCY,
+        help="The most batches --adaptive keeps in flight (per worker). --concurrency sets where it starts.",
+    )
+    parser.add_argument(
+        "--target-latency",
+        type=float,
+        dest="target_latency",
+        default=DEFAULT_TARGET_LATENCY,
+        help="Seconds of p90 request latency above which --adaptive backs off.",
+    )
+    parser.add_argument(
+        "--max-attempts",
+        type=int,
+        dest="max_attempts",
+        default=DEFAULT_MAX_ATTEMPTS,
+        help="Times a throttled or failed batch is sent before its records are dropped. "
+        "Retries wait a jittered, exponentially growing backoff.",
+    )
+    parser.add_argument(
+        "--retry-queue-size",
+        type=int,
+        dest="retry_queue_size",
+        default=None,
+        help=f"The most batches --adaptive holds for retry; further failed batches are dropped "
+        f"(default {DEFAULT_RETRY_QUEUE_SIZE}). Other send modes retry each batch on its own sender thread.",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        dest="workers",
+        default=1,
+        help="Number of worker processes. Each generates and sends its share of the target rate "
+        "(or runs its own --concurrency batches in flight), and their stats are merged into one report.",
+    )
+    parser.add_argument(
+        "--duration",
+        type=float,
+        dest="duration",
+        default=None,
+        help="Stop sending after this many seconds. By default the script sends indefinitely.",
+    )
+    parser.add_argument(
+        "--gzip",
+        action="store_true",
+        dest="gzip",
+        help="Gzip compress request bodies and send them with a Content-Encoding: gzip header. "
+        "The API must have payload compression enabled.",
+    )
+    parser.add_argument(
+        "--gzip-level",
+        type=int,
+        dest="gzip_level",
+        default=DEFAULT_GZIP_LEVEL,
+        help="Compression level (1-9) used with --gzip.",
+    )
+    parser.add_argument(
+        "--report-interval",
+        type=float,
+        dest="report_interval",
+        default=DEFAULT_REPORT_INTERVAL,
+        help="Seconds between rolling throughput and latency summaries.",
+    )
+    parser.add_argument(
+        "--report-file",
+        type=str,
+        dest="report_file",
+        default=None,
+        help="Write the final throughput, latency and status code report to this file as JSON.",
+    )
+    parser.add_argument(
+        "--seed",
+        type=int,
+        dest="seed",
+        default=None,
+        help="Seed for the event generator's random number generator.",
+    )
+    add_disorder_arguments(parser)
+
+    generate_parser = subparsers.add_parser(
+        "generate",
+        help="Write a deterministic, pre-generated event corpus for the send --corpus option.",
+    )
+    generate_parser.add_argument(
+        "--output",
+        required=True,
+        type=str,
+        dest="output",
+        help="The corpus file to write.",
+    )
+    generate_parser.add_argument(
+        "--seed",
+        required=True,
+        type=int,
+        dest="seed",
+        help="Seed for the event generator. The same arguments always produce the same corpus.",
+    )
+    generate_parser.add_argument(
+        "--events",
+        required=True,
+        type=int,
+        dest="events",
+        help="The number of events to generate.",
+    )
+    generate_parser.add_argument(
         "--batch-size",
         type=int,
         dest="batch_size",
         default=DEFAULT_BATCH_SIZE,
-        help="The number of events to send at once using the Kinesis PutRecords API.",
+        help="The number of events in each pre-built request body (chunk).",
+    )
+    generate_parser.add_argument(
+        "--start-time",
+        type=int,
+        dest="start_time",
+        default=DEFAULT_START_TIME,
+        help="Epoch timestamp of the first event.",
+    )
+    generate_parser.add_argument(
+        "--events-per-second",
+        type=float,
+        dest="events_per_second",
+        default=DEFAULT_CORPUS_EVENTS_PER_SECOND,
+        help="Rate at which event timestamps advance from --start-time.",
+    )
+    generate_parser.add_argument(
+        "--compression-level",
+        type=int,
+        dest="compression_level",
+        default=DEFAULT_COMPRESSION_LEVEL,
+        help="zlib compression level (1-9) for the corpus chunks.",
+    )
+    add_disorder_arguments(generate_parser)
+
+    benchmark_parser = subparsers.add_parser(
+        "benchmark",
+        help="Compare the events/sec of the batched event generator against generate_event().",
+    )
+    benchmark_parser.add_argument(
+        "--events",
+        type=int,
+        dest="events",
+        default=DEFAULT_BENCHMARK_EVENTS,
+        help="The number of events to generate with each generator.",
+    )
+    benchmark_parser.add_argument(
+        "--batch-size",
+        type=int,
+        dest="batch_size",
+        default=DEFAULT_BATCH_SIZE,
+        help="The number of events the batched generator produces per call.",
+    )
+
+    serve_parser = subparsers.add_parser(
+        "serve",
+        help="Run a local stand-in for the events endpoint, for load tests without a deployed API.",
+    )
+    serve_parser.add_argument(
+        "--api-key",
+        required=True,
+        type=str,
+        dest="api_key",
+        help="The Authorization header value that requests must carry.",
+    )
+    serve_parser.add_argument(
+        "--output",
+        required=True,
+        type=str,
+        dest="output",
+        help="NDJSON file to append the accepted stream records to, or a directory with --shards.",
+    )
+    serve_parser.add_argument(
+        "--shards",
+        type=int,
+        dest="shards",
+        default=None,
+        help="Write a Kinesis-like log with one NDJSON file per shard, chosen by the event_id partition key.",
+    )
+    serve_parser.add_argument(
+        "--application-id",
+        type=str,
+        dest="application_id",
+        default=None,
+        help="Comma separated application ids that the API key is authorized for. By default, any.",
+    )
+    serve_parser.add_argument(
+        "--host",
+        type=str,
+        dest="host",
+        default="127.0.0.1",
+        help="The address to listen on.",
+    )
+    serve_parser.add_argument(
+        "--port",
+        type=int,
+        dest="port",
+        default=DEFAULT_PORT,
+        help="The port to listen on.",
+    )
+    serve_parser.add_argument(
+        "--processes",
+        type=int,
+        dest="processes",
+        default=1,
+        help="Number of server processes sharing the port (Linux SO_REUSEPORT), each writing its own files.",
+    )
+    serve_parser.add_argument(
+        "--schema",
+        type=str,
+        dest="schema",
+        default=DEFAULT_SCHEMA_PATH,
+        help="The stream record JSON Schema whose event definition events are validated against.",
+    )
+    serve_parser.add_argument(
+        "--report-interval",
+        type=float,
+        dest="report_interval",
+        default=DEFAULT_REPORT_INTERVAL,
+        help="Seconds between ingest rate reports.",
     )
 
-    return parser.parse_args()
+    args = main_parser.parse_args(argv)
+    if args.command == "send" and not args.kinesis_stream and not (args.api_path and args.api_key):
+        main_parser.error("--api-path and --api-key are required unless sending with --kinesis-stream")
+    if args.command == "send" and args.kinesis_stream and (args.adaptive or args.gzip):
+        main_parser.error("--kinesis-stream cannot be combined with --adaptive or --gzip")
+    if args.command == "send" and args.input_file:
+        if args.events_per_second or args.ramp_profile or args.workers > 1 or args.corpus:
+            main_parser.error(
+                "--input-file cannot be combined with --corpus, --events-per-second, --ramp-profile or --workers"
+            )
+    if args.command == "send" and (args.input_file or args.corpus) and disorder_requested(vars(args)):
+        main_parser.error(
+            "Late, skewed and duplicate events are injected when generating events: use the options with "
+            "the generate subcommand to build them into a corpus"
+        )
+    if args.command == "send" and args.profile:
+        try:
+            rate_profile(vars(args), load_profile(args.profile))
+        except (OSError, ValueError, RuntimeError) as e:
+            main_parser.error(f"Invalid traffic profile {args.profile}: {e}")
+    if args.command == "send" and args.ramp_profile:
+        try:
+            RateProfile.parse(args.ramp_profile)
+        except ValueError as e:
+            main_parser.error(f"Invalid --ramp-profile {args.ramp_profile}: {e}")
+    if args.command == "send" and args.duration is None:
+        profile = rate_profile(vars(args), load_profile(args.profile) if args.profile else None)
+        if profile is not None and profile.ends():
+            main_parser.error("The rate profile ends at rate 0, which needs a --duration to stop the run")
+    if args.command == "send" and (args.simulate or args.profile) and (args.input_file or args.corpus):
+        main_parser.error("--simulate and --profile cannot be combined with --corpus or --input-file")
+    if args.command == "send" and args.retry_queue_size is not None and not args.adaptive:
+        main_parser.error("--retry-queue-size only applies to --adaptive")
+    if args.command == "send" and args.adaptive:
+        if args.events_per_second or args.ramp_profile or args.input_file or args.corpus:
+            main_parser.error(
+                "--adaptive cannot be combined with --corpus, --input-file, --events-per-second or --ramp-profile"
+            )
+    return args
 
 
 # Returns array of UUIDS. Used for generating sets of random event data
@@ -459,6 +1006,8 @@ def getEvent(event_type):
 
 
 # Take an event type, get event data for it and then merge that event-specific data with the default event fields to create a complete event
+# Reference single-event generator. Superseded by event_generator.EventGenerator for sending,
+# and kept as the baseline for the "benchmark" subcommand.
 def generate_event():
     event_type = getEventType()
     # Within the demo script the event_name is set same as event_type for simplicity.
@@ -482,58 +1031,736 @@ def generate_event():
     return event
 
 
-def send_record_batch(api_path, api_key, raw_records):
-    """Send a batch of records to Amazon Kinesis."""
+def send_record_batch(
+    api_path, api_key, raw_records, stats=None, encoder=None, retry_policy=None
+):
+    """Send a batch of records to Amazon Kinesis, retrying throttled and failed requests."""
 
+    api_path = events_path(api_path, raw_records)
     # Translate input records into the format needed by API
-    payload = {"events": raw_records}
+    batch = (encoder or PayloadEncoder()).encode(raw_records)
     headers = {"Content-Type": "application/json", "Authorization": api_key}
+    if batch.content_encoding:
+        headers["Content-Encoding"] = batch.content_encoding
 
-    response = requests.post(api_path, json=payload, headers=headers)
-    if response.status_code == 200:
-        print(f"Successfully sent {len(raw_records)} records to endpoint {api_path}.")
-    else:
-        print(
-            f"Failed to send events to endpoint {api_path} with status code {response.status_code}."
-        )
-        print(response.json())
-        print(response.reason)
+    attempt = 1
+    while True:
+        started_at = time.perf_counter()
+        try:
+            response = SESSION.post(api_path, data=batch.body, headers=headers)
+            status = response.status_code
+        except requests.RequestException as e:
+            print(f"Failed to send events to endpoint {api_path}: {e}")
+            response = None
+            status = type(e).__name__
+        if stats is not None:
+            elapsed = time.perf_counter() - started_at
+            stats.record_response(
+                elapsed,
+                elapsed,
+                status,
+                len(raw_records),
+                rejected_record_count(response, len(raw_records)),
+                len(batch.body),
+            )
+        if status == 200:
+            print(f"Successfully sent {len(raw_records)} records to endpoint {api_path}.")
+            return response
+        if response is not None:
+            print(
+                f"Failed to send events to endpoint {api_path} with status code {response.status_code}."
+            )
+            print(response.text)
 
+        if (
+            retry_policy is None
+            or not retry_policy.retryable(status)
+            or attempt >= retry_policy.max_attempts
+        ):
+            if stats is not None:
+                stats.record_drop(len(raw_records))
+            return response
+        delay = retry_policy.delay(attempt)
+        print(f"Retrying in {delay:.1f}s")
+        if stats is not None:
+            stats.record_retry(len(raw_records))
+        time.sleep(delay)
+        attempt += 1
 
-def send_events_bulk(api_path, api_key, batch_size):
+
+def send_events_bulk(
+    api_path,
+    api_key,
+    batch_size,
+    duration=None,
+    seed=None,
+    stats=None,
+    encoder=None,
+    retry_policy=None,
+    generator=None,
+):
     """Send a batches of randomly generated events to Amazon Kinesis."""
 
-    while range(0, 100):
-        records = []
+    generator = generator or EventGenerator(seed=seed)
+    deadline = None if duration is None else time.perf_counter() + duration
+    while deadline is None or time.perf_counter() < deadline:
         # Create a batch of random events to send
-        for i in range(0, batch_size):
-            event_dict = generate_event()
-            records.append(event_dict)
-        send_record_batch(api_path, api_key, records)
+        records = generator.generate_batch(batch_size)
+        send_record_batch(api_path, api_key, records, stats, encoder, retry_policy)
         time.sleep(random.randint(1, 7))
 
 
+def send_events_concurrent(
+    api_path,
+    api_key,
+    batches,
+    concurrency,
+    duration=None,
+    stats=None,
+    encoder=None,
+    sender_factory=None,
+):
+    """Send batches of events with `concurrency` batches in flight.
+
+    `batches` is an iterator of event lists or EncodedBatch bodies, e.g. from
+    EventGenerator.batches() or CorpusReader.batches(). `sender_factory` creates
+    the sender from the concurrency and ConcurrentSender's keyword arguments; it
+    defaults to a ConcurrentSender posting to `api_path`.
+    """
+
+    sender_factory = sender_factory or functools.partial(ConcurrentSender, api_path, api_key)
+    sender = sender_factory(
+        concurrency,
+        stats=stats,
+        verbose=stats is None,
+        encoder=encoder,
+    )
+    deadline = None if duration is None else time.perf_counter() + duration
+    try:
+        for batch in batches:
+            if deadline is not None and time.perf_counter() >= deadline:
+                break
+            sender.submit(batch)
+    finally:
+        sender.close()
+
+
+def send_events_adaptive(
+    api_path,
+    api_key,
+    generator,
+    controller,
+    retry_policy,
+    retry_queue,
+    duration=None,
+    stats=None,
+    encoder=None,
+):
+    """Send generated events closed-loop, with the batch size and batches in flight set by `controller`.
+
+    Throttled and failed batches, and the rejected records of partially successful
+    batches, are retried through `retry_queue` after the `retry_policy` backoff.
+    Records that run out of attempts, do not fit in the queue, or are still queued
+    when sending stops are dropped.
+    """
+
+    stats = stats or LoadStats()
+    sender = ConcurrentSender(
+        api_path,
+        api_key,
+        controller.max_concurrency,
+        bounded=False,
+        stats=stats,
+        verbose=False,
+        encoder=encoder,
+        log_failures=False,
+    )
+    in_flight = threading.Condition()
+    in_flight_count = 0
+
+    def completed(records, attempt, started_at, future):
+        nonlocal in_flight_count
+        try:
+            response = future.result()
+            latency = time.perf_counter() - started_at
+            if response is not None and response.status_code == 200:
+                rejected = rejected_record_count(response, len(records))
+                controller.observe(latency, len(records) - rejected, rejected > 0)
+                retry = failed_records(response, records) if rejected else []
+                if retry is None:
+                    # Resending the whole batch would duplicate its accepted records
+                    stats.record_drop(rejected)
+                    retry = []
+            elif response is None or retry_policy.retryable(response.status_code):
+                controller.observe(latency, 0, True)
+                retry = records
+            else:
+                print(
+                    f"Failed to send events to endpoint {api_path} with status code "
+                    f"{response.status_code}, not retrying: {response.text}"
+                )
+                controller.observe(latency, 0, False)
+                stats.record_drop(len(records))
+                retry = []
+            if retry:
+                due = time.perf_counter() + retry_policy.delay(attempt)
+                if attempt < retry_policy.max_attempts and retry_queue.push(
+                    due, retry, attempt + 1
+                ):
+                    stats.record_retry(len(retry))
+                else:
+                    stats.record_drop(len(retry))
+        finally:
+            with in_flight:
+                in_flight_count -= 1
+                in_flight.notify()
+
+    deadline = None if duration is None else time.perf_counter() + duration
+    try:
+        while deadline is None or time.perf_counter() < deadline:
+            with in_flight:
+                while in_flight_count >= controller.concurrency:
+                    in_flight.wait(0.1)
+                in_flight_count += 1
+            controller.maybe_adjust()
+            if controller.pause:
+                time.sleep(controller.pause)
+            retry = retry_queue.pop_due(time.perf_counter())
+            if retry is None:
+                records, attempt = generator.generate_batch(controller.batch_size), 1
+            else:
+                records, attempt = retry
+            future = sender.submit(records)
+            future.add_done_callback(
+                functools.partial(completed, records, attempt, time.perf_counter())
+            )
+    finally:
+        sender.close()
+        abandoned = sum(len(records) for records, attempt in retry_queue.drain())
+        if abandoned:
+            print(f"Dropped {abandoned} records still waiting to be retried")
+            stats.record_drop(abandoned)
+        controller.summary()
+
+
+def send_events_at_rate(
+    api_path,
+    api_key,
+    batches,
+    batch_size,
+    profile,
+    concurrency,
+    arrival=ARRIVAL_POISSON,
+    duration=None,
+    seed=None,
+    stats=None,
+    worker_label=None,
+    encoder=None,
+    sender_factory=None,
+):
+    """Send batches of events open-loop, following a target rate profile.
+
+    `batches` is an iterator of event lists or EncodedBatch bodies of `batch_size`
+    events each; sending stops early if it runs out.
+    """
+
+    scheduler = OpenLoopScheduler(profile, batch_size, arrival, seed)
+    start = time.perf_counter()
+    # Workers only print pacing warnings; their throughput is reported by the parent
+    monitor = PacingMonitor(profile, start, label=worker_label, verbose=worker_label is None)
+    sender_factory = sender_factory or functools.partial(ConcurrentSender, api_path, api_key)
+    sender = sender_factory(
+        concurrency,
+        bounded=False,
+        monitor=monitor,
+        stats=stats,
+        verbose=False,
+        encoder=encoder,
+    )
+    exhausted = False
+    try:
+        for scheduled_at in scheduler.schedule(start, duration):
+            delay = scheduled_at - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            elif duration is not None and time.perf_counter() - start >= duration:
+                break
+            batch = next(batches, None)
+            if batch is None:
+                exhausted = True
+                break
+            sender.submit(batch, scheduled_at)
+            monitor.maybe_report()
+        else:
+            # A profile ending at rate 0 before the duration has scheduled all of its batches: let them finish
+            exhausted = profile.ends() and (duration is None or profile.end <= duration)
+    finally:
+        # Batches still queued when the run is cut short were never started, and are reported as such
+        sender.close(cancel_pending=not exhausted)
+        monitor.summary(duration)
+
+
+def replay_file(
+    api_path,
+    api_key,
+    input_file,
+    batch_size,
+    speed,
+    concurrency,
+    rewrite_timestamps=False,
+    stats=None,
+    encoder=None,
+    sender_factory=None,
+):
+    """Stream the events in a capture file to the pipeline, paced by their original timestamps."""
+
+    errors = []
+    start = time.perf_counter()
+    rebase_to = time.time() if rewrite_timestamps else None
+    # Paced replays are open-loop; unpaced replays send as fast as the in-flight limit allows
+    sender_factory = sender_factory or functools.partial(ConcurrentSender, api_path, api_key)
+    sender = sender_factory(
+        concurrency,
+        bounded=not speed,
+        stats=stats,
+        verbose=False,
+        encoder=encoder,
+    )
+    replayed = 0
+    try:
+        for due, batch in replay_batches(
+            read_events(input_file, errors), batch_size, speed, rebase_to
+        ):
+            scheduled_at = start + due
+            delay = scheduled_at - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            sender.submit(batch, scheduled_at if speed else None)
+            replayed += len(batch)
+    finally:
+        sender.close()
+        print(f"Replayed {replayed} events from {input_file}")
+        if errors:
+            print(f"Skipped {len(errors)} malformed lines, first at line {errors[0]}")
+
+
+def generate_corpus(params):
+    """Write a corpus file and print a summary of it."""
+
+    start = time.perf_counter()
+    # The corpus is not tied to an application, so neither are its ground-truth metrics
+    injector = disorder_injector(params, None, params["seed"])
+    index = write_corpus(
+        params["output"],
+        params["seed"],
+        params["events"],
+        params["batch_size"],
+        params["start_time"],
+        params["events_per_second"],
+        params["compression_level"],
+        injector,
+    )
+    elapsed = time.perf_counter() - start
+    size = os.path.getsize(params["output"])
+    print("===========================================")
+    print("CORPUS:")
+    print(f"- FILE: {params['output']}")
+    print(f"- EVENTS: {index['event_count']} in {len(index['chunks'])} chunks")
+    print(f"- SIZE: {size:,} bytes ({size / max(index['event_count'], 1):.1f} bytes/event)")
+    print(f"- GENERATED IN: {elapsed:.1f}s")
+    print("===========================================\n")
+    if injector is not None:
+        finish_disorder(injector, params.get("ground_truth"))
+
+
+def benchmark_generators(event_count, batch_size):
+    """Measure events/sec of generate_event() and of EventGenerator.generate_batch()."""
+
+    start = time.perf_counter()
+    for i in range(0, event_count):
+        generate_event()
+    legacy_elapsed = time.perf_counter() - start
+
+    generator = EventGenerator()
+    batches = []
+    start = time.perf_counter()
+    remaining = event_count
+    while remaining > 0:
+        batches.append(generator.generate_batch(min(batch_size, remaining)))
+        remaining -= batch_size
+    batched_elapsed = time.perf_counter() - start
+
+    legacy_rate = event_count / legacy_elapsed
+    batched_rate = event_count / batched_elapsed
+    print("===========================================")
+    print("GENERATOR BENCHMARK:")
+    print(f"- EVENTS: {event_count}")
+    print(f"- generate_event(): {legacy_rate:,.0f} events/sec")
+    print(f"- EventGenerator (batch size {batch_size}): {batched_rate:,.0f} events/sec")
+    print(f"- SPEEDUP: {batched_rate / legacy_rate:.1f}x")
+    print("===========================================\n")
+
+    encoders = {
+        "json.dumps (requests json=)": lambda records: json.dumps({"events": records}).encode(
+            "utf-8"
+        ),
+        "PayloadEncoder": lambda records: PayloadEncoder().encode(records).body,
+        "PayloadEncoder --gzip": lambda records: PayloadEncoder(True).encode(records).body,
+    }
+    print("===========================================")
+    print("PAYLOAD ENCODING BENCHMARK:")
+    for name, encode in encoders.items():
+        start = time.perf_counter()
+        body_bytes = sum(len(encode(records)) for records in batches)
+        elapsed = time.perf_counter() - start
+        print(
+            f"- {name}: {event_count / elapsed:,.0f} events/sec, "
+            f"{body_bytes / event_count:.1f} bytes/event on the wire"
+        )
+    print("===========================================\n")
+
+
 def send_data(params):
     api_path = params["api_path"]
     api_key = params["api_key"]
-    batch_size = params["batch_size"] or DEFAULT_BATCH_SIZE
-    application_id = params["application_id"]
-    # omit trailing slash
-    api_full_path = (
-        f"{api_path}/applications/{application_id}/events"
-        if api_path[-1] != "/"
-        else f"{api_path}applications/{application_id}/events"
+    traffic_profile = load_profile(params["profile"]) if params.get("profile") else None
+    params["application_ids"] = application_ids(params, traffic_profile)
+    # Simulated players of several applications post to their own application's endpoint
+    application_id = (
+        params["application_ids"][0]
+        if len(params["application_ids"]) == 1
+        else APPLICATION_ID_PLACEHOLDER
     )
+    if params.get("kinesis_stream"):
+        api_full_path = None
+    elif api_path[-1] != "/":
+        # omit trailing slash
+        api_full_path = f"{api_path}/applications/{application_id}/events"
+    else:
+        api_full_path = f"{api_path}applications/{application_id}/events"
 
     print("===========================================")
     print("CONFIGURATION PARAMETERS:")
-    print("- FULL_API_PATH: " + api_full_path)
-    print("- API_KEY: " + api_key)
-    print("- APPLICATION_ID: " + application_id)
+    if api_full_path:
+        print("- FULL_API_PATH: " + api_full_path)
+        print("- API_KEY: " + api_key)
+    else:
+        print("- KINESIS_STREAM: " + params["kinesis_stream"])
+        print("- PARTITION_KEY: " + params["partition_key"])
+        if params.get("endpoint_url"):
+            print("- ENDPOINT_URL: " + params["endpoint_url"])
+    print("- APPLICATION_ID: " + ", ".join(params["application_ids"][:10]))
+    if len(params["application_ids"]) > 10:
+        print(f"  and {len(params['application_ids']) - 10} more applications")
+    print("===========================================\n")
+
+    worker_count = params.get("workers") or 1
+    profile = rate_profile(params, traffic_profile)
+    if params.get("input_file"):
+        print(f"Replaying {params['input_file']} at {params.get('replay_speed')}x speed")
+    elif profile:
+        print(f"Sending open-loop at up to {profile.max_rate:,.0f} events/sec")
+    elif params.get("adaptive"):
+        print(
+            f"Sending adaptively with up to {params.get('max_concurrency')} batches in flight, "
+            f"backing off above {params.get('target_latency')}s p90 latency"
+        )
+    elif params.get("concurrency") or params.get("kinesis_stream"):
+        print(f"Sending with {params.get('concurrency') or DEFAULT_CONCURRENCY} batches in flight")
+    if params.get("simulate"):
+        print(
+            f"Simulating {params.get('sessions')} concurrent sessions of {params.get('players'):,} players "
+            f"across {len(params['application_ids'])} applications"
+        )
+    if traffic_profile:
+        print(
+            f"Following the traffic profile {params['profile']} across {len(params['application_ids'])} "
+            f"applications, with {len(traffic_profile.event_mix)} event mixes and {len(traffic_profile.bursts)} bursts"
+        )
+        if params.get("simulate") and (traffic_profile.event_mix or traffic_profile.bursts):
+            print("Simulated sessions choose their own events, so event mixes do not apply with --simulate")
+    if worker_count > 1:
+        print(f"Splitting the load across {worker_count} worker processes")
+    print("")
+
+    stats = LoadStats(params.get("report_interval") or DEFAULT_REPORT_INTERVAL)
+    stats.start_reporting()
+    try:
+        if worker_count > 1:
+            run_workers(run_send_mode, worker_count, (api_full_path, params), stats)
+        else:
+            run_send_mode(None, stats, api_full_path, params)
+    except KeyboardInterrupt:
+        print("Interrupted, stopping")
+    finally:
+        stats.stop(params.get("report_file"))
+
+
+def application_ids(params, traffic_profile=None):
+    """Return the --application-id ids, plus generated ones up to the number of applications.
+
+    The number is --applications with --simulate, or that of the traffic profile if larger.
+    """
+
+    ids = [application_id.strip() for application_id in params["application_id"].split(",")]
+    if not params.get("simulate") and traffic_profile is None:
+        return ids[:1]
+    count = params.get("applications") or 0
+    if traffic_profile is not None:
+        count = max(count, traffic_profile.application_count)
+    rng = random.Random(params.get("seed"))
+    while len(ids) < count:
+        ids.append(str(uuid.UUID(int=rng.getrandbits(128), version=4)))
+    return ids
+
+
+def event_source(params, seed, worker_count=1, traffic_profile=None):
+    """Return the EventGenerator, or PopulationSimulator with --simulate, that generates events.
+
+    Each worker simulates its own share of the players and sessions. With a traffic
+    profile, the generator samples the profile's keys, and generated events follow
+    its event mixes and application skew.
+    """
+
+    generator = None
+    if traffic_profile is not None:
+        options = traffic_profile.generator_options()
+        if params.get("simulate"):
+            options["pool_sizes"] = {"items": params.get("items") or DEFAULT_ITEMS, **options["pool_sizes"]}
+        generator = EventGenerator(seed=seed, **options)
+    if not params.get("simulate"):
+        if traffic_profile is None:
+            return EventGenerator(seed=seed)
+        return ProfiledSource(generator, traffic_profile, params["application_ids"], seed)
+    return PopulationSimulator(
+        params["application_ids"],
+        players=max((params.get("players") or DEFAULT_PLAYERS) // worker_count, 1),
+        sessions=max((params.get("sessions") or DEFAULT_SESSIONS) // worker_count, 1),
+        items=params.get("items") or DEFAULT_ITEMS,
+        seed=seed,
+        generator=generator,
+        application_weights=None
+        if traffic_profile is None
+        else traffic_profile.application_weights(len(params["application_ids"])),
+    )
+
+
+def disorder_requested(params):
+    return bool(
+        params.get("duplicate_rate")
+        or params.get("late_rate")
+        or params.get("clock_skew")
+        or params.get("ground_truth")
+    )
+
+
+def disorder_injector(params, source, seed, application_id=None):
+    """Return the DisorderInjector selected on the command line around `source`, or None if not requested."""
+
+    if not disorder_requested(params):
+        return None
+    return DisorderInjector(
+        source,
+        params.get("duplicate_rate") or 0.0,
+        params.get("late_rate") or 0.0,
+        params.get("lateness") or DEFAULT_LATENESS,
+        params.get("mean_lateness") or DEFAULT_MEAN_LATENESS,
+        params.get("max_lateness") or DEFAULT_MAX_LATENESS,
+        params.get("clock_skew") or 0.0,
+        params.get("clients") or DEFAULT_CLIENTS,
+        seed=seed,
+        truth=GroundTruth() if params.get("ground_truth") else None,
+        application_id=application_id,
+    )
+
+
+def finish_disorder(injector, path, label=None):
+    """Print a summary of the disorder `injector` injected, and write its ground truth to `path`."""
+
+    summary = injector.summary()
+    print("===========================================")
+    print(f"DISORDER SUMMARY{'' if label is None else f' ({label})'}:")
+    print(f"- LATE EVENTS: {summary['late_events']:,}")
+    print(f"- SKEWED EVENTS: {summary['skewed_events']:,} from {summary['clients_skewed']:,} clients")
+    print(f"- DUPLICATES: {summary['duplicates']:,}")
+    if injector.truth is not None:
+        print(f"- EXPECTED LATE RECORDS: {injector.truth.expected_late:,} (single ordered partition)")
     print("===========================================\n")
+    if injector.truth is not None and path:
+        injector.truth.write(path, {**injector.settings(), **summary})
+        print(f"Wrote the ground truth to {path}")
+
+
+def rate_profile(params, traffic_profile=None):
+    """Return the target RateProfile selected on the command line, or None when not rate limited.
 
-    send_events_bulk(api_full_path, api_key, batch_size)
+    A traffic profile supplies the rate when the command line does not, and adds its bursts.
+    """
 
+    profile = None
+    if params.get("ramp_profile"):
+        profile = RateProfile.parse(params["ramp_profile"])
+    elif params.get("events_per_second"):
+        profile = RateProfile.constant(params["events_per_second"], params.get("ramp_up") or 0)
+    if traffic_profile is not None:
+        profile = traffic_profile.rate_profile(profile)
+    return profile
+
+
+def run_send_mode(worker_index, stats, api_full_path, params):
+    """Run the send mode selected by `params`, as worker `worker_index` or in-process if None."""
+
+    api_key = params["api_key"]
+    kinesis_stream = params.get("kinesis_stream")
+    batch_size = params["batch_size"] or (MAX_RECORDS_PER_CALL if kinesis_stream else DEFAULT_BATCH_SIZE)
+    concurrency = params.get("concurrency")
+    duration = params.get("duration")
+    worker_count = params.get("workers") or 1
+    seed = params.get("seed")
+    if seed is not None and worker_index is not None:
+        seed += worker_index
+    worker_label = None if worker_index is None else f"worker {worker_index}"
+    encoder = PayloadEncoder(
+        params.get("gzip", False), params.get("gzip_level") or DEFAULT_GZIP_LEVEL
+    )
+    retry_policy = RetryPolicy(params.get("max_attempts") or DEFAULT_MAX_ATTEMPTS, seed=seed)
+    kinesis_senders = []
+    if kinesis_stream:
+
+        def sender_factory(concurrency, **options):
+            sender = KinesisSender(
+                kinesis_stream,
+                params["application_ids"][0],
+                concurrency,
+                region=params.get("region"),
+                endpoint_url=params.get("endpoint_url"),
+                partition_key=params.get("partition_key") or PARTITION_EVENT_ID,
+                retry_policy=retry_policy,
+                **options,
+            )
+            kinesis_senders.append(sender)
+            return sender
+
+    else:
+        sender_factory = functools.partial(ConcurrentSender, api_full_path, api_key, retry_policy=retry_policy)
+
+    traffic_profile = load_profile(params["profile"]) if params.get("profile") else None
+    profile = rate_profile(params, traffic_profile)
+    corpus = None
+    injector = None
+    if params.get("corpus"):
+        corpus = CorpusReader(params["corpus"])
+        # Workers take interleaved chunks, so together they send the corpus once
+        batch_size = corpus.index["batch_size"]
+        batches = corpus.batches(
+            (params.get("start_chunk") or 0) + (worker_index or 0),
+            worker_count,
+            params.get("loop", False),
+        )
+    else:
+        source = event_source(params, seed, worker_count, traffic_profile)
+        injector = disorder_injector(params, source, seed, params["application_ids"][0])
+        generator = injector or source
+        batches = generator.batches(batch_size)
+
+    try:
+        if params.get("input_file"):
+            replay_file(
+                api_full_path,
+                api_key,
+                params["input_file"],
+                batch_size,
+                params.get("replay_speed", 1.0),
+                concurrency or DEFAULT_CONCURRENCY,
+                params.get("rewrite_timestamps", False),
+                stats,
+                encoder,
+                sender_factory,
+            )
+        elif profile:
+            send_events_at_rate(
+                api_full_path,
+                api_key,
+                batches,
+                batch_size,
+                profile.scaled(1 / worker_count),
+                concurrency or DEFAULT_CONCURRENCY,
+                params.get("arrival") or ARRIVAL_POISSON,
+                duration,
+                seed,
+                stats,
+                worker_label,
+                encoder,
+                sender_factory,
+            )
+        elif params.get("adaptive"):
+            send_events_adaptive(
+                api_full_path,
+                api_key,
+                generator,
+                AimdController(
+                    concurrency or 2,
+                    batch_size,
+                    params.get("max_concurrency") or DEFAULT_MAX_CONCURRENCY,
+                    target_latency=params.get("target_latency") or DEFAULT_TARGET_LATENCY,
+                    label=worker_label,
+                ),
+                retry_policy,
+                RetryQueue(params.get("retry_queue_size") or DEFAULT_RETRY_QUEUE_SIZE),
+                duration,
+                stats,
+                encoder,
+            )
+        # There is no pause between PutRecords calls, so writing to Kinesis is always concurrent
+        elif concurrency or corpus or kinesis_stream:
+            send_events_concurrent(
+                api_full_path,
+                api_key,
+                batches,
+                concurrency or DEFAULT_CONCURRENCY,
+                duration,
+                stats,
+                encoder,
+                sender_factory,
+            )
+        else:
+            send_events_bulk(
+                api_full_path,
+                api_key,
+                batch_size,
+                duration,
+                seed,
+                stats,
+                encoder,
+                retry_policy,
+                generator,
+            )
+    finally:
+        # Also written when sending is interrupted, so that it matches what was sent
+        if injector is not None:
+            path = params.get("ground_truth")
+            if path and worker_index is not None:
+                root, extension = os.path.splitext(path)
+                path = f"{root}-{worker_index}{extension}"
+            finish_disorder(injector, path, worker_label)
+    for sender in kinesis_senders:
+        sender.print_shard_distribution(worker_label)
+    if corpus:
+        corpus.close()
+    elif params.get("simulate"):
+        summary = source.summary()
+        print("===========================================")
+        print(f"SIMULATION SUMMARY{'' if worker_label is None else f' ({worker_label})'}:")
+        print(f"- APPLICATIONS: {summary['applications']}")
+        print(f"- PLAYERS SEEN: {summary['players_seen']:,}")
+        print(f"- SESSIONS STARTED: {summary['sessions_started']:,}")
+        print(f"- MATCHES STARTED: {summary['matches_started']:,}")
+        print(f"- EVENTS SIMULATED: {summary['events']:,}")
+        print("===========================================\n")
+
+
+# Shared keep-alive session used by send_record_batch
+SESSION = requests.Session()
 
 # Set Global value for Server and Match id
 SERVERS = getUUIDs("servers", 3)
@@ -541,4 +1768,14 @@ MATCHES = getUUIDs("matches", 50)
 
 if __name__ == "__main__":
     args = parse_cmd_line()
-    send_data(vars(args))
+    if args.command == "benchmark":
+        benchmark_generators(args.events, args.batch_size)
+    elif args.command == "generate":
+        generate_corpus(vars(args))
+    elif args.command == "serve":
+        params = vars(args)
+        if params["application_id"]:
+            params["application_ids"] = params["application_id"].split(",")
+        run_endpoint(params)
+    else:
+        send_data(vars(args))
@@ -0,0 +1,320 @@
+######################################################################################################################
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this
+# software and associated documentation files (the "Software"), to deal in the Software
+# without restriction, including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so.
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+######################################################################################################################
+
+"""Direct-to-Kinesis sender, bypassing the REST API.
+
+Each event is wrapped in the {"application_id": ..., "event": {...}} record that
+the Flink application's source table reads, and batches are written with
+PutRecords. Records that PutRecords reports as failed (typically
+ProvisionedThroughputExceededException on a hot shard) are resent on their own
+after a jittered backoff, until they succeed or run out of attempts.
+
+KinesisSender has the same submit()/close() interface as ConcurrentSender, so it
+can drive any of the closed-loop, target-rate and replay send modes.
+"""
+
+import hashlib
+import json
+import threading
+import time
+import uuid
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from adaptive import RetryPolicy
+from sender import DEFAULT_CONCURRENCY, batch_events
+
+try:
+    import boto3
+    from botocore.config import Config
+    from botocore.exceptions import BotoCoreError, ClientError
+except ImportError:
+    boto3 = None
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# PutRecords limits: records per call, bytes per call, and bytes per record
+MAX_RECORDS_PER_CALL = 500
+MAX_BYTES_PER_CALL = 5 * 1024 * 1024
+MAX_RECORD_BYTES = 1024 * 1024
+
+PARTITION_EVENT_ID = "event_id"
+PARTITION_RANDOM = "random"
+PARTITION_PLAYER = "player"
+PARTITION_APPLICATION = "application"
+PARTITION_BALANCED = "balanced"
+PARTITION_KEYS = (
+    PARTITION_EVENT_ID,
+    PARTITION_RANDOM,
+    PARTITION_PLAYER,
+    PARTITION_APPLICATION,
+    PARTITION_BALANCED,
+)
+
+# Errors after which a whole PutRecords call may succeed if sent again
+RETRYABLE_ERRORS = {
+    "ProvisionedThroughputExceededException",
+    "ThrottlingException",
+    "LimitExceededException",
+    "KMSThrottlingException",
+    "InternalFailure",
+    "ServiceUnavailable",
+}
+
+
+def dumps(value):
+    if orjson is not None:
+        return orjson.dumps(value)
+    return json.dumps(value, separators=(",", ":")).encode("utf-8")
+
+
+class KinesisSender:
+    """Writes batches of events to a Kinesis data stream with PutRecords.
+
+    `partition_key` selects how records are spread over shards:
+
+    - "event_id": the event id, as the REST API does (even spread)
+    - "random": a fresh random key per record (even spread)
+    - "player": the user_id of simulated players (--simulate), else the event id,
+      which keeps each player's events in order on one shard
+    - "application": the application id, which sends each application's events to
+      a single, hot shard
+    - "balanced": explicit hash keys that deal records round-robin over the open
+      shards, for an exactly even spread
+    """
+
+    def __init__(
+        self,
+        stream,
+        application_id,
+        concurrency=DEFAULT_CONCURRENCY,
+        bounded=True,
+        monitor=None,
+        stats=None,
+        verbose=True,
+        encoder=None,
+        log_failures=True,
+        region=None,
+        endpoint_url=None,
+        partition_key=PARTITION_EVENT_ID,
+        retry_policy=None,
+    ):
+        if boto3 is None:
+            raise RuntimeError("Sending directly to Kinesis requires boto3 (pip install boto3)")
+        self.stream_arguments = {"StreamARN" if stream.startswith("arn:") else "StreamName": stream}
+        self.application_id = application_id
+        self.concurrency = concurrency
+        self.bounded = bounded
+        self.monitor = monitor
+        self.stats = stats
+        self.verbose = verbose
+        self.log_failures = log_failures
+        self.partition_key = partition_key
+        self.retry_policy = retry_policy or RetryPolicy()
+        # Retries are done per record by this class, so the client must not retry whole calls
+        self.client = boto3.client(
+            "kinesis",
+            region_name=region,
+            endpoint_url=endpoint_url,
+            config=Config(
+                max_pool_connections=concurrency, retries={"total_max_attempts": 1}
+            ),
+        )
+        self.executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="kinesis")
+        self.in_flight = threading.BoundedSemaphore(concurrency)
+        self.lock = threading.Lock()
+        self.shard_hash_keys = self.open_shard_hash_keys()
+        self.shard_records = Counter()
+        self.next_shard = 0
+
+    def open_shard_hash_keys(self):
+        """Return the sorted (starting hash key, shard id) of the stream's open shards, if they can be listed."""
+
+        shards = []
+        arguments = dict(self.stream_arguments)
+        try:
+            while True:
+                response = self.client.list_shards(**arguments)
+                for shard in response["Shards"]:
+                    if "EndingSequenceNumber" not in shard.get("SequenceNumberRange", {}):
+                        shards.append((int(shard["HashKeyRange"]["StartingHashKey"]), shard["ShardId"]))
+                if not response.get("NextToken"):
+                    break
+                arguments = {"NextToken": response["NextToken"]}
+        except (BotoCoreError, ClientError) as e:
+            if self.partition_key == PARTITION_BALANCED:
+                raise RuntimeError(f"Balanced partitioning needs the stream's shards: {e}")
+            print(f"Could not list the stream's shards, shard distribution will not be reported: {e}")
+            return []
+        return sorted(shards)
+
+    def shard_for(self, hash_key):
+        """Return the index of the open shard whose hash key range contains `hash_key`."""
+
+        low, high = 0, len(self.shard_hash_keys) - 1
+        while low < high:
+            middle = (low + high + 1) // 2
+            if self.shard_hash_keys[middle][0] <= hash_key:
+                low = middle
+            else:
+                high = middle - 1
+        return low
+
+    def entries(self, events, application_id):
+        """Build the PutRecords entries for `events`, and count them against their shards."""
+
+        entries = []
+        shard_counts = Counter()
+        for event in events:
+            data = dumps({"application_id": application_id, "event": event})
+            if len(data) > MAX_RECORD_BYTES:
+                print(f"Skipping event {event.get('event_id')} of {len(data)} bytes, over the Kinesis record limit")
+                continue
+            entry = {"Data": data}
+            if self.partition_key == PARTITION_BALANCED:
+                with self.lock:
+                    shard = self.next_shard
+                    self.next_shard = (self.next_shard + 1) % len(self.shard_hash_keys)
+                entry["PartitionKey"] = str(event.get("event_id"))
+                entry["ExplicitHashKey"] = str(self.shard_hash_keys[shard][0])
+                shard_counts[shard] += 1
+            else:
+                if self.partition_key == PARTITION_RANDOM:
+                    key = uuid.uuid4().hex
+                elif self.partition_key == PARTITION_APPLICATION:
+                    key = application_id
+                elif self.partition_key == PARTITION_PLAYER:
+                    key = (event.get("event_data") or {}).get("user_id") or event.get("event_id")
+                else:
+                    key = event.get("event_id")
+                entry["PartitionKey"] = str(key)
+                if self.shard_hash_keys:
+                    hash_key = int.from_bytes(hashlib.md5(entry["PartitionKey"].encode("utf-8")).digest(), "big")
+                    shard_counts[self.shard_for(hash_key)] += 1
+            entries.append(entry)
+        with self.lock:
+            self.shard_records.update(shard_counts)
+        return entries
+
+    def submit(self, batch, scheduled_at=None):
+        """Queue a batch for sending, waiting for a free in-flight slot first if bounded."""
+
+        queued_at = time.perf_counter() if scheduled_at is None else scheduled_at
+        if not self.bounded:
+            return self.executor.submit(self.send, batch, scheduled_at, queued_at)
+        self.in_flight.acquire()
+        future = self.executor.submit(self.send, batch, scheduled_at, queued_at)
+        future.add_done_callback(lambda f: self.in_flight.release())
+        return future
+
+    def send(self, batch, scheduled_at=None, queued_at=None):
+        """Write a batch with as many PutRecords calls as the per-call limits require."""
+
+        application_id = getattr(batch, "application_id", None) or self.application_id
+        entries = self.entries(batch_events(batch), application_id)
+        if self.monitor is not None and scheduled_at is not None:
+            self.monitor.started(scheduled_at, len(entries))
+        call, call_bytes = [], 0
+        for entry in entries:
+            size = len(entry["Data"]) + len(entry["PartitionKey"])
+            if call and (len(call) >= MAX_RECORDS_PER_CALL or call_bytes + size > MAX_BYTES_PER_CALL):
+                self.put_records(call, queued_at)
+                call, call_bytes = [], 0
+            call.append(entry)
+            call_bytes += size
+        if call:
+            self.put_records(call, queued_at)
+
+    def put_records(self, entries, queued_at=None):
+        """PutRecords `entries`, resending failed records with backoff until they succeed or run out of attempts."""
+
+        attempt = 1
+        while entries:
+            started_at = time.perf_counter()
+            retryable = True
+            try:
+                response = self.client.put_records(Records=entries, **self.stream_arguments)
+                status = 200
+                failed = [
+                    entry
+                    for entry, result in zip(entries, response["Records"])
+                    if result.get("ErrorCode")
+                ]
+            except ClientError as e:
+                status = e.response.get("Error", {}).get("Code", "ClientError")
+                retryable = status in RETRYABLE_ERRORS
+                failed = entries
+            except BotoCoreError as e:
+                status = type(e).__name__
+                failed = entries
+            if status != 200 and self.log_failures:
+                print(f"Failed to put {len(entries)} records to Kinesis: {status}")
+            self.record(entries, failed, status, queued_at, started_at)
+            if not failed:
+                if self.verbose:
+                    print(f"Successfully put {len(entries)} records to Kinesis.")
+                return
+            if not retryable or attempt >= self.retry_policy.max_attempts:
+                if self.stats is not None:
+                    self.stats.record_drop(len(failed))
+                return
+            if self.stats is not None:
+                self.stats.record_retry(len(failed))
+            time.sleep(self.retry_policy.delay(attempt))
+            attempt += 1
+            # Only the failed records are resent, so accepted records are never duplicated
+            entries = failed
+            queued_at = None
+
+    def record(self, entries, failed, status, queued_at, started_at):
+        if self.stats is None:
+            return
+        finished_at = time.perf_counter()
+        self.stats.record_response(
+            finished_at - (started_at if queued_at is None else queued_at),
+            finished_at - started_at,
+            status,
+            len(entries),
+            len(failed),
+            sum(len(entry["Data"]) for entry in entries),
+        )
+
+    def close(self, cancel_pending=False):
+        """Wait for all in-flight batches to complete, optionally dropping queued ones first."""
+
+        self.executor.shutdown(wait=True, cancel_futures=cancel_pending)
+
+    def print_shard_distribution(self, label=None):
+        """Print how evenly the records sent so far were spread over the open shards."""
+
+        with self.lock:
+            counts = [self.shard_records[index] for index in range(0, len(self.shard_hash_keys))]
+        total = sum(counts)
+        if not total:
+            return
+        hottest = max(range(0, len(counts)), key=lambda index: counts[index])
+        print("===========================================")
+        print(f"SHARD DISTRIBUTION{'' if label is None else f' ({label})'}:")
+        print(f"- PARTITION KEY: {self.partition_key}")
+        print(f"- OPEN SHARDS: {len(counts)}, of which {sum(1 for count in counts if count)} received records")
+        print(
+            f"- HOTTEST SHARD: {self.shard_hash_keys[hottest][1]} with {counts[hottest] / total:.1%} of records "
+            f"({1 / len(counts):.1%} if even)"
+        )
+        print("===========================================\n")
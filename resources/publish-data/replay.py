@@ -0,0 +1,94 @@
+######################################################################################################################
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this
+# software and associated documentation files (the "Software"), to deal in the Software
+# without restriction, including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so.
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+######################################################################################################################
+
+"""Streaming replay of captured events from NDJSON or gzip-compressed NDJSON files.
+
+Files are read line by line through a buffered reader, so captures larger than
+memory can be replayed. Each line is either an event as sent to the API, or the
+{"application_id": ..., "event": {...}} envelope written to the events stream.
+"""
+
+import gzip
+import json
+
+READ_BUFFER_SIZE = 1024 * 1024
+
+
+def open_capture(path):
+    """Open an NDJSON capture for binary line iteration, decompressing .gz files on the fly."""
+
+    if path.endswith(".gz"):
+        return gzip.open(path, "rb")
+    return open(path, "rb", buffering=READ_BUFFER_SIZE)
+
+
+def read_events(path, errors=None):
+    """Yield the events in a capture file one at a time.
+
+    Malformed lines are skipped; when `errors` is a list, their line numbers are
+    appended to it.
+    """
+
+    with open_capture(path) as file:
+        for line_number, line in enumerate(file, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                event = json.loads(line)
+            except ValueError:
+                if errors is not None:
+                    errors.append(line_number)
+                continue
+            if "event_type" not in event and isinstance(event.get("event"), dict):
+                event = event["event"]
+            yield event
+
+
+def replay_batches(events, batch_size, speed=1.0, rebase_to=None):
+    """Group a stream of events into batches paced by their original timestamps.
+
+    Yields (due, batch) pairs, where `due` is the number of seconds after the start
+    of the replay at which the batch should be sent: the original offset of its last
+    event from the first event in the capture, divided by `speed`. A batch is closed
+    when it is full or when the next event is due later. With a `speed` of 0 every
+    batch is due immediately.
+
+    When `rebase_to` is an epoch timestamp, event timestamps are rewritten to keep
+    their (speed-adjusted) offsets from the first event, but starting at `rebase_to`.
+    """
+
+    first_timestamp = None
+    batch = []
+    batch_due = 0.0
+    for event in events:
+        timestamp = event.get("event_timestamp")
+        if isinstance(timestamp, (int, float)):
+            if first_timestamp is None:
+                first_timestamp = timestamp
+            offset = (timestamp - first_timestamp) / speed if speed else timestamp - first_timestamp
+            due = max(offset, 0.0) if speed else 0.0
+            if rebase_to is not None:
+                event["event_timestamp"] = int(rebase_to + offset)
+        else:
+            due = batch_due
+        if batch and (len(batch) >= batch_size or due > batch_due):
+            yield batch_due, batch
+            batch = []
+        batch.append(event)
+        batch_due = max(batch_due, due)
+    if batch:
+        yield batch_due, batch
@@ -0,0 +1,261 @@
+######################################################################################################################
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this
+# software and associated documentation files (the "Software"), to deal in the Software
+# without restriction, including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so.
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+######################################################################################################################
+
+"""Open-loop pacing for target-rate load tests.
+
+Batch send times are computed from the target rate alone, never from how quickly
+earlier batches completed, so slow responses cannot throttle the offered load
+(no coordinated omission). PacingMonitor reports when sends start later than
+scheduled, i.e. when the client is falling behind its target rate.
+"""
+
+import random
+import threading
+import time
+
+ARRIVAL_POISSON = "poisson"
+ARRIVAL_UNIFORM = "uniform"
+ARRIVALS = (ARRIVAL_POISSON, ARRIVAL_UNIFORM)
+
+DEFAULT_REPORT_INTERVAL = 5.0
+# Sends starting this many seconds after their scheduled time count as falling behind
+LAG_WARNING_SECONDS = 1.0
+
+
+class RateProfile:
+    """Piecewise-linear target rate in events/sec over elapsed seconds.
+
+    `points` is a list of (elapsed_seconds, events_per_second) pairs. The rate is
+    interpolated between points and held at the last point's rate afterwards.
+    """
+
+    def __init__(self, points):
+        if not points:
+            raise ValueError("A rate profile needs at least one point")
+        self.points = sorted((float(t), float(rate)) for t, rate in points)
+        if any(rate < 0 for t, rate in self.points):
+            raise ValueError("Rates in a rate profile cannot be negative")
+        self.max_rate = max(rate for t, rate in self.points)
+        if self.max_rate <= 0:
+            raise ValueError("A rate profile needs at least one positive rate")
+        # After its last point the rate holds; at 0 the profile has ended
+        self.end, self.final_rate = self.points[-1]
+
+    def ends(self):
+        """Return whether the rate drops to 0 for good, so that the profile targets a finite number of events."""
+
+        return self.final_rate == 0
+
+    @classmethod
+    def constant(cls, events_per_second, ramp_up=0):
+        """Constant rate, optionally reached by a linear ramp from zero over `ramp_up` seconds."""
+
+        if ramp_up > 0:
+            return cls([(0, 0), (ramp_up, events_per_second)])
+        return cls([(0, events_per_second)])
+
+    @classmethod
+    def parse(cls, spec):
+        """Parse a profile such as "0:1000,60:20000,600:20000" (seconds:events_per_second)."""
+
+        points = []
+        for point in spec.split(","):
+            elapsed, rate = point.split(":")
+            points.append((float(elapsed), float(rate)))
+        return cls(points)
+
+    def scaled(self, factor):
+        """Return this profile with every rate multiplied by `factor`."""
+
+        return RateProfile([(t, rate * factor) for t, rate in self.points])
+
+    def rate_at(self, elapsed):
+        """Return the target events/sec `elapsed` seconds into the run."""
+
+        previous_t, previous_rate = self.points[0]
+        if elapsed <= previous_t:
+            return previous_rate
+        for t, rate in self.points[1:]:
+            if elapsed <= t:
+                fraction = (elapsed - previous_t) / (t - previous_t)
+                return previous_rate + fraction * (rate - previous_rate)
+            previous_t, previous_rate = t, rate
+        return previous_rate
+
+    def events_until(self, elapsed):
+        """Return the number of events the profile targets over the first `elapsed` seconds."""
+
+        total = 0.0
+        previous_t, previous_rate = 0.0, self.rate_at(0)
+        for t, rate in self.points:
+            if t <= 0:
+                continue
+            t = min(t, elapsed)
+            rate = self.rate_at(t)
+            total += (t - previous_t) * (previous_rate + rate) / 2
+            previous_t, previous_rate = t, rate
+            if t >= elapsed:
+                return total
+        return total + (elapsed - previous_t) * previous_rate
+
+
+class OpenLoopScheduler:
+    """Yields the scheduled start time of every batch for a rate profile.
+
+    With Poisson arrivals, batch inter-arrival times are exponentially distributed;
+    time-varying rates are handled by thinning a Poisson process running at the
+    profile's peak rate. Uniform arrivals space batches evenly, like a token bucket
+    refilled at the target rate.
+    """
+
+    def __init__(self, profile, batch_size, arrival=ARRIVAL_POISSON, seed=None):
+        if arrival not in ARRIVALS:
+            raise ValueError(f"Unknown arrival process {arrival}, expected one of {ARRIVALS}")
+        self.profile = profile
+        self.batch_size = batch_size
+        self.arrival = arrival
+        self.rng = random.Random(seed)
+
+    def schedule(self, start, duration=None):
+        """Yield absolute time.perf_counter() values at which to start each batch.
+
+        The schedule ends after `duration` seconds, or once a profile that ends at
+        rate 0 has passed its last point.
+        """
+
+        if self.arrival == ARRIVAL_POISSON:
+            offsets = self.poisson_offsets(duration)
+        else:
+            offsets = self.uniform_offsets(duration)
+        for offset in offsets:
+            yield start + offset
+
+    def poisson_offsets(self, duration=None):
+        peak_batch_rate = self.profile.max_rate / self.batch_size
+        # No batch is accepted after this many seconds
+        end = self.profile.end if self.profile.ends() else None
+        if duration is not None:
+            end = duration if end is None else min(end, duration)
+        elapsed = 0.0
+        while True:
+            elapsed += self.rng.expovariate(peak_batch_rate)
+            if end is not None and elapsed >= end:
+                return
+            rate = self.profile.rate_at(elapsed)
+            if self.rng.random() * self.profile.max_rate < rate:
+                yield elapsed
+
+    def uniform_offsets(self, duration=None):
+        # Batch k is released once the profile has accrued k batches' worth of events
+        # Events a profile ending at rate 0 targets in all, past which no batch is released
+        total = self.profile.events_until(self.profile.end) if self.profile.ends() else None
+        elapsed = 0.0
+        batches = 0
+        while True:
+            batches += 1
+            target = batches * self.batch_size
+            if total is not None and target > total:
+                return
+            step = self.batch_size / self.profile.max_rate
+            low, high = elapsed, elapsed + step
+            while self.profile.events_until(high) < target:
+                low, high = high, high + step
+                step *= 2
+            for i in range(0, 50):
+                middle = (low + high) / 2
+                if self.profile.events_until(middle) < target:
+                    low = middle
+                else:
+                    high = middle
+            elapsed = high
+            if duration is not None and elapsed >= duration:
+                return
+            yield elapsed
+
+
+class PacingMonitor:
+    """Thread-safe tracker of how far batch sends lag behind their schedule."""
+
+    def __init__(self, profile, start, report_interval=DEFAULT_REPORT_INTERVAL, label=None, verbose=True):
+        self.profile = profile
+        self.start = start
+        self.report_interval = report_interval
+        self.prefix = f"[{label}] " if label else ""
+        # When not verbose, only falling-behind warnings are printed
+        self.verbose = verbose
+        self.lock = threading.Lock()
+        self.events_started = 0
+        self.batches_started = 0
+        self.batches_late = 0
+        self.max_lag = 0.0
+        self.interval_events = 0
+        self.interval_max_lag = 0.0
+        self.last_report = start
+
+    def started(self, scheduled_at, event_count):
+        """Record that a batch scheduled for `scheduled_at` has started sending."""
+
+        lag = time.perf_counter() - scheduled_at
+        with self.lock:
+            self.events_started += event_count
+            self.batches_started += 1
+            self.interval_events += event_count
+            if lag > LAG_WARNING_SECONDS:
+                self.batches_late += 1
+            self.max_lag = max(self.max_lag, lag)
+            self.interval_max_lag = max(self.interval_max_lag, lag)
+
+    def maybe_report(self, now=None):
+        """Print a pacing summary if a report interval has passed since the last one."""
+
+        now = time.perf_counter() if now is None else now
+        if now - self.last_report < self.report_interval:
+            return
+        with self.lock:
+            interval = now - self.last_report
+            achieved = self.interval_events / interval
+            max_lag = self.interval_max_lag
+            self.interval_events = 0
+            self.interval_max_lag = 0.0
+            self.last_report = now
+        target = self.profile.rate_at(now - self.start)
+        if self.verbose:
+            print(
+                f"{self.prefix}[pacing] target {target:,.0f} events/sec, sent {achieved:,.0f} events/sec, "
+                f"max start lag {max_lag:.3f}s"
+            )
+        if max_lag > LAG_WARNING_SECONDS:
+            print(
+                f"{self.prefix}WARNING: falling behind the target rate, batches are starting up to {max_lag:.1f}s "
+                "late. Increase --concurrency or run more workers."
+            )
+
+    def summary(self, duration=None):
+        """Print totals for the whole run."""
+
+        if not self.verbose:
+            return
+        elapsed = time.perf_counter() - self.start
+        scheduled = elapsed if duration is None else min(elapsed, duration)
+        target_events = self.profile.events_until(scheduled)
+        print("===========================================")
+        print("PACING SUMMARY:")
+        print(f"- ELAPSED: {elapsed:.1f}s")
+        print(f"- EVENTS STARTED: {self.events_started} of {target_events:,.0f} targeted")
+        print(f"- MEAN RATE: {self.events_started / elapsed if elapsed else 0:,.0f} events/sec")
+        print(f"- BATCHES LATE BY MORE THAN {LAG_WARNING_SECONDS}s: {self.batches_late}")
+        print(f"- MAX START LAG: {self.max_lag:.3f}s")
+        print("===========================================\n")
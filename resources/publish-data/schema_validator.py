@@ -0,0 +1,196 @@
+######################################################################################################################
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this
+# software and associated documentation files (the "Software"), to deal in the Software
+# without restriction, including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so.
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+######################################################################################################################
+
+"""JSON Schema validators compiled to Python closures.
+
+compile_schema() walks a schema once and returns a function that checks a value
+against it, with every $ref resolved and every pattern compiled up front, so the
+per-event cost is a handful of type checks and regex matches. Only the keywords
+used by the pipeline's event schemas are supported; any other validation keyword
+raises ValueError at compile time rather than being silently ignored.
+"""
+
+import re
+
+# Keywords that document a schema without constraining values
+ANNOTATIONS = {"$schema", "$id", "$comment", "title", "description", "examples", "default", "definitions", "$defs"}
+
+TYPE_CHECKS = {
+    "object": lambda value: isinstance(value, dict),
+    "array": lambda value: isinstance(value, list),
+    "string": lambda value: isinstance(value, str),
+    "number": lambda value: isinstance(value, (int, float)) and not isinstance(value, bool),
+    "integer": lambda value: isinstance(value, int) and not isinstance(value, bool),
+    "boolean": lambda value: isinstance(value, bool),
+    "null": lambda value: value is None,
+}
+
+
+def compile_schema(schema, root=None, name="$"):
+    """Return a function that returns None for a valid value, or a description of the first error.
+
+    `root` is the document that "#/..." references resolve against; it defaults to
+    `schema` itself. `name` prefixes the location of errors, and the returned
+    function also accepts a name of its own to use instead.
+    """
+
+    check = compile_checks(schema, schema if root is None else root, name)
+
+    def validate(value, at=name):
+        error = check(value)
+        if error is None:
+            return None
+        location, message = error
+        return f"{at}{location} {message}"
+
+    return validate
+
+
+def compile_checks(schema, root, path):
+    """Compile `schema` into a function returning None, or the (relative location, message) of an error.
+
+    Locations are only built once an error is found, so valid values cost no
+    string formatting.
+    """
+
+    if "$ref" in schema:
+        return compile_checks(resolve_reference(root, schema["$ref"]), root, path)
+
+    unsupported = set(schema) - ANNOTATIONS - {
+        "type",
+        "properties",
+        "required",
+        "additionalProperties",
+        "pattern",
+        "items",
+        "enum",
+    }
+    if unsupported:
+        raise ValueError(f"Unsupported JSON Schema keywords at {path}: {sorted(unsupported)}")
+
+    checks = []
+    if "type" in schema:
+        types = schema["type"] if isinstance(schema["type"], list) else [schema["type"]]
+        type_checks = [TYPE_CHECKS[type_name] for type_name in types]
+        message = f"must be {' or '.join(types)}"
+        if len(type_checks) == 1:
+            type_check = type_checks[0]
+
+            def check_type(value):
+                if not type_check(value):
+                    return "", message
+
+        else:
+
+            def check_type(value):
+                for type_check in type_checks:
+                    if type_check(value):
+                        return None
+                return "", message
+
+        checks.append(check_type)
+
+    if "enum" in schema:
+        allowed = list(schema["enum"])
+
+        def check_enum(value):
+            if value not in allowed:
+                return "", f"must be one of {allowed}"
+
+        checks.append(check_enum)
+
+    if "pattern" in schema:
+        pattern = re.compile(schema["pattern"])
+
+        def check_pattern(value):
+            if isinstance(value, str) and not pattern.search(value):
+                return "", f"does not match {pattern.pattern}"
+
+        checks.append(check_pattern)
+
+    if "required" in schema:
+        required = list(schema["required"])
+
+        def check_required(value):
+            if isinstance(value, dict):
+                for property_name in required:
+                    if property_name not in value:
+                        return f".{property_name}", "is required"
+
+        checks.append(check_required)
+
+    if "properties" in schema or "additionalProperties" in schema:
+        properties = {
+            property_name: compile_checks(subschema, root, f"{path}.{property_name}")
+            for property_name, subschema in schema.get("properties", {}).items()
+        }
+        additional = schema.get("additionalProperties", True)
+        if isinstance(additional, dict):
+            additional = compile_checks(additional, root, f"{path}.*")
+
+        def check_properties(value):
+            if not isinstance(value, dict):
+                return None
+            for property_name, item in value.items():
+                property_check = properties.get(property_name)
+                if property_check is not None:
+                    error = property_check(item)
+                elif additional is False:
+                    error = "", "is not an allowed property"
+                elif additional is True:
+                    error = None
+                else:
+                    error = additional(item)
+                if error is not None:
+                    return f".{property_name}{error[0]}", error[1]
+
+        checks.append(check_properties)
+
+    if "items" in schema:
+        item_check = compile_checks(schema["items"], root, f"{path}[]")
+
+        def check_items(value):
+            if isinstance(value, list):
+                for index, item in enumerate(value):
+                    error = item_check(item)
+                    if error is not None:
+                        return f"[{index}]{error[0]}", error[1]
+
+        checks.append(check_items)
+
+    if len(checks) == 1:
+        return checks[0]
+
+    def check_all(value):
+        for check in checks:
+            error = check(value)
+            if error is not None:
+                return error
+        return None
+
+    return check_all
+
+
+def resolve_reference(root, reference):
+    """Resolve a local "#/definitions/name" style reference against `root`."""
+
+    if not reference.startswith("#"):
+        raise ValueError(f"Only local schema references are supported, not {reference}")
+    target = root
+    for part in reference.lstrip("#").strip("/").split("/"):
+        if part:
+            target = target[part.replace("~1", "/").replace("~0", "~")]
+    return target
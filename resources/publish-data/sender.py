@@ -0,0 +1,319 @@
+######################################################################################################################
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this
+# software and associated documentation files (the "Software"), to deal in the Software
+# without restriction, including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so.
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+######################################################################################################################
+
+"""Concurrent, connection-pooled sender for the /applications/{id}/events endpoint."""
+
+import gzip
+import json
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+DEFAULT_CONCURRENCY = 8
+DEFAULT_GZIP_LEVEL = 6
+# Stands in for the application id in the API path of senders that post to several applications
+APPLICATION_ID_PLACEHOLDER = "{application_id}"
+
+# A request body ready to be posted, the number of events it carries, and its
+# Content-Encoding (None when uncompressed)
+EncodedBatch = namedtuple(
+    "EncodedBatch", ["body", "record_count", "content_encoding"], defaults=[None]
+)
+
+
+class ApplicationEvents(list):
+    """A list of events that all belong to `application_id`.
+
+    Batches of this type are posted to their own application's events endpoint
+    when the sender's API path contains APPLICATION_ID_PLACEHOLDER.
+    """
+
+    def __init__(self, application_id, events=()):
+        super().__init__(events)
+        self.application_id = application_id
+
+
+def events_path(api_path, batch):
+    """Return the API path to post `batch` to, filling in its application id if it has one."""
+
+    application_id = getattr(batch, "application_id", None)
+    if application_id is None:
+        return api_path
+    return api_path.replace(APPLICATION_ID_PLACEHOLDER, application_id)
+
+
+def serialize_events(raw_records):
+    """Serialize a list of events straight to the bytes of an events endpoint request body.
+
+    Uses orjson when it is installed, and the standard library encoder otherwise.
+    """
+
+    if orjson is not None:
+        return orjson.dumps({"events": raw_records})
+    return json.dumps({"events": raw_records}, separators=(",", ":")).encode("utf-8")
+
+
+def encode_batch(raw_records, compress=False, compression_level=DEFAULT_GZIP_LEVEL):
+    """Serialize a list of events, optionally gzip compressing the body."""
+
+    body = serialize_events(raw_records)
+    if compress:
+        # mtime=0 keeps the output deterministic for identical input
+        return EncodedBatch(
+            gzip.compress(body, compression_level, mtime=0), len(raw_records), "gzip"
+        )
+    return EncodedBatch(body, len(raw_records))
+
+
+class PayloadEncoder:
+    """Turns batches into request bodies with the configured Content-Encoding.
+
+    Batches may arrive as event lists, or as already-encoded bodies (for example
+    gzip chunks from a corpus), which are only recompressed or decompressed if their
+    encoding differs from the one requested.
+    """
+
+    def __init__(self, compress=False, compression_level=DEFAULT_GZIP_LEVEL):
+        self.compress = compress
+        self.compression_level = compression_level
+
+    def encode(self, batch):
+        if not isinstance(batch, EncodedBatch):
+            return encode_batch(batch, self.compress, self.compression_level)
+        if self.compress and batch.content_encoding is None:
+            return EncodedBatch(
+                gzip.compress(batch.body, self.compression_level, mtime=0),
+                batch.record_count,
+                "gzip",
+            )
+        if not self.compress and batch.content_encoding == "gzip":
+            return EncodedBatch(gzip.decompress(batch.body), batch.record_count)
+        return batch
+
+
+def batch_events(batch):
+    """Return the events of a batch, decoding it first if it is a pre-built request body."""
+
+    if not isinstance(batch, EncodedBatch):
+        return batch
+    body = gzip.decompress(batch.body) if batch.content_encoding == "gzip" else batch.body
+    return json.loads(body)["events"]
+
+
+def rejected_record_count(response, record_count):
+    """Return how many records of a batch the endpoint did not accept.
+
+    A 200 response from the events endpoint carries the Kinesis FailedRecordCount;
+    any other response, or no response at all, rejects the whole batch.
+    """
+
+    if response is None or response.status_code != 200:
+        return record_count
+    try:
+        return int(response.json().get("FailedRecordCount") or 0)
+    except (ValueError, AttributeError):
+        return 0
+
+
+def failed_records(response, raw_records):
+    """Return the records of a partially successful batch that the endpoint rejected.
+
+    The per-record "Events" results of a 200 response are in request order. Returns
+    None when they cannot be matched to `raw_records`, in which case the failed
+    records are unknown and resending the batch would duplicate the accepted ones.
+    """
+
+    try:
+        results = response.json().get("Events")
+    except (ValueError, AttributeError):
+        return None
+    if not isinstance(results, list) or len(results) != len(raw_records):
+        return None
+    failed = [
+        record
+        for record, result in zip(raw_records, results)
+        if not isinstance(result, dict) or result.get("Result") != "Ok"
+    ]
+    if isinstance(raw_records, ApplicationEvents):
+        return ApplicationEvents(raw_records.application_id, failed)
+    return failed
+
+
+class ConcurrentSender:
+    """Keeps up to `concurrency` batches in flight over keep-alive connections.
+
+    Each worker thread owns a requests.Session, so every thread reuses a single
+    TLS connection to the endpoint instead of opening a new one per batch.
+    `submit()` blocks while `concurrency` batches are already in flight, unless the
+    sender is unbounded: open-loop load tests queue batches on schedule instead, and
+    report the resulting start lag to `monitor`. Responses are recorded in `stats`.
+    Failed requests are printed unless `log_failures` is False, for callers that
+    handle and count failures themselves.
+
+    With a `retry_policy`, throttled, failed and unanswered requests are sent again
+    after its backoff, and so are the rejected records of partially successful
+    batches, on their own. Like KinesisSender, a batch keeps its sender thread while
+    it waits to be retried.
+    """
+
+    def __init__(
+        self,
+        api_path,
+        api_key,
+        concurrency=DEFAULT_CONCURRENCY,
+        bounded=True,
+        monitor=None,
+        stats=None,
+        verbose=True,
+        encoder=None,
+        log_failures=True,
+        retry_policy=None,
+    ):
+        self.api_path = api_path
+        self.headers = {"Content-Type": "application/json", "Authorization": api_key}
+        self.compressed_headers = {**self.headers, "Content-Encoding": "gzip"}
+        self.encoder = encoder or PayloadEncoder()
+        self.concurrency = concurrency
+        self.bounded = bounded
+        self.monitor = monitor
+        self.stats = stats
+        self.verbose = verbose
+        self.log_failures = log_failures
+        self.retry_policy = retry_policy
+        self.executor = ThreadPoolExecutor(
+            max_workers=concurrency, thread_name_prefix="sender"
+        )
+        self.in_flight = threading.BoundedSemaphore(concurrency)
+        self.local = threading.local()
+
+    def session(self):
+        """Return the calling thread's session, creating it on first use."""
+
+        session = getattr(self.local, "session", None)
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=1)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            self.local.session = session
+        return session
+
+    def submit(self, batch, scheduled_at=None):
+        """Queue a batch for sending, waiting for a free in-flight slot first if bounded.
+
+        `batch` is either a list of events or an EncodedBatch of pre-built body bytes.
+        """
+
+        queued_at = time.perf_counter() if scheduled_at is None else scheduled_at
+        if not self.bounded:
+            return self.executor.submit(self.send, batch, scheduled_at, queued_at)
+        self.in_flight.acquire()
+        future = self.executor.submit(self.send, batch, scheduled_at, queued_at)
+        future.add_done_callback(lambda f: self.in_flight.release())
+        return future
+
+    def send(self, batch, scheduled_at=None, queued_at=None):
+        """Send a single batch on the calling thread's connection, retrying it if there is a retry policy.
+
+        `queued_at` is when the batch was meant to go out, and is the start of its
+        recorded latency; it defaults to when sending actually starts. Returns the
+        last response, or None if the last attempt got no response.
+        """
+
+        api_path = events_path(self.api_path, batch)
+        records = batch
+        batch = self.encoder.encode(batch)
+        if self.monitor is not None and scheduled_at is not None:
+            self.monitor.started(scheduled_at, batch.record_count)
+        attempt = 1
+        while True:
+            response = self.post(api_path, batch, queued_at)
+            rejected = rejected_record_count(response, batch.record_count)
+            if not rejected or self.retry_policy is None:
+                return response
+            if response is None:
+                retry = records
+            elif response.status_code == 200:
+                # Only the failed records are resent, so accepted records are never duplicated
+                retry = failed_records(response, batch_events(records))
+            elif self.retry_policy.retryable(response.status_code):
+                retry = records
+            else:
+                retry = None
+            if not retry or attempt >= self.retry_policy.max_attempts:
+                if self.stats is not None:
+                    self.stats.record_drop(rejected)
+                return response
+            if self.stats is not None:
+                self.stats.record_retry(rejected)
+            time.sleep(self.retry_policy.delay(attempt))
+            attempt += 1
+            if retry is not records:
+                batch = self.encoder.encode(retry)
+            records = retry
+            queued_at = None
+
+    def post(self, api_path, batch, queued_at=None):
+        """Post an encoded batch once, print and record the outcome, and return the response or None."""
+
+        headers = self.compressed_headers if batch.content_encoding else self.headers
+        started_at = time.perf_counter()
+        try:
+            response = self.session().post(api_path, data=batch.body, headers=headers)
+        except requests.RequestException as e:
+            if self.log_failures:
+                print(f"Failed to send events to endpoint {api_path}: {e}")
+            self.record(batch, queued_at, started_at, type(e).__name__)
+            return None
+        if response.status_code == 200:
+            if self.verbose:
+                print(
+                    f"Successfully sent {batch.record_count} records to endpoint {api_path}."
+                )
+        elif self.log_failures:
+            print(
+                f"Failed to send events to endpoint {api_path} with status code {response.status_code}."
+            )
+            print(response.text)
+        self.record(batch, queued_at, started_at, response.status_code, response)
+        return response
+
+    def record(self, batch, queued_at, started_at, status, response=None):
+        if self.stats is None:
+            return
+        finished_at = time.perf_counter()
+        self.stats.record_response(
+            finished_at - (started_at if queued_at is None else queued_at),
+            finished_at - started_at,
+            status,
+            batch.record_count,
+            rejected_record_count(response, batch.record_count),
+            len(batch.body),
+        )
+
+    def close(self, cancel_pending=False):
+        """Wait for all in-flight batches to complete, optionally dropping queued ones first."""
+
+        self.executor.shutdown(wait=True, cancel_futures=cancel_pending)
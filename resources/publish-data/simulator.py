@@ -0,0 +1,263 @@
+######################################################################################################################
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this
+# software and associated documentation files (the "Software"), to deal in the Software
+# without restriction, including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so.
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+######################################################################################################################
+
+"""Player-population simulator for production-like key spaces.
+
+EventGenerator samples every event independently, from small fixed id pools. The
+simulator instead keeps a number of concurrent sessions, each played by a player
+drawn from a large population spread over several applications, and moves every
+session through a state machine:
+
+    user_registration (new players only) -> tutorial_progression -> login
+    login -> lobby actions (item views, purchases, levels, ...) -> matchmaking_start
+    matchmaking_complete -> match_start -> user_knockout ... -> match_end -> lobby
+    lobby -> logout, after which the slot starts a new session for another player
+
+Every event carries the player's user_id and the session_id in its event_data,
+and fields that belong to the player (platform, country) or to the current match
+(match_id, match_type, map_id) stay consistent across the session's events.
+"""
+
+import random
+import uuid
+from bisect import bisect_right
+from itertools import accumulate
+
+from event_generator import (
+    COUNTRIES,
+    COUNTRY_WEIGHTS,
+    EventGenerator,
+    LEVELS,
+    MAPS,
+    MATCH_TYPES,
+    PLATFORMS,
+    PLATFORM_WEIGHTS,
+)
+from sender import ApplicationEvents
+
+DEFAULT_PLAYERS = 100000
+DEFAULT_SESSIONS = 1000
+DEFAULT_ITEMS = 1000
+
+# What players do between matches, and how likely each is to be their next event
+LOBBY = {
+    "matchmaking_start": 0.35,
+    "item_viewed": 0.2,
+    "level_started": 0.15,
+    "lootbox_opened": 0.05,
+    "iap_transaction": 0.03,
+    "user_sentiment": 0.03,
+    "user_report": 0.02,
+    "logout": 0.17,
+}
+
+# Next-event probabilities after each event type of a session
+SESSION_TRANSITIONS = {
+    "user_registration": {"tutorial_progression": 1.0},
+    "tutorial_progression": {"tutorial_progression": 0.6, "login": 0.4},
+    "login": LOBBY,
+    "item_viewed": LOBBY,
+    "lootbox_opened": LOBBY,
+    "iap_transaction": LOBBY,
+    "user_sentiment": LOBBY,
+    "user_report": LOBBY,
+    "matchmaking_start": {"matchmaking_complete": 0.85, "matchmaking_failed": 0.15},
+    "matchmaking_complete": {"match_start": 1.0},
+    "matchmaking_failed": LOBBY,
+    "match_start": {"user_knockout": 0.8, "match_end": 0.2},
+    "user_knockout": {"user_knockout": 0.6, "match_end": 0.4},
+    "match_end": {**LOBBY, "user_rank_up": 0.1},
+    "user_rank_up": LOBBY,
+    "level_started": {"level_completed": 0.6, "level_failed": 0.4},
+    "level_completed": LOBBY,
+    "level_failed": LOBBY,
+}
+
+MATCH_EVENTS = ("matchmaking_start", "matchmaking_complete", "matchmaking_failed")
+IN_MATCH_EVENTS = ("match_start", "user_knockout", "match_end")
+LEVEL_EVENTS = ("level_started", "level_completed", "level_failed")
+
+
+class Player:
+    __slots__ = ("user_id", "application_id", "platform", "country_id", "registered")
+
+    def __init__(self, user_id, application_id, platform, country_id):
+        self.user_id = user_id
+        self.application_id = application_id
+        self.platform = platform
+        self.country_id = country_id
+        self.registered = False
+
+
+class Session:
+    __slots__ = ("player", "session_id", "last_event", "match_id", "match_type", "map_id", "level_id")
+
+    def __init__(self, player, session_id):
+        self.player = player
+        self.session_id = session_id
+        self.last_event = None
+        self.match_id = None
+        self.match_type = None
+        self.map_id = None
+        self.level_id = None
+
+
+class PopulationSimulator:
+    """Generates batches of events from `sessions` concurrent player sessions.
+
+    Players are drawn uniformly from a population of `players`, created on first
+    use and assigned to one of `application_ids` at random, in proportion to
+    `application_weights` if given. `generate_batch()` returns ApplicationEvents
+    of a single application, so that every batch can be posted to that
+    application's events endpoint; events are buffered per application until one
+    of them has a full batch. Event fields the simulation does not set are sampled
+    by `generator`, by default an EventGenerator with `items` distinct items.
+    """
+
+    def __init__(
+        self,
+        application_ids,
+        players=DEFAULT_PLAYERS,
+        sessions=DEFAULT_SESSIONS,
+        items=DEFAULT_ITEMS,
+        seed=None,
+        generator=None,
+        application_weights=None,
+    ):
+        self.random = random.Random(seed)
+        self.generator = generator or EventGenerator(seed=seed, pool_sizes={"items": items})
+        self.type_indexes = {
+            event_type: index for index, event_type in enumerate(self.generator.event_types.tolist())
+        }
+        self.transitions = {
+            event_type: (list(weights), list(accumulate(weights.values())))
+            for event_type, weights in SESSION_TRANSITIONS.items()
+        }
+        self.platform_cumulative = list(accumulate(PLATFORM_WEIGHTS))
+        self.country_cumulative = list(accumulate(COUNTRY_WEIGHTS))
+        self.application_ids = list(application_ids)
+        self.application_cumulative = list(accumulate(application_weights)) if application_weights else None
+        self.population = players
+        self.players = {}
+        self.pending = {application_id: [] for application_id in self.application_ids}
+        self.sessions_started = 0
+        self.matches_started = 0
+        self.events = 0
+        self.sessions = [self.new_session() for i in range(0, sessions)]
+
+    def new_uuid(self):
+        return str(uuid.UUID(int=self.random.getrandbits(128), version=4))
+
+    def weighted(self, values, cumulative):
+        return values[bisect_right(cumulative, self.random.random() * cumulative[-1])]
+
+    def player(self, number):
+        player = self.players.get(number)
+        if player is None:
+            if self.application_cumulative is None:
+                application_id = self.random.choice(self.application_ids)
+            else:
+                application_id = self.weighted(self.application_ids, self.application_cumulative)
+            player = Player(
+                self.new_uuid(),
+                application_id,
+                self.weighted(PLATFORMS, self.platform_cumulative),
+                self.weighted(COUNTRIES, self.country_cumulative),
+            )
+            self.players[number] = player
+        return player
+
+    def new_session(self):
+        self.sessions_started += 1
+        return Session(self.player(self.random.randrange(self.population)), self.new_uuid())
+
+    def next_event_type(self, session):
+        if session.last_event is None:
+            return "login" if session.player.registered else "user_registration"
+        event_types, cumulative = self.transitions[session.last_event]
+        return self.weighted(event_types, cumulative)
+
+    def step(self):
+        """Advance a random session by one event, and buffer the event for its application."""
+
+        slot = self.random.randrange(len(self.sessions))
+        session = self.sessions[slot]
+        player = session.player
+        event_type = self.next_event_type(session)
+        overrides = {"user_id": player.user_id, "session_id": session.session_id}
+
+        if event_type == "user_registration":
+            player.registered = True
+            overrides["platform"] = player.platform
+            overrides["country_id"] = player.country_id
+        elif event_type == "login":
+            overrides["platform"] = player.platform
+        elif event_type == "iap_transaction":
+            overrides["country_id"] = player.country_id
+        elif event_type in MATCH_EVENTS:
+            if event_type == "matchmaking_start":
+                session.match_id = self.new_uuid()
+                session.match_type = self.random.choice(MATCH_TYPES)
+            overrides["match_id"] = session.match_id
+            overrides["match_type"] = session.match_type
+        elif event_type in IN_MATCH_EVENTS:
+            if event_type == "match_start":
+                self.matches_started += 1
+                session.map_id = self.random.choice(MAPS)
+            overrides["match_id"] = session.match_id
+            overrides["map_id"] = session.map_id
+        elif event_type in LEVEL_EVENTS:
+            if event_type == "level_started":
+                session.level_id = self.random.choice(LEVELS)
+            overrides["level_id"] = session.level_id
+
+        session.last_event = event_type
+        if event_type == "logout":
+            self.sessions[slot] = self.new_session()
+        self.events += 1
+        self.pending[player.application_id].append((self.type_indexes[event_type], overrides))
+        return player.application_id
+
+    def generate_batch(self, count, now=None):
+        """Return the next `count` events of whichever application fills a batch first."""
+
+        application_id = self.step()
+        while len(self.pending[application_id]) < count:
+            application_id = self.step()
+        pending = self.pending[application_id]
+        batch = pending[:count]
+        del pending[:count]
+        events = self.generator.build_events([type_index for type_index, overrides in batch], now)
+        for event, (type_index, overrides) in zip(events, batch):
+            event["event_data"].update(overrides)
+        return ApplicationEvents(application_id, events)
+
+    def batches(self, batch_size):
+        """Yield batches of `batch_size` events indefinitely."""
+
+        while True:
+            yield self.generate_batch(batch_size)
+
+    def summary(self):
+        """Return the key space cardinalities the simulation has produced so far."""
+
+        return {
+            "applications": len(self.application_ids),
+            "players_seen": len(self.players),
+            "sessions_started": self.sessions_started,
+            "matches_started": self.matches_started,
+            "events": self.events,
+        }
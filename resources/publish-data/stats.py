@@ -0,0 +1,315 @@
+######################################################################################################################
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this
+# software and associated documentation files (the "Software"), to deal in the Software
+# without restriction, including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so.
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+######################################################################################################################
+
+"""Latency and throughput instrumentation for the data publisher."""
+
+import json
+import threading
+import time
+from collections import Counter
+
+DEFAULT_REPORT_INTERVAL = 5.0
+REPORTED_PERCENTILES = (50, 90, 99, 99.9)
+
+# Values below 2^SUB_BUCKET_BITS microseconds are recorded exactly; larger values keep
+# SUB_BUCKET_BITS - 1 significant bits (under 1% relative error).
+SUB_BUCKET_BITS = 7
+SUB_BUCKET_COUNT = 1 << SUB_BUCKET_BITS
+SUB_BUCKET_HALF = SUB_BUCKET_COUNT >> 1
+
+
+class LatencyHistogram:
+    """HDR-style log-linear histogram of latencies in microseconds.
+
+    Counts are kept in a sparse dict of bucket index -> count, so histograms from
+    different threads or processes can be merged exactly.
+    """
+
+    def __init__(self, counts=None):
+        self.counts = Counter(counts or {})
+        self.total = sum(self.counts.values())
+        self.max = max((self.bucket_value(index) for index in self.counts), default=0)
+
+    @staticmethod
+    def bucket_index(value):
+        if value < SUB_BUCKET_COUNT:
+            return value
+        shift = value.bit_length() - SUB_BUCKET_BITS
+        return SUB_BUCKET_COUNT + (shift - 1) * SUB_BUCKET_HALF + ((value >> shift) - SUB_BUCKET_HALF)
+
+    @staticmethod
+    def bucket_value(index):
+        """Return the midpoint of the range of values counted in bucket `index`."""
+
+        if index < SUB_BUCKET_COUNT:
+            return index
+        shift = (index - SUB_BUCKET_COUNT) // SUB_BUCKET_HALF + 1
+        top = (index - SUB_BUCKET_COUNT) % SUB_BUCKET_HALF + SUB_BUCKET_HALF
+        return (top << shift) + (1 << (shift - 1))
+
+    def record(self, seconds):
+        """Record a latency given in seconds."""
+
+        value = max(int(seconds * 1000000), 0)
+        self.counts[self.bucket_index(value)] += 1
+        self.total += 1
+        self.max = max(self.max, value)
+
+    def merge(self, other):
+        """Add all of the values recorded in `other` to this histogram."""
+
+        self.counts.update(other.counts)
+        self.total += other.total
+        self.max = max(self.max, other.max)
+
+    def percentile(self, percentile):
+        """Return the latency in seconds at `percentile` (0-100), or None if empty."""
+
+        if not self.total:
+            return None
+        rank = percentile / 100 * self.total
+        seen = 0
+        for index in sorted(self.counts):
+            seen += self.counts[index]
+            if seen >= rank:
+                return min(self.bucket_value(index), self.max) / 1000000
+        return self.max / 1000000
+
+    def summary(self):
+        """Return the count, max and reported percentiles in milliseconds."""
+
+        summary = {"count": self.total, "max_ms": self.max / 1000}
+        for percentile in REPORTED_PERCENTILES:
+            value = self.percentile(percentile)
+            summary[f"p{percentile:g}_ms"] = None if value is None else value * 1000
+        return summary
+
+
+class LoadStats:
+    """Thread-safe counters and latency histograms for a publisher run.
+
+    `latency` is measured from the time a batch was scheduled to be sent (or queued,
+    when there is no schedule) to the response, so queueing behind slow responses is
+    included. `service_time` covers only the HTTP request itself.
+    """
+
+    def __init__(self, report_interval=DEFAULT_REPORT_INTERVAL):
+        self.report_interval = report_interval
+        self.lock = threading.Lock()
+        self.start = time.perf_counter()
+        self.latency = LatencyHistogram()
+        self.service_time = LatencyHistogram()
+        self.status_codes = Counter()
+        self.requests = 0
+        self.records_sent = 0
+        self.records_accepted = 0
+        self.records_rejected = 0
+        self.bytes_sent = 0
+        self.records_retried = 0
+        self.records_dropped = 0
+        self.interval_latency = LatencyHistogram()
+        self.interval_records = 0
+        self.interval_start = self.start
+        self.reporter = None
+        self.stopped = threading.Event()
+        self.delta_base = {
+            "requests": 0,
+            "records_sent": 0,
+            "records_accepted": 0,
+            "records_rejected": 0,
+            "bytes_sent": 0,
+            "records_retried": 0,
+            "records_dropped": 0,
+            "status_codes": Counter(),
+            "latency": Counter(),
+            "service_time": Counter(),
+        }
+
+    def record_response(self, latency, service_time, status, records, rejected, body_bytes=0):
+        """Record a completed request. `status` is the HTTP status code or an error name."""
+
+        with self.lock:
+            self.requests += 1
+            self.bytes_sent += body_bytes
+            self.status_codes[str(status)] += 1
+            self.latency.record(latency)
+            self.service_time.record(service_time)
+            self.interval_latency.record(latency)
+            self.records_sent += records
+            self.records_accepted += records - rejected
+            self.records_rejected += rejected
+            self.interval_records += records - rejected
+
+    def record_retry(self, records):
+        """Record that `records` rejected records were queued to be sent again."""
+
+        with self.lock:
+            self.records_retried += records
+
+    def record_drop(self, records):
+        """Record that `records` rejected records were given up on without being retried."""
+
+        with self.lock:
+            self.records_dropped += records
+
+    def take_delta(self):
+        """Return everything recorded since the previous call, as a picklable dict.
+
+        Worker processes periodically ship these deltas to the parent, which adds
+        them up with merge_delta().
+        """
+
+        with self.lock:
+            previous = self.delta_base
+            current = {
+                "requests": self.requests,
+                "records_sent": self.records_sent,
+                "records_accepted": self.records_accepted,
+                "records_rejected": self.records_rejected,
+                "bytes_sent": self.bytes_sent,
+                "records_retried": self.records_retried,
+                "records_dropped": self.records_dropped,
+                "status_codes": Counter(self.status_codes),
+                "latency": Counter(self.latency.counts),
+                "service_time": Counter(self.service_time.counts),
+            }
+            self.delta_base = current
+            delta = {
+                name: current[name] - previous[name]
+                for name in (
+                    "requests",
+                    "records_sent",
+                    "records_accepted",
+                    "records_rejected",
+                    "bytes_sent",
+                    "records_retried",
+                    "records_dropped",
+                )
+            }
+            delta["status_codes"] = dict(current["status_codes"] - previous["status_codes"])
+            delta["latency"] = dict(current["latency"] - previous["latency"])
+            delta["service_time"] = dict(current["service_time"] - previous["service_time"])
+            delta["latency_max"] = self.latency.max
+            delta["service_time_max"] = self.service_time.max
+            return delta
+
+    def merge_delta(self, delta):
+        """Add a delta taken from another LoadStats with take_delta()."""
+
+        latency = LatencyHistogram(delta["latency"])
+        latency.max = delta["latency_max"]
+        service_time = LatencyHistogram(delta["service_time"])
+        service_time.max = delta["service_time_max"]
+        with self.lock:
+            self.requests += delta["requests"]
+            self.records_sent += delta["records_sent"]
+            self.records_accepted += delta["records_accepted"]
+            self.records_rejected += delta["records_rejected"]
+            self.bytes_sent += delta["bytes_sent"]
+            self.records_retried += delta["records_retried"]
+            self.records_dropped += delta["records_dropped"]
+            self.status_codes.update(delta["status_codes"])
+            self.latency.merge(latency)
+            self.service_time.merge(service_time)
+            self.interval_latency.merge(latency)
+            self.interval_records += delta["records_accepted"]
+
+    def start_reporting(self):
+        """Print a rolling summary every report interval from a background thread."""
+
+        self.reporter = threading.Thread(target=self.report_loop, name="stats", daemon=True)
+        self.reporter.start()
+
+    def report_loop(self):
+        while not self.stopped.wait(self.report_interval):
+            self.print_interval()
+
+    def print_interval(self):
+        now = time.perf_counter()
+        with self.lock:
+            interval = now - self.interval_start
+            latency = self.interval_latency.summary()
+            throughput = self.interval_records / interval if interval else 0
+            self.interval_latency = LatencyHistogram()
+            self.interval_records = 0
+            self.interval_start = now
+            status_codes = dict(self.status_codes)
+            rejected = self.records_rejected
+        if not latency["count"]:
+            print(f"[stats] no responses in the last {interval:.1f}s")
+            return
+        print(
+            f"[stats] {throughput:,.0f} records/sec accepted, {latency['count']} requests, "
+            f"latency p50 {latency['p50_ms']:.1f}ms p99 {latency['p99_ms']:.1f}ms "
+            f"p99.9 {latency['p99.9_ms']:.1f}ms, status {status_codes}, rejected {rejected}"
+        )
+
+    def report(self):
+        """Return the totals for the run as a JSON-serializable dict."""
+
+        with self.lock:
+            elapsed = time.perf_counter() - self.start
+            return {
+                "elapsed_seconds": elapsed,
+                "requests": self.requests,
+                "records_sent": self.records_sent,
+                "records_accepted": self.records_accepted,
+                "records_rejected": self.records_rejected,
+                "records_per_second": self.records_accepted / elapsed if elapsed else 0,
+                "requests_per_second": self.requests / elapsed if elapsed else 0,
+                "bytes_sent": self.bytes_sent,
+                "bytes_per_event": self.bytes_sent / self.records_sent if self.records_sent else 0,
+                "records_retried": self.records_retried,
+                "records_dropped": self.records_dropped,
+                "status_codes": dict(self.status_codes),
+                "latency": self.latency.summary(),
+                "service_time": self.service_time.summary(),
+            }
+
+    def stop(self, report_file=None):
+        """Stop periodic reporting, print the final summary and optionally write it as JSON."""
+
+        self.stopped.set()
+        report = self.report()
+        latency = report["latency"]
+        print("===========================================")
+        print("LOAD SUMMARY:")
+        print(f"- ELAPSED: {report['elapsed_seconds']:.1f}s")
+        print(f"- REQUESTS: {report['requests']} {report['status_codes']}")
+        print(f"- RECORDS ACCEPTED: {report['records_accepted']}")
+        print(f"- RECORDS REJECTED: {report['records_rejected']}")
+        if report["records_retried"] or report["records_dropped"]:
+            print(
+                f"- RETRIES: {report['records_retried']} rejected records retried, "
+                f"{report['records_dropped']} given up on"
+            )
+        print(f"- THROUGHPUT: {report['records_per_second']:,.0f} records/sec")
+        print(
+            f"- BYTES ON WIRE: {report['bytes_sent']:,} request body bytes, "
+            f"{report['bytes_per_event']:.1f} bytes/event"
+        )
+        if latency["count"]:
+            print(
+                f"- LATENCY: p50 {latency['p50_ms']:.1f}ms, p90 {latency['p90_ms']:.1f}ms, "
+                f"p99 {latency['p99_ms']:.1f}ms, p99.9 {latency['p99.9_ms']:.1f}ms, "
+                f"max {latency['max_ms']:.1f}ms"
+            )
+        print("===========================================\n")
+        if report_file:
+            with open(report_file, "w") as file:
+                json.dump(report, file, indent=2)
+            print(f"Wrote report to {report_file}")
+        return report
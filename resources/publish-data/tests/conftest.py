@@ -0,0 +1,105 @@
+######################################################################################################################
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this
+# software and associated documentation files (the "Software"), to deal in the Software
+# without restriction, including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so.
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+######################################################################################################################
+
+"""Tests of the event publisher, run with `python -m pytest tests` from its directory."""
+
+import gzip
+import json
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+
+
+class StubEndpoint:
+    """A local events endpoint that records every request and answers as `respond` says.
+
+    `respond(events)` returns the (status, JSON body) for a request's events; by
+    default every event is accepted. `delay` holds each response for that many
+    seconds, so that tests can observe how many requests are in flight at once.
+    """
+
+    def __init__(self):
+        self.requests = []
+        self.connections = set()
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.delay = 0.0
+        self.lock = threading.Lock()
+        self.respond = accept_all
+
+    def handle(self, handler):
+        body = handler.rfile.read(int(handler.headers["Content-Length"]))
+        with self.lock:
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+            self.connections.add(handler.client_address)
+        try:
+            if handler.headers.get("Content-Encoding") == "gzip":
+                body = gzip.decompress(body)
+            events = json.loads(body)["events"]
+            with self.lock:
+                self.requests.append((handler.path, dict(handler.headers), events))
+            time.sleep(self.delay)
+            status, response = self.respond(events)
+        finally:
+            with self.lock:
+                self.in_flight -= 1
+        data = json.dumps(response).encode("utf-8")
+        handler.send_response(status)
+        handler.send_header("Content-Type", "application/json")
+        handler.send_header("Content-Length", str(len(data)))
+        handler.end_headers()
+        handler.wfile.write(data)
+
+    def events(self):
+        return [event for path, headers, events in self.requests for event in events]
+
+
+def accept_all(events):
+    return 200, {"FailedRecordCount": 0, "Events": [{"Result": "Ok"} for event in events]}
+
+
+@pytest.fixture
+def stub_endpoint():
+    """Yield a StubEndpoint and the URL of its events API, served on a free local port."""
+
+    endpoint = StubEndpoint()
+
+    class Handler(BaseHTTPRequestHandler):
+        # Keep-alive, so that connection reuse can be observed
+        protocol_version = "HTTP/1.1"
+
+        def do_POST(self):
+            endpoint.handle(self)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield endpoint, f"http://127.0.0.1:{server.server_address[1]}/applications/app/events"
+    finally:
+        server.shutdown()
+        server.server_close()
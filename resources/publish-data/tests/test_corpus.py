@@ -0,0 +1,167 @@
+######################################################################################################################
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this
+# software and associated documentation files (the "Software"), to deal in the Software
+# without restriction, including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so.
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+######################################################################################################################
+
+import gzip
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+from corpus import FORMAT_VERSION, HEADER, MAGIC, CorpusReader, write_corpus
+
+HANDLER = os.path.join(os.path.dirname(os.path.dirname(os.path.realpath(__file__))), "handler.py")
+
+
+def generate(path, seed, events=1000, batch_size=100):
+    subprocess.run(
+        [
+            sys.executable,
+            HANDLER,
+            "generate",
+            "--output",
+            str(path),
+            "--seed",
+            str(seed),
+            "--events",
+            str(events),
+            "--batch-size",
+            str(batch_size),
+        ],
+        check=True,
+        capture_output=True,
+    )
+    return path.read_bytes()
+
+
+def chunk_events(batch):
+    return json.loads(gzip.decompress(batch.body))["events"]
+
+
+@pytest.fixture
+def corpus(tmp_path):
+    """A corpus of 1,050 events in 11 chunks, the last of 50 events."""
+
+    path = tmp_path / "events.corpus"
+    write_corpus(str(path), 7, 1050, 100)
+    reader = CorpusReader(str(path))
+    yield reader
+    reader.close()
+
+
+def test_same_seed_writes_the_same_bytes(tmp_path):
+    first = generate(tmp_path / "first.corpus", 7)
+    assert generate(tmp_path / "second.corpus", 7) == first
+    assert generate(tmp_path / "other.corpus", 8) != first
+
+
+def test_chunks_match_the_index(corpus):
+    assert len(corpus) == 11
+    assert corpus.index["event_count"] == 1050
+    assert corpus.index["format_version"] == FORMAT_VERSION
+    event_ids = set()
+    for number in range(0, len(corpus)):
+        offset, length, event_count, first_timestamp, last_timestamp = corpus.chunks[number]
+        batch = corpus.chunk(number)
+        assert batch.content_encoding == "gzip"
+        assert len(batch.body) == length
+        events = chunk_events(batch)
+        assert len(events) == batch.record_count == event_count == (50 if number == 10 else 100)
+        assert events[0]["event_timestamp"] == first_timestamp
+        assert events[-1]["event_timestamp"] == last_timestamp
+        event_ids.update(event["event_id"] for event in events)
+    assert len(event_ids) == 1050
+
+
+def test_timestamps_advance_at_the_corpus_rate(tmp_path):
+    path = tmp_path / "events.corpus"
+    index = write_corpus(str(path), 7, 500, 100, start_time=1000, events_per_second=50)
+    assert [chunk[3:] for chunk in index["chunks"]] == [
+        [1000, 1001],
+        [1002, 1003],
+        [1004, 1005],
+        [1006, 1007],
+        [1008, 1009],
+    ]
+
+
+def test_batches_from_a_start_chunk(corpus):
+    assert [batch.body for batch in corpus.batches(8)] == [corpus.chunk(number).body for number in (8, 9, 10)]
+    assert list(corpus.batches(11)) == []
+
+
+@pytest.mark.parametrize(
+    "start_chunk, stride, expected",
+    [
+        # A single sender wraps around to the first chunk
+        (8, 1, [8, 9, 10, 0, 1, 2, 3]),
+        # Interleaved workers wrap around to their own first chunk
+        (2, 4, [2, 6, 10, 2, 6, 10, 2]),
+        (7, 4, [7, 3, 7, 3, 7, 3, 7]),
+        (3, 4, [3, 7, 3, 7, 3, 7, 3]),
+    ],
+)
+def test_looping_batches_wrap_around(corpus, start_chunk, stride, expected):
+    batches = corpus.batches(start_chunk, stride, loop=True)
+    bodies = [next(batches).body for i in range(0, len(expected))]
+    assert bodies == [corpus.chunk(number).body for number in expected]
+
+
+def test_interleaved_workers_send_the_corpus_once(corpus):
+    sent = [batch.body for worker in range(0, 3) for batch in corpus.batches(worker, 3)]
+    assert sorted(sent) == sorted(corpus.chunk(number).body for number in range(0, len(corpus)))
+
+
+def test_looping_an_empty_range_ends(corpus):
+    assert list(corpus.batches(20, 1, loop=True)) == []
+
+
+def rewrite(path, offset, value):
+    data = bytearray(path.read_bytes())
+    data[offset : offset + len(value)] = value
+    path.write_bytes(bytes(data))
+
+
+def test_bad_magic_is_rejected(tmp_path):
+    path = tmp_path / "events.corpus"
+    write_corpus(str(path), 7, 100, 10)
+    rewrite(path, 0, b"NOTACORP")
+    with pytest.raises(ValueError, match="is not an event corpus"):
+        CorpusReader(str(path))
+
+
+def test_bad_footer_magic_is_rejected(tmp_path):
+    path = tmp_path / "events.corpus"
+    write_corpus(str(path), 7, 100, 10)
+    rewrite(path, path.stat().st_size - len(MAGIC), b"NOTACORP")
+    with pytest.raises(ValueError, match="is not an event corpus"):
+        CorpusReader(str(path))
+
+
+def test_unsupported_version_is_rejected(tmp_path):
+    path = tmp_path / "events.corpus"
+    write_corpus(str(path), 7, 100, 10)
+    rewrite(path, 0, HEADER.pack(MAGIC, FORMAT_VERSION + 1))
+    with pytest.raises(ValueError, match=f"unsupported corpus format version {FORMAT_VERSION + 1}"):
+        CorpusReader(str(path))
+
+
+def test_other_files_are_rejected(tmp_path):
+    path = tmp_path / "events.ndjson"
+    path.write_bytes(b'{"event": {}}\n' * 10)
+    with pytest.raises(ValueError, match="is not an event corpus"):
+        CorpusReader(str(path))
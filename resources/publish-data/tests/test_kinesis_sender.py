@@ -0,0 +1,156 @@
+######################################################################################################################
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this
+# software and associated documentation files (the "Software"), to deal in the Software
+# without restriction, including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so.
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+######################################################################################################################
+
+import json
+
+import pytest
+
+from adaptive import RetryPolicy
+from stats import LoadStats
+
+pytest.importorskip("boto3")
+moto = pytest.importorskip("moto")
+
+from botocore.exceptions import ClientError  # noqa: E402
+
+from kinesis_sender import KinesisSender  # noqa: E402
+
+STREAM = "events"
+REGION = "us-east-1"
+
+
+@pytest.fixture
+def kinesis(monkeypatch):
+    """Yield a client of a moto Kinesis stream with 2 shards."""
+
+    for name in ("AWS_ACCESS_KEY_ID", "AWS_SECRET_ACCESS_KEY", "AWS_SESSION_TOKEN"):
+        monkeypatch.setenv(name, "testing")
+    with moto.mock_aws():
+        import boto3
+
+        client = boto3.client("kinesis", region_name=REGION)
+        client.create_stream(StreamName=STREAM, ShardCount=2)
+        yield client
+
+
+def events(count):
+    return [{"event_id": f"event-{i}", "event_type": "login"} for i in range(0, count)]
+
+
+def stream_event_ids(client):
+    """Return the event ids of every record in the stream, in no particular order."""
+
+    event_ids = []
+    for shard in client.list_shards(StreamName=STREAM)["Shards"]:
+        iterator = client.get_shard_iterator(
+            StreamName=STREAM, ShardId=shard["ShardId"], ShardIteratorType="TRIM_HORIZON"
+        )["ShardIterator"]
+        while True:
+            response = client.get_records(ShardIterator=iterator)
+            event_ids.extend(json.loads(record["Data"])["event"]["event_id"] for record in response["Records"])
+            if not response["Records"]:
+                break
+            iterator = response["NextShardIterator"]
+    return event_ids
+
+
+def sender(stats):
+    return KinesisSender(
+        STREAM,
+        "app",
+        2,
+        stats=stats,
+        verbose=False,
+        log_failures=False,
+        region=REGION,
+        retry_policy=RetryPolicy(5, base_delay=0.001, seed=7),
+    )
+
+
+def test_failed_records_are_resent_and_accepted_ones_are_not(kinesis, monkeypatch):
+    stats = LoadStats()
+    kinesis_sender = sender(stats)
+    put_records = kinesis_sender.client.put_records
+    calls = []
+
+    def partially_failing_put_records(Records, **arguments):
+        # The first call writes only every third record, and reports the others as throttled
+        calls.append([json.loads(record["Data"])["event"]["event_id"] for record in Records])
+        if len(calls) > 1:
+            return put_records(Records=Records, **arguments)
+        response = put_records(Records=Records[::3], **arguments)
+        written = iter(response["Records"])
+        response["Records"] = [
+            next(written)
+            if position % 3 == 0
+            else {"ErrorCode": "ProvisionedThroughputExceededException", "ErrorMessage": "Rate exceeded"}
+            for position in range(0, len(Records))
+        ]
+        response["FailedRecordCount"] = sum("ErrorCode" in result for result in response["Records"])
+        return response
+
+    monkeypatch.setattr(kinesis_sender.client, "put_records", partially_failing_put_records)
+    kinesis_sender.submit(events(30))
+    kinesis_sender.close()
+    sent = [event["event_id"] for event in events(30)]
+    assert calls == [sent, [event_id for position, event_id in enumerate(sent) if position % 3]]
+    assert sorted(stream_event_ids(kinesis)) == sorted(sent)
+    assert stats.requests == 2
+    assert stats.records_rejected == 20
+    assert stats.records_retried == 20
+    assert stats.records_dropped == 0
+
+
+def test_throttled_calls_are_resent(kinesis, monkeypatch):
+    stats = LoadStats()
+    kinesis_sender = sender(stats)
+    put_records = kinesis_sender.client.put_records
+    calls = []
+
+    def throttled_put_records(Records, **arguments):
+        calls.append(len(Records))
+        if len(calls) == 1:
+            raise ClientError({"Error": {"Code": "ThrottlingException", "Message": "Rate exceeded"}}, "PutRecords")
+        return put_records(Records=Records, **arguments)
+
+    monkeypatch.setattr(kinesis_sender.client, "put_records", throttled_put_records)
+    kinesis_sender.submit(events(10))
+    kinesis_sender.close()
+    assert calls == [10, 10]
+    assert sorted(stream_event_ids(kinesis)) == sorted(event["event_id"] for event in events(10))
+    assert stats.status_codes == {"ThrottlingException": 1, "200": 1}
+    assert stats.records_dropped == 0
+
+
+def test_records_are_dropped_after_max_attempts(kinesis, monkeypatch):
+    stats = LoadStats()
+    kinesis_sender = sender(stats)
+    calls = []
+
+    def failing_put_records(Records, **arguments):
+        calls.append(len(Records))
+        return {
+            "FailedRecordCount": len(Records),
+            "Records": [{"ErrorCode": "InternalFailure", "ErrorMessage": "Internal"} for record in Records],
+        }
+
+    monkeypatch.setattr(kinesis_sender.client, "put_records", failing_put_records)
+    kinesis_sender.submit(events(10))
+    kinesis_sender.close()
+    assert calls == [10] * 5
+    assert stream_event_ids(kinesis) == []
+    assert stats.records_retried == 40
+    assert stats.records_dropped == 10
@@ -0,0 +1,95 @@
+######################################################################################################################
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this
+# software and associated documentation files (the "Software"), to deal in the Software
+# without restriction, including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so.
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+######################################################################################################################
+
+import pytest
+
+from handler import parse_cmd_line
+from scheduler import ARRIVALS, ARRIVAL_POISSON, ARRIVAL_UNIFORM, OpenLoopScheduler, RateProfile
+
+SEND = ["send", "--application-id", "app", "--api-path", "http://localhost:8080/events", "--api-key", "key"]
+
+
+def offsets(profile, arrival, duration=None, batch_size=100):
+    scheduler = OpenLoopScheduler(profile, batch_size, arrival, seed=7)
+    return list(scheduler.schedule(0.0, duration))
+
+
+@pytest.mark.parametrize("arrival", ARRIVALS)
+@pytest.mark.parametrize("duration", [None, 6.0])
+def test_ramp_down_to_zero_ends_the_schedule(arrival, duration):
+    # 3 seconds ramping down from 1000 events/sec: 1500 events, or 15 batches of 100
+    profile = RateProfile.parse("0:1000,3:0")
+    scheduled = offsets(profile, arrival, duration)
+    assert scheduled == sorted(scheduled)
+    assert all(0 <= offset < 3.0 for offset in scheduled)
+    if arrival == ARRIVAL_UNIFORM:
+        assert len(scheduled) == 15
+    else:
+        assert 5 <= len(scheduled) <= 30
+
+
+@pytest.mark.parametrize("arrival", ARRIVALS)
+def test_ramp_down_then_idle_ends_the_schedule(arrival):
+    profile = RateProfile.parse("0:1000,2:1000,3:0,10:0")
+    assert profile.ends()
+    scheduled = offsets(profile, arrival)
+    assert scheduled and scheduled[-1] < 3.0
+
+
+@pytest.mark.parametrize("arrival", ARRIVALS)
+def test_duration_ends_the_schedule(arrival):
+    scheduled = offsets(RateProfile.constant(1000), arrival, duration=2.0)
+    assert all(offset < 2.0 for offset in scheduled)
+    if arrival == ARRIVAL_UNIFORM:
+        # The batch accrued at 2 seconds would start as the run stops
+        assert len(scheduled) == 19
+    else:
+        assert 10 <= len(scheduled) <= 30
+
+
+@pytest.mark.parametrize("arrival", ARRIVALS)
+def test_duration_ends_a_schedule_before_the_profile_does(arrival):
+    profile = RateProfile.parse("0:1000,10:0")
+    scheduled = offsets(profile, arrival, duration=2.0)
+    assert scheduled and scheduled == [offset for offset in offsets(profile, arrival) if offset < 2.0]
+
+
+def test_poisson_follows_the_target_rate():
+    scheduled = offsets(RateProfile.constant(1000), ARRIVAL_POISSON, duration=100.0)
+    # 1000 batches expected, with a standard deviation of about 32
+    assert 900 <= len(scheduled) <= 1100
+
+
+def test_ends():
+    assert RateProfile.parse("0:1000,60:0").ends()
+    assert not RateProfile.parse("0:0,60:1000").ends()
+    assert not RateProfile.constant(1000, ramp_up=10).ends()
+
+
+def test_profile_ending_at_zero_needs_a_duration(capsys):
+    with pytest.raises(SystemExit):
+        parse_cmd_line(SEND + ["--ramp-profile", "0:1000,60:0"])
+    assert "--duration" in capsys.readouterr().err
+    args = parse_cmd_line(SEND + ["--ramp-profile", "0:1000,60:0", "--duration", "60"])
+    assert args.duration == 60
+    args = parse_cmd_line(SEND + ["--ramp-profile", "0:1000,60:2000"])
+    assert args.duration is None
+
+
+def test_invalid_ramp_profile_is_rejected(capsys):
+    with pytest.raises(SystemExit):
+        parse_cmd_line(SEND + ["--ramp-profile", "0:1000,60"])
+    assert "Invalid --ramp-profile" in capsys.readouterr().err
@@ -0,0 +1,269 @@
+######################################################################################################################
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this
+# software and associated documentation files (the "Software"), to deal in the Software
+# without restriction, including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so.
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+######################################################################################################################
+
+import gzip
+import json
+import threading
+
+import pytest
+
+from adaptive import RetryPolicy
+from handler import parse_cmd_line
+from sender import (
+    ApplicationEvents,
+    ConcurrentSender,
+    PayloadEncoder,
+    encode_batch,
+    failed_records,
+    rejected_record_count,
+)
+from stats import LoadStats
+
+
+def events(count, start=0):
+    return [{"event_id": str(i)} for i in range(start, start + count)]
+
+
+def send(url, batches, retry_policy=None, stats=None, **options):
+    sender = ConcurrentSender(url, "key", 4, stats=stats, verbose=False, retry_policy=retry_policy, **options)
+    futures = [sender.submit(batch) for batch in batches]
+    sender.close()
+    return [future.result() for future in futures]
+
+
+def fast_retries(max_attempts=5):
+    return RetryPolicy(max_attempts, base_delay=0.001, seed=7)
+
+
+class Response:
+    """The parts of a requests.Response that rejected_record_count and failed_records read."""
+
+    def __init__(self, status_code, body):
+        self.status_code = status_code
+        self.body = body
+
+    def json(self):
+        if isinstance(self.body, Exception):
+            raise self.body
+        return self.body
+
+
+def test_bounded_sender_keeps_at_most_concurrency_batches_in_flight(stub_endpoint):
+    endpoint, url = stub_endpoint
+    endpoint.delay = 0.05
+    sender = ConcurrentSender(url, "key", 3, verbose=False)
+    futures = []
+    for start in range(0, 120, 10):
+        futures.append(sender.submit(events(10, start)))
+        # submit() blocks until a slot is free, so at most 3 batches are ever pending
+        assert sum(not future.done() for future in futures) <= 3
+    sender.close()
+    assert all(future.result().status_code == 200 for future in futures)
+    assert endpoint.max_in_flight == 3
+    assert len(endpoint.events()) == 120
+
+
+def test_unbounded_sender_queues_batches_beyond_concurrency(stub_endpoint):
+    endpoint, url = stub_endpoint
+    endpoint.delay = 0.05
+    sender = ConcurrentSender(url, "key", 3, bounded=False, verbose=False)
+    futures = [sender.submit(events(10, start)) for start in range(0, 120, 10)]
+    assert sum(not future.done() for future in futures) > 3
+    sender.close()
+    assert endpoint.max_in_flight == 3
+    assert len(endpoint.events()) == 120
+
+
+def test_each_thread_reuses_its_own_session(stub_endpoint):
+    endpoint, url = stub_endpoint
+    sender = ConcurrentSender(url, "key", 4, verbose=False)
+    sessions = sender.executor.map(lambda i: sender.session(), range(0, 40))
+    assert len({id(session) for session in sessions}) <= 4
+    main_session = sender.session()
+    assert sender.session() is main_session
+    other = []
+    thread = threading.Thread(target=lambda: other.append(sender.session()))
+    thread.start()
+    thread.join()
+    assert other[0] is not main_session
+    for start in range(0, 400, 10):
+        sender.submit(events(10, start))
+    sender.close()
+    # Keep-alive: one connection per sender thread, not one per request
+    assert len(endpoint.requests) == 40
+    assert len(endpoint.connections) <= 4
+
+
+def test_gzip_bodies(stub_endpoint):
+    endpoint, url = stub_endpoint
+    stats = LoadStats()
+    send(url, [events(10)], stats=stats, encoder=PayloadEncoder(compress=True))
+    path, headers, sent = endpoint.requests[0]
+    assert headers["Content-Encoding"] == "gzip"
+    assert sent == events(10)
+    assert stats.bytes_sent == len(encode_batch(events(10), compress=True).body)
+    send(url, [events(10)])
+    path, headers, sent = endpoint.requests[1]
+    assert "Content-Encoding" not in headers
+    assert sent == events(10)
+
+
+def test_payload_encoder_converts_encoded_batches():
+    plain = encode_batch(events(10))
+    compressed = encode_batch(events(10), compress=True)
+    assert compressed.content_encoding == "gzip"
+    assert gzip.decompress(compressed.body) == plain.body
+    # Compression is deterministic, and bodies already in the requested encoding are sent as they are
+    assert encode_batch(events(10), compress=True) == compressed
+    assert PayloadEncoder(compress=True).encode(compressed) is compressed
+    assert PayloadEncoder(compress=True).encode(plain) == compressed
+    assert PayloadEncoder().encode(compressed) == plain
+    assert PayloadEncoder().encode(plain) is plain
+    assert json.loads(plain.body) == {"events": events(10)}
+    assert plain.record_count == compressed.record_count == 10
+
+
+def test_applications_are_posted_to_their_own_path(stub_endpoint):
+    endpoint, url = stub_endpoint
+    url = url.replace("/app/", "/{application_id}/")
+    send(url, [ApplicationEvents("first", events(2)), ApplicationEvents("second", events(3))])
+    assert sorted(path for path, headers, sent in endpoint.requests) == [
+        "/applications/first/events",
+        "/applications/second/events",
+    ]
+
+
+@pytest.mark.parametrize(
+    "response, rejected",
+    [
+        (Response(200, {"FailedRecordCount": 0, "Events": []}), 0),
+        (Response(200, {"FailedRecordCount": 3, "Events": []}), 3),
+        (Response(200, {}), 0),
+        (Response(200, ValueError("not JSON")), 0),
+        (Response(200, ["not", "a", "dict"]), 0),
+        (Response(429, {"message": "Too Many Requests"}), 10),
+        (Response(500, ValueError("not JSON")), 10),
+        (None, 10),
+    ],
+)
+def test_rejected_record_count(response, rejected):
+    assert rejected_record_count(response, 10) == rejected
+
+
+def test_failed_records():
+    records = events(4)
+    results = [{"Result": "Ok"}, {"ErrorCode": "InternalFailure"}, {"Result": "Ok"}, None]
+    response = Response(200, {"FailedRecordCount": 2, "Events": results})
+    assert failed_records(response, records) == [records[1], records[3]]
+    failed = failed_records(response, ApplicationEvents("app", records))
+    assert isinstance(failed, ApplicationEvents) and failed.application_id == "app"
+    # Results that cannot be matched to the records leave the failed records unknown
+    assert failed_records(Response(200, {"Events": results[:3]}), records) is None
+    assert failed_records(Response(200, ValueError("not JSON")), records) is None
+
+
+def test_rejected_records_are_counted(stub_endpoint):
+    endpoint, url = stub_endpoint
+
+    def respond(batch):
+        results = [{"Result": "Ok"} if i % 5 else {"ErrorCode": "InternalFailure"} for i in range(len(batch))]
+        return 200, {"FailedRecordCount": sum("ErrorCode" in result for result in results), "Events": results}
+
+    endpoint.respond = respond
+    stats = LoadStats()
+    send(url, [events(10, start) for start in range(0, 50, 10)], stats=stats)
+    assert stats.requests == 5
+    assert stats.records_sent == 50
+    assert stats.records_rejected == 10
+    assert stats.records_accepted == 40
+    assert stats.status_codes == {"200": 5}
+
+
+def test_throttled_batches_are_retried(stub_endpoint):
+    endpoint, url = stub_endpoint
+    throttled = set()
+
+    def respond(batch):
+        # Throttle the first attempt of every batch
+        first = batch[0]["event_id"]
+        if first not in throttled:
+            throttled.add(first)
+            return 429, {"message": "Too Many Requests"}
+        return 200, {"FailedRecordCount": 0, "Events": [{"Result": "Ok"} for event in batch]}
+
+    endpoint.respond = respond
+    stats = LoadStats()
+    responses = send(url, [events(10, start) for start in range(0, 50, 10)], fast_retries(), stats, log_failures=False)
+    assert all(response.status_code == 200 for response in responses)
+    assert len(endpoint.requests) == 10
+    assert sorted(event["event_id"] for event in endpoint.events()) == sorted([str(i) for i in range(0, 50)] * 2)
+    assert stats.records_retried == 50
+    assert stats.records_dropped == 0
+
+
+def test_only_failed_records_of_a_partial_failure_are_resent(stub_endpoint):
+    endpoint, url = stub_endpoint
+
+    def respond(batch):
+        # Records with odd ids fail the first time they are sent
+        results = [
+            {"Result": "Ok"} if int(event["event_id"]) % 2 == 0 or len(batch) < 10 else {"Result": "Error"}
+            for event in batch
+        ]
+        return 200, {"FailedRecordCount": sum(result["Result"] != "Ok" for result in results), "Events": results}
+
+    endpoint.respond = respond
+    stats = LoadStats()
+    send(url, [events(10)], fast_retries(), stats, log_failures=False)
+    sent = [[event["event_id"] for event in batch] for path, headers, batch in endpoint.requests]
+    assert sent == [[str(i) for i in range(0, 10)], ["1", "3", "5", "7", "9"]]
+    assert stats.records_retried == 5
+    assert stats.records_dropped == 0
+
+
+def test_retries_stop_after_max_attempts(stub_endpoint):
+    endpoint, url = stub_endpoint
+    endpoint.respond = lambda batch: (503, {"message": "Service Unavailable"})
+    stats = LoadStats()
+    responses = send(url, [events(10)], fast_retries(3), stats, log_failures=False)
+    assert responses[0].status_code == 503
+    assert len(endpoint.requests) == 3
+    assert stats.records_retried == 20
+    assert stats.records_dropped == 10
+
+
+def test_client_errors_are_not_retried(stub_endpoint):
+    endpoint, url = stub_endpoint
+    endpoint.respond = lambda batch: (400, {"message": "Invalid request body"})
+    stats = LoadStats()
+    send(url, [events(10)], fast_retries(), stats, log_failures=False)
+    assert len(endpoint.requests) == 1
+    assert stats.records_dropped == 10
+
+
+def test_failures_are_not_retried_without_a_retry_policy(stub_endpoint):
+    endpoint, url = stub_endpoint
+    endpoint.respond = lambda batch: (429, {"message": "Too Many Requests"})
+    send(url, [events(10)], log_failures=False)
+    assert len(endpoint.requests) == 1
+
+
+def test_retry_queue_size_needs_adaptive(capsys):
+    send_args = ["send", "--application-id", "app", "--api-path", "http://localhost:8080", "--api-key", "key"]
+    with pytest.raises(SystemExit):
+        parse_cmd_line(send_args + ["--concurrency", "4", "--retry-queue-size", "10"])
+    assert "--adaptive" in capsys.readouterr().err
+    assert parse_cmd_line(send_args + ["--adaptive", "--retry-queue-size", "10"]).retry_queue_size == 10
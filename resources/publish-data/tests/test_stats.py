@@ -0,0 +1,153 @@
+######################################################################################################################
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this
+# software and associated documentation files (the "Software"), to deal in the Software
+# without restriction, including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so.
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+######################################################################################################################
+
+import math
+import pickle
+import random
+
+import pytest
+
+from stats import REPORTED_PERCENTILES, LatencyHistogram, LoadStats
+
+
+def latencies(count, seed=7):
+    """Log-normally distributed latencies in seconds, from about 1ms to a few seconds."""
+
+    rng = random.Random(seed)
+    return [rng.lognormvariate(math.log(0.05), 1.2) for i in range(0, count)]
+
+
+def exact_percentile(values, percentile):
+    """The percentile of the microsecond values a histogram records, with the same rank rule."""
+
+    micros = sorted(int(value * 1000000) for value in values)
+    rank = max(math.ceil(percentile / 100 * len(micros)), 1)
+    return micros[rank - 1] / 1000000
+
+
+@pytest.mark.parametrize("value", [0, 1, 127, 128, 129, 255, 256, 1000, 12345, 999999, 10**7, 2**40 + 12345])
+def test_buckets_keep_values_within_one_percent(value):
+    index = LatencyHistogram.bucket_index(value)
+    assert abs(LatencyHistogram.bucket_value(index) - value) <= value / 100
+    # Bucket indexes grow with the value, so that sorting indexes sorts values
+    assert LatencyHistogram.bucket_index(value + 1) >= index
+
+
+def test_small_values_are_exact():
+    histogram = LatencyHistogram()
+    for micros in range(0, 128):
+        histogram.record(micros / 1000000)
+    assert len(histogram.counts) == 128
+    assert histogram.percentile(50) == 63 / 1000000
+
+
+@pytest.mark.parametrize("percentile", [1, 10, 50, 90, 99, 99.9, 100])
+def test_percentile_error_is_under_one_percent(percentile):
+    values = latencies(100000)
+    histogram = LatencyHistogram()
+    for value in values:
+        histogram.record(value)
+    exact = exact_percentile(values, percentile)
+    assert histogram.percentile(percentile) == pytest.approx(exact, rel=0.01)
+
+
+def test_empty_histogram():
+    histogram = LatencyHistogram()
+    assert histogram.percentile(50) is None
+    assert histogram.summary() == {"count": 0, "max_ms": 0, **{f"p{p:g}_ms": None for p in REPORTED_PERCENTILES}}
+
+
+def test_merge_matches_a_single_histogram():
+    values = latencies(20000)
+    single = LatencyHistogram()
+    parts = [LatencyHistogram() for i in range(0, 4)]
+    for i, value in enumerate(values):
+        single.record(value)
+        parts[i % 4].record(value)
+    merged = LatencyHistogram()
+    for part in parts:
+        merged.merge(part)
+    assert merged.counts == single.counts
+    assert merged.total == single.total == 20000
+    assert merged.max == single.max
+    assert merged.summary() == single.summary()
+    # A histogram rebuilt from the counts alone loses only the exact maximum
+    rebuilt = LatencyHistogram(single.counts)
+    assert rebuilt.percentile(50) == single.percentile(50)
+    assert rebuilt.max == pytest.approx(single.max, rel=0.01)
+
+
+def record_responses(stats, rng, count):
+    for i in range(0, count):
+        status = rng.choice([200, 200, 200, 429, 503, "ConnectionError"])
+        records = rng.randint(1, 100)
+        rejected = rng.randint(0, records) if status == 200 and rng.random() < 0.2 else 0
+        if status != 200:
+            rejected = records
+        latency = rng.lognormvariate(math.log(0.05), 1.2)
+        stats.record_response(latency, latency / 2, status, records, rejected, records * 250)
+        if rejected:
+            stats.record_retry(rejected // 2)
+            stats.record_drop(rejected - rejected // 2)
+
+
+def totals(stats):
+    return {
+        "requests": stats.requests,
+        "records_sent": stats.records_sent,
+        "records_accepted": stats.records_accepted,
+        "records_rejected": stats.records_rejected,
+        "bytes_sent": stats.bytes_sent,
+        "records_retried": stats.records_retried,
+        "records_dropped": stats.records_dropped,
+        "status_codes": dict(stats.status_codes),
+        "latency": stats.latency.summary(),
+        "service_time": stats.service_time.summary(),
+    }
+
+
+def test_deltas_merged_from_workers_match_a_single_run():
+    single = LoadStats()
+    parent = LoadStats()
+    workers = [LoadStats() for i in range(0, 3)]
+    for interval in range(0, 5):
+        for index, worker in enumerate(workers):
+            # Each worker's responses are also recorded, in the same order, by the single run
+            record_responses(worker, random.Random(interval * 10 + index), 200)
+            record_responses(single, random.Random(interval * 10 + index), 200)
+            # Deltas cross a process boundary, so they must survive pickling
+            parent.merge_delta(pickle.loads(pickle.dumps(worker.take_delta())))
+    assert totals(parent) == totals(single)
+    assert parent.latency.counts == single.latency.counts
+
+
+def test_take_delta_returns_only_what_is_new():
+    stats = LoadStats()
+    record_responses(stats, random.Random(7), 100)
+    first = stats.take_delta()
+    assert first["requests"] == 100
+    empty = stats.take_delta()
+    assert all(empty[name] == 0 for name in ("requests", "records_sent", "bytes_sent", "records_dropped"))
+    assert empty["status_codes"] == empty["latency"] == empty["service_time"] == {}
+    record_responses(stats, random.Random(8), 10)
+    second = stats.take_delta()
+    assert second["requests"] == 10
+    assert sum(second["latency"].values()) == 10
+    merged = LoadStats()
+    merged.merge_delta(first)
+    merged.merge_delta(empty)
+    merged.merge_delta(second)
+    assert totals(merged) == totals(stats)
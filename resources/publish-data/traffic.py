@@ -0,0 +1,262 @@
+######################################################################################################################
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this
+# software and associated documentation files (the "Software"), to deal in the Software
+# without restriction, including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so.
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+######################################################################################################################
+
+"""Traffic profiles: skewed keys, time-varying event mixes and bursts.
+
+A profile is a YAML (or JSON) file such as:
+
+    applications:
+      count: 20          # applications, including those given with --application-id
+      zipf: 1.2          # the application of rank k gets a share proportional to 1 / k^1.2
+    app_versions: {"1.0.0": 0.05, "1.1.0": 0.15, "1.2.0": 0.8}
+    pools:
+      items: {size: 1000, zipf: 1.1}   # item 1 is the viral item
+    rate: "0:1000,600:5000"            # as --ramp-profile
+    event_mix:                         # weights of the listed event types, from `at` seconds in
+      - {at: 0, weights: {login: 0.3}}
+      - {at: 600, weights: {login: 0.1, iap_transaction: 0.1}}
+    bursts:                            # the rate times `multiplier`, the extra events drawn from `weights`
+      - {at: 120, duration: 60, multiplier: 10, weights: {login: 1}}
+
+Every section is optional. Event mixes change the default weights of the event
+types they list, and are interpolated linearly between their `at` times, like
+rate profiles.
+"""
+
+import json
+import random
+import time
+
+from event_generator import EVENT_DATA_SPEC, EVENT_TYPE_WEIGHTS
+from scheduler import RateProfile
+from sender import ApplicationEvents
+
+try:
+    import yaml
+except ImportError:
+    yaml = None
+
+SECTIONS = {"applications", "app_versions", "pools", "rate", "event_mix", "bursts"}
+# Seconds over which a burst ramps up and down, so that rate profile points stay strictly ordered
+BURST_EDGE = 0.01
+
+
+def zipf_weights(count, exponent):
+    """Return Zipf weights for `count` ranked keys: rank k gets 1 / k^exponent."""
+
+    return [1 / rank**exponent for rank in range(1, count + 1)]
+
+
+def normalized(weights):
+    total = sum(weights.values())
+    if total <= 0:
+        raise ValueError(f"Event weights must add up to more than zero: {weights}")
+    return {event_type: weight / total for event_type, weight in weights.items()}
+
+
+def load_profile(path):
+    """Load a TrafficProfile from a .yaml/.yml or .json file."""
+
+    with open(path) as file:
+        if path.endswith((".yaml", ".yml")):
+            if yaml is None:
+                raise RuntimeError("YAML traffic profiles require PyYAML (pip install pyyaml)")
+            try:
+                spec = yaml.safe_load(file)
+            except yaml.YAMLError as e:
+                raise ValueError(str(e))
+        else:
+            spec = json.load(file)
+    try:
+        return TrafficProfile(spec or {})
+    except (KeyError, TypeError, AttributeError) as e:
+        raise ValueError(f"Malformed traffic profile section: {e!r}")
+
+
+class TrafficProfile:
+    """A parsed and validated traffic profile. See the module docstring for the format."""
+
+    def __init__(self, spec):
+        unknown = set(spec) - SECTIONS
+        if unknown:
+            raise ValueError(f"Unknown traffic profile sections {sorted(unknown)}, expected {sorted(SECTIONS)}")
+
+        applications = spec.get("applications") or {}
+        self.application_count = int(applications.get("count", 0))
+        self.application_zipf = float(applications.get("zipf", 0))
+
+        self.app_version_weights = dict(spec.get("app_versions") or {}) or None
+
+        self.pool_sizes = {}
+        self.pool_weights = {}
+        for name, pool in (spec.get("pools") or {}).items():
+            if "size" in pool:
+                self.pool_sizes[name] = int(pool["size"])
+            if "weights" in pool:
+                self.pool_weights[name] = [float(weight) for weight in pool["weights"]]
+            elif "zipf" in pool:
+                if "size" not in pool:
+                    raise ValueError(f"Zipf skew of pool {name} needs its size")
+                self.pool_weights[name] = zipf_weights(int(pool["size"]), float(pool["zipf"]))
+
+        rate = spec.get("rate")
+        if isinstance(rate, str):
+            self.rate = RateProfile.parse(rate)
+        elif rate is not None:
+            self.rate = RateProfile([(t, events_per_second) for t, events_per_second in rate])
+        else:
+            self.rate = None
+
+        self.event_mix = sorted(
+            [
+                (float(phase.get("at", 0)), normalized({**EVENT_TYPE_WEIGHTS, **phase.get("weights", {})}))
+                for phase in spec.get("event_mix") or []
+            ],
+            key=lambda phase: phase[0],
+        )
+        self.bursts = sorted(
+            [
+                (
+                    float(burst["at"]),
+                    float(burst["duration"]),
+                    float(burst.get("multiplier", 1)),
+                    normalized(burst["weights"]) if burst.get("weights") else None,
+                )
+                for burst in spec.get("bursts") or []
+            ],
+            key=lambda burst: burst[0],
+        )
+        for at, duration, multiplier, weights in self.bursts:
+            if duration <= 2 * BURST_EDGE or multiplier < 1:
+                raise ValueError("Bursts need a duration and a multiplier of at least 1")
+
+        unknown = set(self.event_types()) - set(EVENT_DATA_SPEC)
+        if unknown:
+            raise ValueError(f"Unknown event types in the traffic profile: {sorted(unknown)}")
+
+    def event_types(self):
+        """Return every event type the profile can generate, starting with the default types."""
+
+        event_types = dict.fromkeys(EVENT_TYPE_WEIGHTS)
+        for at, weights in self.event_mix:
+            event_types.update(dict.fromkeys(weights))
+        for at, duration, multiplier, weights in self.bursts:
+            event_types.update(dict.fromkeys(weights or {}))
+        return list(event_types)
+
+    def application_weights(self, count):
+        """Return the weights of `count` applications, ranked in the order given."""
+
+        if self.application_zipf:
+            return zipf_weights(count, self.application_zipf)
+        return None
+
+    def generator_options(self):
+        """Return the EventGenerator keyword arguments for the profile's keys and event types."""
+
+        return {
+            "event_weights": {event_type: EVENT_TYPE_WEIGHTS.get(event_type, 0.0) for event_type in self.event_types()},
+            "pool_sizes": self.pool_sizes,
+            "pool_weights": self.pool_weights,
+            "app_version_weights": self.app_version_weights,
+        }
+
+    def base_mix_at(self, elapsed):
+        if not self.event_mix:
+            return normalized(EVENT_TYPE_WEIGHTS)
+        previous_at, previous = self.event_mix[0]
+        if elapsed <= previous_at:
+            return previous
+        for at, weights in self.event_mix[1:]:
+            if elapsed <= at:
+                fraction = (elapsed - previous_at) / (at - previous_at)
+                return {
+                    event_type: previous.get(event_type, 0.0) * (1 - fraction) + weights.get(event_type, 0.0) * fraction
+                    for event_type in set(previous) | set(weights)
+                }
+            previous_at, previous = at, weights
+        return previous
+
+    def event_weights_at(self, elapsed):
+        """Return the event type mix `elapsed` seconds into the run.
+
+        During a burst with a multiplier m, the base mix makes up 1/m of the events
+        and the burst's own weights the rest.
+        """
+
+        weights = self.base_mix_at(elapsed)
+        for at, duration, multiplier, burst_weights in self.bursts:
+            if burst_weights and at <= elapsed < at + duration:
+                share = 1 - 1 / multiplier
+                weights = {
+                    event_type: weights.get(event_type, 0.0) * (1 - share) + burst_weights.get(event_type, 0.0) * share
+                    for event_type in set(weights) | set(burst_weights)
+                }
+        return weights
+
+    def rate_profile(self, base=None):
+        """Return `base` (by default the profile's own rate) with the profile's bursts applied, or None."""
+
+        base = base or self.rate
+        if base is None:
+            if any(multiplier > 1 for at, duration, multiplier, weights in self.bursts):
+                raise ValueError("Burst multipliers need a target rate: set one in the profile or with --events-per-second")
+            return None
+        times = {t for t, rate in base.points}
+        for at, duration, multiplier, weights in self.bursts:
+            times.update((at, at + BURST_EDGE, at + duration - BURST_EDGE, at + duration))
+        points = []
+        for t in sorted(times):
+            rate = base.rate_at(t)
+            for at, duration, multiplier, weights in self.bursts:
+                if at + BURST_EDGE <= t <= at + duration - BURST_EDGE:
+                    rate *= multiplier
+            points.append((t, rate))
+        return RateProfile(points)
+
+
+class ProfiledSource:
+    """Generates batches following a traffic profile, with an EventGenerator created for it.
+
+    The event mix follows the seconds elapsed since the source was created, and
+    each batch belongs to one of `application_ids`, drawn with the profile's skew.
+    """
+
+    def __init__(self, generator, profile, application_ids, seed=None):
+        self.generator = generator
+        self.profile = profile
+        self.application_ids = list(application_ids)
+        self.application_weights = profile.application_weights(len(self.application_ids))
+        self.random = random.Random(seed)
+        self.start = time.time()
+        self.weights = None
+
+    def generate_batch(self, count, now=None):
+        weights = self.profile.event_weights_at((time.time() if now is None else now) - self.start)
+        if weights != self.weights:
+            self.generator.set_event_weights(weights)
+            self.weights = weights
+        if self.application_weights:
+            application_id = self.random.choices(self.application_ids, self.application_weights)[0]
+        else:
+            application_id = self.random.choice(self.application_ids)
+        return ApplicationEvents(application_id, self.generator.generate_batch(count, now))
+
+    def batches(self, batch_size):
+        """Yield batches of `batch_size` events indefinitely."""
+
+        while True:
+            yield self.generate_batch(batch_size)
@@ -0,0 +1,91 @@
+######################################################################################################################
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this
+# software and associated documentation files (the "Software"), to deal in the Software
+# without restriction, including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so.
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+######################################################################################################################
+
+"""Multi-process load generation.
+
+A single publisher process is bound by the GIL, so `--workers N` runs N worker
+processes. Each worker records into its own LoadStats and periodically ships the
+delta since its last shipment to the parent over a queue; the parent merges the
+deltas into a single LoadStats that drives the rolling and final reports.
+"""
+
+import multiprocessing
+import queue
+import threading
+
+from stats import LoadStats
+
+
+def run_workers(target, worker_count, args, stats):
+    """Run `target(index, worker_stats, *args)` in `worker_count` processes, merging into `stats`.
+
+    `target` must be a picklable, module-level function. Returns once every worker
+    has finished; a Ctrl-C is forwarded to the workers, which stop and flush their
+    remaining stats.
+    """
+
+    context = multiprocessing.get_context("spawn")
+    messages = context.Queue()
+    processes = [
+        context.Process(
+            target=worker_entry,
+            args=(target, index, args, messages, stats.report_interval),
+            name=f"publisher-worker-{index}",
+        )
+        for index in range(0, worker_count)
+    ]
+    for process in processes:
+        process.start()
+
+    running = set(range(0, worker_count))
+    while running:
+        try:
+            kind, index, delta = messages.get(timeout=1)
+        except queue.Empty:
+            for index in list(running):
+                if processes[index].exitcode not in (None, 0):
+                    print(f"Worker {index} exited with code {processes[index].exitcode}")
+                    running.discard(index)
+            continue
+        except KeyboardInterrupt:
+            # Workers receive the same signal and report their final stats before exiting
+            continue
+        stats.merge_delta(delta)
+        if kind == "done":
+            running.discard(index)
+
+    for process in processes:
+        process.join()
+
+
+def worker_entry(target, index, args, messages, report_interval):
+    stats = LoadStats(report_interval)
+    stopped = threading.Event()
+
+    def ship_deltas():
+        while not stopped.wait(report_interval):
+            messages.put(("delta", index, stats.take_delta()))
+
+    shipper = threading.Thread(target=ship_deltas, name="stats-shipper", daemon=True)
+    shipper.start()
+    try:
+        target(index, stats, *args)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stopped.set()
+        shipper.join()
+        messages.put(("done", index, stats.take_delta()))